@@ -1,5 +1,13 @@
-from PSFEM.composite_spline import CompositeSpline, CompositeSplineSpace
-from PSFEM.finite_element_solver import solve
-from PSFEM.helper_functions import unit_square_uniform
+from PSFEM.composite_spline import CompositeSpline, CompositeSplineFunction, CompositeSplineSpace
+from PSFEM.assembly import MatrixFreeOperator, assemble_matrix, assemble_vector
+from PSFEM.error_estimation import biharmonic_indicators, doerfler_marking, element_errors, error_norm
+from PSFEM.export import write_vtu, write_xdmf
+from PSFEM.finite_element_solver import LinearProblem, solve
+from PSFEM.forms import Form, TestFunction, TrialFunction, grad, inner, lapl
+from PSFEM.helper_functions import graded_unit_square, l_shape_uniform, rectangle_uniform, unit_square_uniform
+from PSFEM.instrumentation import Profiler
+from PSFEM.linear_solvers import ConjugateGradientSolver, DirectSolver
 from PSFEM.mesh import Mesh
-from PSFEM.quadrature import midpoint_rule_ps12, midpoint_rule
+from PSFEM.storage import load_mesh, load_space, save_mesh, save_space
+from PSFEM.quadrature import midpoint_rule_ps12, midpoint_rule, TriangleQuadrature, midpoint, midpoint_ps12, \
+    seven_point, seven_point_ps12
@@ -0,0 +1,561 @@
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.sparse as sps
+import scipy.sparse.linalg as spla
+import tqdm
+from SSplines.helper_functions import determine_sub_triangle
+
+from PSFEM.forms import TEST, TRIAL, Form, Term
+from PSFEM.instrumentation import phase
+from PSFEM.quadrature import TriangleQuadrature, midpoint_rule_ps12, midpoint_rule_ps12_data
+from PSFEM.tabulation import ReferenceTabulation, affine_maps
+
+# number of triangles tabulated at once in vectorized assembly, bounding the memory of the
+# (n_triangles, n_points, 12, 12) integrand arrays. The chunks are fixed independently of the number
+# of processes, so that assembly gives bit-identical results for any nprocs.
+CHUNK_SIZE = 1024
+
+# state shared with worker processes during parallel assembly, see _initialize_worker.
+_worker_state = None
+
+
+class SparsityPattern(object):
+    """
+    The CSR sparsity pattern of the global matrix over a Composite C^1 function space, together with the position
+    of every local matrix entry in the CSR data array. Computed once, it turns global assembly into a single
+    weighted bincount over the element matrices.
+    """
+
+    def __init__(self, local_to_global, dimension):
+        """
+        :param np.ndarray local_to_global: (n_triangles, 12) local to global dof map
+        :param int dimension: number of global dofs
+        """
+
+        self.dimension = dimension
+        self.local_to_global = local_to_global
+
+        rows = np.repeat(local_to_global, 12, axis=1).ravel().astype(np.int64)
+        cols = np.tile(local_to_global, (1, 12)).ravel().astype(np.int64)
+
+        keys, self.positions = np.unique(rows * dimension + cols, return_inverse=True)
+        self.indices = keys % dimension
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(keys // dimension, minlength=dimension))])
+        self.nnz = len(keys)
+
+    def assemble_matrix(self, element_matrices):
+        """
+        Sums the element matrices into the global matrix.
+        :param np.ndarray element_matrices: (n_triangles, 12, 12) element matrices
+        :return: sps.csr_matrix
+        """
+
+        with phase('scatter'):
+            data = np.bincount(self.positions, weights=np.ravel(element_matrices), minlength=self.nnz)
+            return sps.csr_matrix((data, self.indices, self.indptr), shape=(self.dimension, self.dimension))
+
+    def assemble_vector(self, element_vectors):
+        """
+        Sums the element vectors into the global vector.
+        :param np.ndarray element_vectors: (n_triangles, 12) element vectors
+        :return: np.ndarray
+        """
+
+        with phase('scatter'):
+            return np.bincount(self.local_to_global.ravel(), weights=np.ravel(element_vectors),
+                               minlength=self.dimension)
+
+
+class DirichletReduction(object):
+    """
+    Sparse selection operators splitting the dofs of a space into interior and boundary dofs. Restricting a
+    global matrix and eliminating Dirichlet boundary values take a few sparse products, linear in the number
+    of non-zeros, and the operators are built once per space.
+    """
+
+    def __init__(self, dimension, interior_dofs, boundary_dofs):
+        """
+        :param int dimension: number of global dofs
+        :param np.ndarray interior_dofs: indices of interior dofs
+        :param np.ndarray boundary_dofs: indices of boundary dofs
+        """
+
+        self.dimension = dimension
+        self.interior_dofs = np.asarray(interior_dofs)
+        self.boundary_dofs = np.asarray(boundary_dofs)
+        self.interior = self._selection(self.interior_dofs)
+        self.boundary = self._selection(self.boundary_dofs)
+
+    def _selection(self, dofs):
+        # the (dimension, len(dofs)) matrix whose columns are the unit vectors of the given dofs
+        return sps.csr_matrix((np.ones(len(dofs)), (dofs, np.arange(len(dofs)))), shape=(self.dimension, len(dofs)))
+
+    def reduce_matrix(self, A):
+        """
+        Restricts a global matrix to the interior rows.
+        :param sps.spmatrix A: (dimension, dimension) global matrix
+        :return: interior block A_II and interior to boundary block A_IB, as sps.csr_matrix
+        """
+
+        with phase('boundary_reduction'):
+            A_I = self.interior.T @ A
+            return sps.csr_matrix(A_I @ self.interior), sps.csr_matrix(A_I @ self.boundary)
+
+    def reduce_vector(self, b, A_IB=None, boundary_values=None):
+        """
+        Restricts a global load vector to the interior dofs, moving the contribution of the boundary values to
+        the right hand side.
+        :param np.ndarray b: (dimension, ) global vector, or (dimension, k) array of k vectors
+        :param sps.spmatrix A_IB: interior to boundary block of the matrix, see reduce_matrix
+        :param np.ndarray boundary_values: (n_boundary, ) values of the boundary dofs, or (n_boundary, k)
+        :return: np.ndarray of interior values
+        """
+
+        with phase('boundary_reduction'):
+            b_I = self.interior.T @ b
+            if boundary_values is not None:
+                correction = A_IB @ np.asarray(boundary_values, dtype=float)
+                b_I = b_I - (correction if b_I.ndim == correction.ndim else correction[:, None])
+            return b_I
+
+    def expand(self, interior_values, boundary_values=None):
+        """
+        Combines the values of the interior and boundary dofs into a global vector.
+        :param np.ndarray interior_values: (n_interior, ) values, or (n_interior, k)
+        :param np.ndarray boundary_values: (n_boundary, ) values, or (n_boundary, k). Zero if None.
+        :return: np.ndarray of global values
+        """
+
+        c = self.interior @ interior_values
+        if boundary_values is not None:
+            boundary_values = np.asarray(boundary_values, dtype=float)
+            if boundary_values.ndim < c.ndim:
+                boundary_values = boundary_values[:, None]
+            c = c + self.boundary @ boundary_values
+        return c
+
+
+class MatrixFreeOperator(spla.LinearOperator):
+    """
+    The global matrix of a bilinear form over a Composite C^1 function space, applied without assembling it: the
+    coefficients are gathered to the triangles through the local to global map, multiplied by the element
+    matrices in batches, and scattered back with a weighted bincount. The element matrices are either computed
+    once and kept, or recomputed in chunks on every application, taking memory independent of the mesh size.
+    Kept element matrices of forms with constant coefficients are stored once per class of congruent triangles,
+    which on structured meshes takes next to no memory; otherwise they take about as much as the CSR matrix.
+
+    Rows and columns can be restricted to subsets of the dofs, such as V.interior_dofs, see restrict. The
+    operator can be passed to scipy.sparse.linalg solvers and to ConjugateGradientSolver, whose Jacobi
+    preconditioner uses the diagonal.
+    """
+
+    def __init__(self, a, V, integration_method=midpoint_rule_ps12, cache=True, rows=None, columns=None,
+                 element_matrices=None):
+        """
+        :param a: bilinear form, a PSFEM.forms.Form or a callable a(u, v) accepted by element_systems
+        :param V: Composite C^1 function space
+        :param integration_method: quadrature rule
+        :param bool cache: whether to keep the element matrices rather than recompute them on each application
+        :param np.ndarray rows: dofs of the rows, all dofs if None
+        :param np.ndarray columns: dofs of the columns, all dofs if None
+        :param np.ndarray element_matrices: (n_triangles, 12, 12) element matrices, computed if None and cached
+        """
+
+        self.a = a
+        self.V = V
+        self.integration_method = integration_method
+        self.rows = rows
+        self.columns = columns
+
+        # forms with constant coefficients only keep one element matrix per class of congruent triangles
+        self.class_matrices = None
+        if isinstance(a, Form):
+            a.validate(2)
+        if element_matrices is None and cache:
+            if isinstance(a, Form) and a.terms and not a.split()[1].terms:
+                self.class_matrices, _ = _constant_class_terms(a, V, integration_method)
+            else:
+                element_matrices, _ = assemble_element_systems(a, Form([]), V, integration_method, vectorized=True)
+        self.element_matrices = element_matrices
+
+        shape = (V.dimension if rows is None else len(rows), V.dimension if columns is None else len(columns))
+        super().__init__(np.float64, shape)
+
+    def restrict(self, rows=None, columns=None):
+        """
+        Restricts the operator over all dofs to the given rows and columns, sharing the element matrices.
+        :param np.ndarray rows: dofs of the rows, all dofs if None
+        :param np.ndarray columns: dofs of the columns, all dofs if None
+        :return: MatrixFreeOperator
+        """
+
+        operator = MatrixFreeOperator(self.a, self.V, self.integration_method, cache=False, rows=rows,
+                                      columns=columns, element_matrices=self.element_matrices)
+        operator.class_matrices = self.class_matrices
+        return operator
+
+    def _element_chunks(self):
+        # the element matrices in chunks of triangles, computed on the fly if not cached
+        n_triangles = len(self.V.mesh.triangles)
+        for start in range(0, n_triangles, CHUNK_SIZE):
+            triangles = np.arange(start, min(start + CHUNK_SIZE, n_triangles))
+            if self.class_matrices is not None:
+                yield triangles, expand_class_arrays(self.V, self.class_matrices, triangles)
+            elif self.element_matrices is not None:
+                yield triangles, self.element_matrices[start:start + CHUNK_SIZE]
+            else:
+                yield triangles, element_systems(self.a, Form([]), self.V, triangles, self.integration_method)[0]
+
+    def _matmat(self, X):
+        V = self.V
+        x = np.zeros((V.dimension, X.shape[1]))
+        if self.columns is None:
+            x[:] = X
+        else:
+            x[self.columns] = X
+
+        y = np.zeros_like(x)
+        for triangles, A in self._element_chunks():
+            dofs = V.local_to_global_array[triangles]
+            local = np.einsum('tij,tjk->tik', A, x[dofs])
+            for k in range(x.shape[1]):
+                y[:, k] += np.bincount(dofs.ravel(), weights=local[..., k].ravel(), minlength=V.dimension)
+
+        return y if self.rows is None else y[self.rows]
+
+    def _matvec(self, x):
+        return self._matmat(np.reshape(x, (-1, 1)))[:, 0]
+
+    def diagonal(self):
+        """
+        Computes the diagonal by summing the diagonals of the element matrices, for square restrictions.
+        :return: np.ndarray
+        """
+
+        if self.rows is not self.columns and not np.array_equal(self.rows, self.columns):
+            raise ValueError('The diagonal is only defined for operators with equal rows and columns')
+
+        diagonal = np.zeros(self.V.dimension)
+        for triangles, A in self._element_chunks():
+            diagonal += np.bincount(self.V.local_to_global_array[triangles].ravel(),
+                                    weights=np.diagonal(A, axis1=1, axis2=2).ravel(), minlength=self.V.dimension)
+
+        return diagonal if self.rows is None else diagonal[self.rows]
+
+
+def reference_quadrature(integration_method):
+    """
+    Returns the reference points and weights of the given integration method, for use in vectorized assembly.
+    :param integration_method: quadrature rule as passed to solve, either midpoint_rule_ps12 or a TriangleQuadrature
+    :return: barycentric coordinates, sub-triangles and weights relative to triangle area.
+    """
+
+    if integration_method is midpoint_rule_ps12:
+        return midpoint_rule_ps12_data()
+
+    if isinstance(integration_method, TriangleQuadrature):
+        k = integration_method.sub_triangles
+        if k is None:
+            k = determine_sub_triangle(integration_method.barycentric)
+        return integration_method.barycentric, k, integration_method.weights
+
+    raise ValueError('Vectorized assembly is not available for the integration method {}'.format(integration_method))
+
+
+@functools.lru_cache(maxsize=None)
+def quadrature_tabulation(integration_method):
+    """
+    Returns the reference tabulation of the basis at the points of the given integration method, shared by
+    all assembly calls using the method.
+    :param callable integration_method: quadrature rule as passed to solve
+    :return: ReferenceTabulation
+    """
+
+    b, k, _ = reference_quadrature(integration_method)
+    return ReferenceTabulation(b, k)
+
+
+def element_systems(a, L, V, triangles, integration_method=midpoint_rule_ps12):
+    """
+    Computes the element matrices and element load vectors of a batch of triangles at once.
+    The forms are evaluated a single time on arrays of tabulated basis functions: in a(u, v), u and v
+    hold the twelve local basis functions along the second to last and last axis respectively, so the
+    integrand evaluates to an (n_triangles, n_points, 12, 12) array. The points passed to the integrands
+    have their coordinates along the last axis, broadcastable against the basis arrays.
+
+    Forms given as PSFEM.forms.Form are instead integrated by contracting the tabulated basis functions.
+
+    :param a: bilinear form
+    :param L: linear form
+    :param V: Composite C^1 function space
+    :param np.ndarray triangles: indices of triangles
+    :param integration_method: quadrature rule
+    :return: element matrices (n, 12, 12) and element load vectors (n, 12)
+    """
+
+    _, _, w = reference_quadrature(integration_method)
+    triangles = np.asarray(triangles)
+    vertices = V.mesh.vertices[V.mesh.triangles[triangles]]
+
+    basis, points = quadrature_tabulation(integration_method).tabulate(vertices, V.local_signs[triangles])
+    _, areas = affine_maps(vertices)
+    weights = areas[:, None] * w[None, :]
+
+    n, q = weights.shape
+    if isinstance(a, Form):
+        A = a.element_arrays(basis, points, weights, 2)
+    else:
+        u, v = basis.expand(-1), basis.expand(-2)
+        integrand = np.broadcast_to(a(u, v)(points[:, :, None, None, :]), (n, q, 12, 12))
+        A = np.einsum('tq,tqij->tij', weights, integrand)
+
+    if isinstance(L, Form):
+        F = L.element_arrays(basis, points, weights, 1)
+    else:
+        integrand = np.broadcast_to(L(basis)(points[:, :, None, :]), (n, q, 12))
+        F = np.einsum('tq,tqi->ti', weights, integrand)
+
+    return A, F
+
+
+def pointwise_element_systems(a, L, V, triangles, integration_method=midpoint_rule_ps12):
+    """
+    Computes the element matrices and element load vectors of a batch of triangles, integrating the forms
+    separately for each pair of local basis functions.
+
+    :param a: bilinear form
+    :param L: linear form
+    :param V: Composite C^1 function space
+    :param np.ndarray triangles: indices of triangles
+    :param integration_method: quadrature rule
+    :return: element matrices (n, 12, 12) and element load vectors (n, 12)
+    """
+
+    A = np.zeros((len(triangles), 12, 12))
+    F = np.zeros((len(triangles), 12))
+
+    # empty forms, as used by assemble_matrix and assemble_vector, need not be integrated
+    integrate_a = not (isinstance(a, Form) and not a.terms)
+    integrate_L = not (isinstance(L, Form) and not L.terms)
+
+    for e, triangle in enumerate(triangles):
+        triangle_coords = V.mesh.vertices[V.mesh.triangles[triangle]]
+        local_basis = V.local_basis(triangle)
+
+        for j in range(12):
+            for i in range(j + 1 if integrate_a else 0):
+                I = integration_method(a(local_basis[i], local_basis[j]), triangle_coords)
+                A[e, i, j] = I
+                A[e, j, i] = I
+
+            if integrate_L:
+                F[e, j] = integration_method(L(local_basis[j]), triangle_coords)
+
+    return A, F
+
+
+def constant_class_arrays(V, operators, integration_method=midpoint_rule_ps12):
+    """
+    Returns the element arrays of the term with unit coefficient and the given operators, e.g. ('grad', 'grad')
+    for inner(grad(u), grad(v)), for one representative of each class of congruent triangles of V, see
+    CompositeSplineSpace.congruence_classes, and before the local signs are applied. The arrays are cached on V,
+    so forms sharing terms with constant coefficients only integrate them once per space, and once per shape.
+    :param V: Composite C^1 function space
+    :param tuple operators: operators of the trial and test function, or of the test function only
+    :param integration_method: quadrature rule
+    :return: element matrices (n_classes, 12, 12) or element vectors (n_classes, 12)
+    """
+
+    key = (operators, integration_method)
+    if key not in V._element_cache:
+        arguments = (TRIAL, TEST)[-len(operators):]
+        form = Form([Term(arguments=tuple(zip(arguments, operators)))])
+        rank = len(operators)
+
+        representatives, _ = V.congruence_classes()
+        _, _, w = reference_quadrature(integration_method)
+        tabulation = quadrature_tabulation(integration_method)
+
+        arrays = np.zeros((len(representatives),) + (12,) * rank)
+        for start in range(0, len(representatives), CHUNK_SIZE):
+            vertices = representatives[start:start + CHUNK_SIZE]
+            basis, points = tabulation.tabulate(vertices, np.ones((len(vertices), 12)))
+            _, areas = affine_maps(vertices)
+            arrays[start:start + CHUNK_SIZE] = form.element_arrays(basis, points, areas[:, None] * w[None, :], rank)
+
+        V._element_cache[key] = arrays
+
+    return V._element_cache[key]
+
+
+def expand_class_arrays(V, arrays, triangles=None):
+    """
+    Expands element arrays given per class of congruent triangles to the triangles, applying the local signs.
+    :param V: Composite C^1 function space
+    :param np.ndarray arrays: element matrices (n_classes, 12, 12) or element vectors (n_classes, 12)
+    :param np.ndarray triangles: indices of triangles, all triangles if None
+    :return: element matrices (n, 12, 12) or element vectors (n, 12)
+    """
+
+    _, classes = V.congruence_classes()
+    signs = V.local_signs
+    if triangles is not None:
+        classes, signs = classes[triangles], signs[triangles]
+
+    if arrays.ndim == 3:
+        return arrays[classes] * signs[:, :, None] * signs[:, None, :]
+    return arrays[classes] * signs
+
+
+def constant_element_arrays(V, operators, integration_method=midpoint_rule_ps12):
+    """
+    Returns the element arrays of the term with unit coefficient and the given operators over all triangles of V,
+    from those of the classes of congruent triangles, see constant_class_arrays.
+    :param V: Composite C^1 function space
+    :param tuple operators: operators of the trial and test function, or of the test function only
+    :param integration_method: quadrature rule
+    :return: element matrices (n_triangles, 12, 12) or element vectors (n_triangles, 12)
+    """
+
+    return expand_class_arrays(V, constant_class_arrays(V, operators, integration_method))
+
+
+def _constant_class_terms(form, V, integration_method):
+    # the sum of the cached class arrays of the terms with constant coefficients, and the remaining terms
+    constant, variable = form.split()
+    arrays = 0
+    for operators, scale in constant.items():
+        arrays = arrays + scale * constant_class_arrays(V, operators, integration_method)
+    return arrays, variable
+
+
+def _split_constant_terms(form, V, integration_method, shape):
+    # the element arrays of the terms with constant coefficients, and the remaining terms
+    arrays, variable = _constant_class_terms(form, V, integration_method)
+    if isinstance(arrays, np.ndarray):
+        return expand_class_arrays(V, arrays), variable
+    return np.zeros(shape), variable
+
+
+def _initialize_worker(*state):
+    global _worker_state
+    _worker_state = state
+
+
+def _compute_chunk(chunk):
+    a, L, V, integration_method, vectorized = _worker_state
+    compute = element_systems if vectorized else pointwise_element_systems
+    return compute(a, L, V, np.arange(*chunk), integration_method)
+
+
+def _worker_context():
+    # forking lets the workers inherit the forms, which are typically closures and cannot be pickled.
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+
+def assemble_element_systems(a, L, V, integration_method=midpoint_rule_ps12, vectorized=False, nprocs=1,
+                             verbose=False):
+    """
+    Computes the element matrices and element load vectors of all triangles in the mesh of V.
+    The triangles are split into fixed chunks, which are distributed over nprocs worker processes if nprocs > 1.
+    Every chunk is computed identically regardless of the process it is assigned to, and the results are
+    stored by triangle index, so the output does not depend on nprocs. The workers return dense element arrays,
+    which the parent process stores in full, rather than partial sums of the global matrix; the element arrays
+    are what the sparsity pattern of V assembles from, and they are kept by the caches of repeated assembly.
+    If both a and L are given as PSFEM.forms.Form, the assembly is always vectorized, and the element arrays
+    of terms with constant coefficients are taken from the cache of V, see constant_element_arrays.
+
+    :param a: bilinear form
+    :param L: linear form
+    :param V: Composite C^1 function space
+    :param integration_method: quadrature rule
+    :param vectorized: whether to use element_systems rather than pointwise_element_systems
+    :param nprocs: number of processes
+    :param verbose: whether to display a progress bar
+    :return: element matrices (n_triangles, 12, 12) and element load vectors (n_triangles, 12)
+    """
+
+    with phase('element_integration'):
+        return _integrate_elements(a, L, V, integration_method, vectorized, nprocs, verbose)
+
+
+def _integrate_elements(a, L, V, integration_method, vectorized, nprocs, verbose):
+    n_triangles = len(V.mesh.triangles)
+    A_constant, F_constant = 0, 0
+
+    # forms are always integrated by contracting tabulated basis functions, reusing cached constant terms
+    if isinstance(a, Form) and isinstance(L, Form):
+        a.validate(2)
+        L.validate(1)
+        vectorized = True
+        A_constant, a = _split_constant_terms(a, V, integration_method, (n_triangles, 12, 12))
+        F_constant, L = _split_constant_terms(L, V, integration_method, (n_triangles, 12))
+        if not a.terms and not L.terms:
+            return A_constant, F_constant
+
+    chunk_size = CHUNK_SIZE if vectorized else 1
+    chunks = [(start, min(start + chunk_size, n_triangles)) for start in range(0, n_triangles, chunk_size)]
+
+    A = np.zeros((n_triangles, 12, 12))
+    F = np.zeros((n_triangles, 12))
+    state = (a, L, V, integration_method, vectorized)
+
+    def store(results):
+        with tqdm.tqdm(total=len(chunks), disable=not verbose, desc='Global assembly') as progress:
+            for (start, stop), (A_chunk, F_chunk) in zip(chunks, results):
+                A[start:stop] = A_chunk
+                F[start:stop] = F_chunk
+                progress.update()
+
+    if nprocs > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=nprocs, mp_context=_worker_context(),
+                                 initializer=_initialize_worker, initargs=state) as executor:
+            # pointwise chunks hold a single triangle, so several are sent to a worker per round trip
+            store(executor.map(_compute_chunk, chunks, chunksize=len(chunks) // (4 * nprocs) + 1))
+    else:
+        _initialize_worker(*state)
+        try:
+            store(map(_compute_chunk, chunks))
+        finally:
+            _initialize_worker(None)
+
+    return A + A_constant, F + F_constant
+
+
+def assemble_matrix(a, V, integration_method=midpoint_rule_ps12, vectorized=False, nprocs=1, verbose=False):
+    """
+    Assembles the global matrix of a bilinear form over all dofs of V.
+    :param a: bilinear form
+    :param V: Composite C^1 function space
+    :param integration_method: quadrature rule
+    :param vectorized: whether to use element_systems rather than pointwise_element_systems
+    :param nprocs: number of processes
+    :param verbose: whether to display a progress bar
+    :return: sps.csr_matrix
+    """
+
+    A_local, _ = assemble_element_systems(a, Form([]), V, integration_method, vectorized=vectorized, nprocs=nprocs,
+                                          verbose=verbose)
+    return V.sparsity_pattern().assemble_matrix(A_local)
+
+
+def assemble_vector(L, V, integration_method=midpoint_rule_ps12, vectorized=False, nprocs=1, verbose=False):
+    """
+    Assembles the global load vector of a linear form over all dofs of V.
+    :param L: linear form
+    :param V: Composite C^1 function space
+    :param integration_method: quadrature rule
+    :param vectorized: whether to use element_systems rather than pointwise_element_systems
+    :param nprocs: number of processes
+    :param verbose: whether to display a progress bar
+    :return: np.ndarray
+    """
+
+    _, F_local = assemble_element_systems(Form([]), L, V, integration_method, vectorized=vectorized, nprocs=nprocs,
+                                          verbose=verbose)
+    return V.sparsity_pattern().assemble_vector(F_local)
@@ -1,7 +1,15 @@
+from collections import OrderedDict
+from collections.abc import Sequence
+
 import numpy as np
-from SSplines import SplineSpace
+import scipy.sparse as sps
+from SSplines import SplineFunction, SplineSpace
+from SSplines.helper_functions import determine_sub_triangle
 
-from PSFEM.helper_functions import local_to_global
+from PSFEM.assembly import DirichletReduction, SparsityPattern
+from PSFEM.helper_functions import dof_numbering, dof_reordering
+from PSFEM.instrumentation import phase
+from PSFEM.tabulation import affine_maps, congruence_classes, hermite_coefficients, reference_tabulation
 
 
 class CompositeSpline(object):
@@ -55,23 +63,290 @@ class CompositeSpline(object):
             return np.zeros(len(x))
 
 
+class CompositeSplineFunction(object):
+    """
+    A function in a Composite C^1 spline space, represented by its global coefficient vector.
+    Evaluation on a triangle gathers the local coefficients through the local to global map and
+    evaluates a single local spline, rather than summing scaled basis functions.
+    """
+
+    def __init__(self, space, coefficients):
+        """
+        :param CompositeSplineSpace space: the space the function belongs to
+        :param np.ndarray coefficients: coefficients with respect to the global basis
+        """
+
+        self.space = space
+        self.coefficients = np.asarray(coefficients, dtype=float)
+
+    def local_coefficients(self, k):
+        """
+        Returns the coefficients of the function with respect to the local Hermite basis on triangle k.
+        :param int k: triangle index
+        :return: np.ndarray
+        """
+
+        return self.coefficients[self.space.local_to_global_array[k]] * self.space.local_signs[k]
+
+    def local_function(self, k):
+        """
+        Returns the restriction of the function to triangle k.
+        :param int k: triangle index
+        :return: SplineFunction
+        """
+
+        triangle = self.space.mesh.vertices[self.space.mesh.triangles[k]]
+        coefficients = np.dot(hermite_coefficients(triangle[None])[0], self.local_coefficients(k))
+        return SplineFunction(triangle, 2, coefficients)
+
+    def __call__(self, x, k):
+        return self.local_function(k)(x)
+
+    def lapl(self, x, k):
+        return self.local_function(k).lapl(x)
+
+    def _evaluate(self, points, triangle_ids, derivative):
+        """
+        Evaluates the function, its gradient or its laplacian at points spread over any number of triangles.
+        Per-triangle data is computed once for each distinct triangle, and all points are then evaluated
+        together through the polynomial pieces of the reference S-splines.
+        :param np.ndarray points: (n, 2) points
+        :param triangle_ids: triangle of each point, located in the mesh if None
+        :param int derivative: 0 for values, 1 for gradients and 2 for laplacians
+        :return: (n, ) or (n, 2) array, nan at points outside the mesh.
+        """
+
+        mesh = self.space.mesh
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        if triangle_ids is None:
+            triangle_ids = mesh.find_triangles(points)
+        triangle_ids = np.broadcast_to(triangle_ids, len(points))
+
+        result = np.full((len(points), 2) if derivative == 1 else len(points), np.nan)
+        inside = triangle_ids >= 0
+        if not np.any(inside):
+            return result
+
+        # per-triangle data, for each distinct triangle
+        triangles, inverse = np.unique(triangle_ids[inside], return_inverse=True)
+        vertices = mesh.vertices[mesh.triangles[triangles]]
+        S = np.einsum('tij,tj->ti', hermite_coefficients(vertices), self.local_coefficients(triangles))[inverse]
+
+        b = mesh.bucket_index().barycentric_coordinates(triangle_ids[inside], points[inside])
+        phi, dphi, ddphi = reference_tabulation(b, determine_sub_triangle(b))
+
+        if derivative == 0:
+            result[inside] = np.einsum('ni,ni->n', phi, S)
+        else:
+            K = affine_maps(vertices)[0][inverse]
+            if derivative == 1:
+                result[inside] = np.einsum('ned,nei,ni->nd', K, dphi, S)
+            else:
+                result[inside] = np.einsum('ned,nfd,nefi,ni->n', K, K, ddphi, S)
+
+        return result
+
+    def evaluate(self, points, triangle_ids=None):
+        """
+        Evaluates the function at a set of points.
+        :param np.ndarray points: (n, 2) points
+        :param triangle_ids: triangle containing each point, located in the mesh if None
+        :return: (n, ) values, nan at points outside the mesh
+        """
+
+        return self._evaluate(points, triangle_ids, 0)
+
+    def gradient(self, points, triangle_ids=None):
+        """
+        Evaluates the gradient of the function at a set of points.
+        :param np.ndarray points: (n, 2) points
+        :param triangle_ids: triangle containing each point, located in the mesh if None
+        :return: (n, 2) gradients, nan at points outside the mesh
+        """
+
+        return self._evaluate(points, triangle_ids, 1)
+
+    def laplacian(self, points, triangle_ids=None):
+        """
+        Evaluates the laplacian of the function at a set of points.
+        :param np.ndarray points: (n, 2) points
+        :param triangle_ids: triangle containing each point, located in the mesh if None
+        :return: (n, ) laplacians, nan at points outside the mesh
+        """
+
+        return self._evaluate(points, triangle_ids, 2)
+
+    def __mul__(self, scalar):
+        return CompositeSplineFunction(self.space, self.coefficients * scalar)
+
+    def __rmul__(self, scalar):
+        return self.__mul__(scalar)
+
+    def __add__(self, other):
+        return CompositeSplineFunction(self.space, self.coefficients + other.coefficients)
+
+    def __radd__(self, other):
+        if other == 0:
+            return self
+        else:
+            return self.__add__(other)
+
+
+class LazyBasis(Sequence):
+    """
+    Sequence of the global basis functions of a CompositeSplineSpace, where each basis function is constructed on
+    first access. At most maxsize basis functions are kept, the least recently used being discarded first.
+    """
+
+    def __init__(self, space, maxsize=1024):
+        self.space = space
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return self.space.dimension
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('basis function index out of range')
+
+        if i in self._cache:
+            self._cache.move_to_end(i)
+        else:
+            self._cache[i] = self.space._construct_global_basis_function(i)
+            if len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return self._cache[i]
+
+
 class CompositeSplineSpace(object):
 
-    def __init__(self, mesh):
+    # the arrays describing the dofs, see PSFEM.storage
+    DOFS = ('local_to_global_array', 'dof_to_vertex', 'dof_to_edge', 'dof_triangle_offsets', 'dof_triangles',
+            'dof_local_indices', 'interior_dofs', 'boundary_dofs', 'local_signs')
+
+    def __init__(self, mesh, lazy=False, numbering='blocked', dofs=None, reordering=None):
         """
         Initializes a Composite C^1 spline space over the given mesh.
         :param mesh:
+        :param lazy: whether to construct global basis functions, local spline bases and the dictionary forms of the
+        dof maps on first access only.
+        :param numbering: dof numbering, 'blocked' or 'legacy', see helper_functions.dof_numbering.
+        :param dict dofs: optional precomputed dof arrays, mapping each name in CompositeSplineSpace.DOFS to its
+        array, as loaded by PSFEM.storage.load_space
+        :param reordering: None, or 'rcm' to permute the numbered dofs by helper_functions.dof_reordering. The
+        permutation is kept as dof_permutation, see original_coefficients.
         """
 
         self.mesh = mesh
+        self.lazy = lazy
+        self.numbering = numbering
+        self.reordering = reordering
+        self.dof_permutation = None
         self.dimension = 3*len(mesh.vertices) + len(mesh.edges)
-        self.local_to_global_map, self.dof_to_edge_map, self.dof_to_vertex_map = local_to_global(mesh.vertices, mesh.triangles)
-        self.local_spline_spaces = [SplineSpace(mesh.vertices[triangle], degree=2) for triangle in mesh.triangles]
-        self.local_spline_bases = [S.hermite_basis() for S in self.local_spline_spaces]
-        self._construct_basis_to_triangle_map()
-        self._construct_global_to_local_map()
-        self._construct_interior_and_boundary_dofs()
-        self.basis = [self._construct_global_basis_function(i) for i in range(self.dimension)]
+        self._sparsity_pattern = None
+        self._dirichlet_reduction = None
+        self._congruence_classes = None
+        self._element_cache = {}
+        self._local_to_global_map = None
+        self._dof_to_edge_map = None
+        self._dof_to_vertex_map = None
+        self._global_to_local_map = None
+        self._basis_to_triangle_map = None
+
+        if dofs is not None:
+            for name in self.DOFS:
+                setattr(self, name, dofs[name])
+            self.dof_permutation = dofs.get('dof_permutation')
+        else:
+            with phase('dof_numbering'):
+                self.local_to_global_array, self.dof_to_vertex, self.dof_to_edge = dof_numbering(
+                    mesh.triangles, mesh.triangle_edges, len(mesh.vertices), len(mesh.edge_vertices),
+                    numbering=numbering)
+                if reordering is not None:
+                    self._reorder_dofs(reordering)
+                self._construct_dof_to_triangle_arrays()
+                self._construct_interior_and_boundary_dofs()
+                self._construct_local_signs()
+
+        if lazy:
+            self.local_spline_spaces = None
+            self.local_spline_bases = None
+            self.basis = LazyBasis(self)
+        else:
+            with phase('basis_construction'):
+                self.local_spline_spaces = [SplineSpace(mesh.vertices[triangle], degree=2)
+                                            for triangle in mesh.triangles]
+
+                # Hermite bases from the batched Hermite coefficients, computed once for all triangles
+                local_coefficients = hermite_coefficients(mesh.vertices[mesh.triangles])
+                self.local_spline_bases = [[S.function(c) for c in C.T]
+                                           for S, C in zip(self.local_spline_spaces, local_coefficients)]
+                self._construct_dof_maps()
+                self._construct_basis_to_triangle_map()
+                self._construct_global_to_local_map()
+                self.basis = [self._construct_global_basis_function(i) for i in range(self.dimension)]
+
+    def _reorder_dofs(self, method):
+        """
+        Permutes the numbered dofs, see helper_functions.dof_reordering.
+        """
+
+        permutation = dof_reordering(self.local_to_global_array, self.dimension, method)
+        new_index = np.empty_like(permutation)
+        new_index[permutation] = np.arange(self.dimension)
+
+        self.local_to_global_array = new_index[self.local_to_global_array]
+        self.dof_to_vertex = self.dof_to_vertex[permutation]
+        self.dof_to_edge = self.dof_to_edge[permutation]
+        self.dof_permutation = permutation
+
+    def original_coefficients(self, coefficients):
+        """
+        Maps coefficients in the basis of this space to the basis numbered without reordering the dofs.
+        :param np.ndarray coefficients: (dimension, ) or (dimension, k) coefficients
+        :return: np.ndarray of the same shape
+        """
+
+        if self.dof_permutation is None:
+            return coefficients
+
+        original = np.empty_like(coefficients)
+        original[self.dof_permutation] = coefficients
+        return original
+
+    def _construct_dof_to_triangle_arrays(self):
+        """
+        Constructs CSR-style arrays mapping each dof to the triangles in its support, in increasing order, and
+        to its local index on each of them: the triangles supporting dof i are
+        dof_triangles[dof_triangle_offsets[i]:dof_triangle_offsets[i + 1]], with local indices dof_local_indices
+        over the same range.
+        """
+
+        dofs = self.local_to_global_array.ravel()
+        order = np.argsort(dofs, kind='stable')
+
+        self.dof_triangle_offsets = np.concatenate([[0], np.cumsum(np.bincount(dofs, minlength=self.dimension))])
+        self.dof_triangles = order // 12
+        self.dof_local_indices = order % 12
+
+    def _construct_dof_maps(self):
+        """
+        Constructs the dictionary forms of the local to global map, and of the maps from dof to edge and dof to vertex.
+        """
+
+        self._local_to_global_map = dict(enumerate(self.local_to_global_array.tolist()))
+
+        edge_dofs = np.flatnonzero(self.dof_to_edge >= 0)
+        edges = self.mesh.edge_vertices[self.dof_to_edge[edge_dofs]]
+        self._dof_to_edge_map = dict(zip(edge_dofs.tolist(), map(tuple, edges.tolist())))
+
+        vertex_dofs = np.flatnonzero(self.dof_to_vertex >= 0)
+        self._dof_to_vertex_map = dict(zip(vertex_dofs.tolist(), self.dof_to_vertex[vertex_dofs].tolist()))
 
     def _construct_global_to_local_map(self):
         """
@@ -81,74 +356,295 @@ class CompositeSplineSpace(object):
         """
 
         global_to_local_map = {}
+        offsets = self.dof_triangle_offsets
 
         for dof in range(self.dimension):
-            triangles_of_support = self.basis_to_triangle_map[dof]
-            global_to_local_map[dof] = {triangle: self.local_to_global_map[triangle].index(dof) for triangle in triangles_of_support}
+            triangles = self.dof_triangles[offsets[dof]:offsets[dof + 1]].tolist()
+            local_indices = self.dof_local_indices[offsets[dof]:offsets[dof + 1]].tolist()
+            global_to_local_map[dof] = dict(zip(triangles, local_indices))
 
-        self.global_to_local_map = global_to_local_map
+        self._global_to_local_map = global_to_local_map
 
     def _construct_basis_to_triangle_map(self):
 
-        basis_to_triangle = {}
+        offsets = self.dof_triangle_offsets
+        self._basis_to_triangle_map = {dof: self.dof_triangles[offsets[dof]:offsets[dof + 1]].tolist()
+                                       for dof in range(self.dimension)}
 
-        for dof in range(self.dimension):
-            # if dof is an edge dof
-            if dof in self.dof_to_edge_map.keys():
-                edge_vertices = self.dof_to_edge_map[dof]
-                edge_index = self.mesh.edge_indices[edge_vertices]
-                basis_to_triangle[dof] = self.mesh.adjacent_triangles(edge_index)
-            # otherwise, its a vertex dof
-            else:
-                vertex_index = self.dof_to_vertex_map[dof]
-                basis_to_triangle[dof] = self.mesh.incident_triangles(vertex_index)
+    @property
+    def local_to_global_map(self):
+        """
+        Dictionary form of local_to_global_array, mapping each triangle to the list of its twelve dofs.
+        Constructed on first access for lazy spaces.
+        """
+
+        if self._local_to_global_map is None:
+            self._construct_dof_maps()
+        return self._local_to_global_map
+
+    @property
+    def dof_to_edge_map(self):
+        """
+        Dictionary mapping each edge dof to the vertex pair of its edge. Constructed on first access for lazy spaces.
+        """
+
+        if self._dof_to_edge_map is None:
+            self._construct_dof_maps()
+        return self._dof_to_edge_map
 
-        self.basis_to_triangle_map = basis_to_triangle
+    @property
+    def dof_to_vertex_map(self):
+        """
+        Dictionary mapping each vertex dof to its vertex. Constructed on first access for lazy spaces.
+        """
+
+        if self._dof_to_vertex_map is None:
+            self._construct_dof_maps()
+        return self._dof_to_vertex_map
+
+    @property
+    def global_to_local_map(self):
+        """
+        Dictionary mapping each dof to a dictionary from the triangles in its support to its local index there,
+        see also dof_triangles and dof_local_indices. Constructed on first access for lazy spaces.
+        """
+
+        if self._global_to_local_map is None:
+            self._construct_global_to_local_map()
+        return self._global_to_local_map
+
+    @property
+    def basis_to_triangle_map(self):
+        """
+        Dictionary mapping each dof to the list of triangles in its support. Constructed on first access for lazy
+        spaces.
+        """
+
+        if self._basis_to_triangle_map is None:
+            self._construct_basis_to_triangle_map()
+        return self._basis_to_triangle_map
+
+    def local_basis(self, k):
+        """
+        Returns the Hermite basis on triangle k, with signs matching the global basis, so that local basis
+        function j is the restriction of global basis function local_to_global_array[k, j] to triangle k.
+        :param int k: triangle index
+        :return: list of twelve SplineFunctions
+        """
+
+        return [b * -1 if sign < 0 else b for b, sign in zip(self._hermite_basis(k), self.local_signs[k])]
+
+    def _hermite_basis(self, k):
+        """
+        Returns the Hermite basis on triangle k, constructing it if the local bases are not stored.
+        :param int k: triangle index
+        :return: list of twelve SplineFunctions
+        """
+
+        if self.local_spline_bases is not None:
+            return self.local_spline_bases[k]
+
+        triangle = self.mesh.vertices[self.mesh.triangles[k]]
+        S = SplineSpace(triangle, degree=2)
+        return [S.function(c) for c in hermite_coefficients(triangle[None])[0].T]
 
     def _construct_global_basis_function(self, i):
 
-        triangles_with_support = self.basis_to_triangle_map[i]
+        start, stop = self.dof_triangle_offsets[i:i + 2]
+        triangles_with_support = self.dof_triangles[start:stop].tolist()
+        local_indices = self.dof_local_indices[start:stop].tolist()
+
         local_representation = {}
-        for triangle in triangles_with_support:
-            s = self.local_spline_spaces[triangle]
-            b = s.hermite_basis()[self.global_to_local_map[i][triangle]]
-            local_representation[triangle] = b
+        for triangle, j in zip(triangles_with_support, local_indices):
+            b = self._hermite_basis(triangle)[j]
 
-        # if dof is an interior edge dof, we flip the sign on one of the two triangles
-        # to enforce C^1 smoothness across the edge.
-        if i in self.dof_to_edge_map.keys():
-            edge_vertex = self.dof_to_edge_map[i]
-            edge_idx = self.mesh.edge_indices[edge_vertex]
-            if edge_idx in self.mesh.int_edges:
-                local_representation[triangles_with_support[1]] *= -1
+            # if dof is an interior edge dof, we flip the sign on one of the two triangles
+            # to enforce C^1 smoothness across the edge.
+            if self.local_signs[triangle, j] < 0:
+                b = b * -1
+            local_representation[triangle] = b
 
         return CompositeSpline(local_representation, triangles_with_support)
 
+    def _construct_local_signs(self):
+        """
+        Constructs an (n_triangles, 12) array relating the local Hermite basis on each triangle to the global basis.
+        The normal derivative basis function of an interior edge has its sign flipped on the second triangle
+        sharing the edge.
+        """
+
+        local_signs = np.ones((len(self.mesh.triangles), 12))
+
+        # the normal derivative dofs sit at local indices 3, 7 and 11; an edge dof supported on two triangles
+        # lies on an interior edge.
+        edge_dofs = self.local_to_global_array[:, 3::4]
+        start, stop = self.dof_triangle_offsets[edge_dofs], self.dof_triangle_offsets[edge_dofs + 1]
+        second = np.where(stop - start == 2, self.dof_triangles[np.minimum(start + 1, stop - 1)], -1)
+        flipped = second == np.arange(len(local_signs))[:, None]
+
+        local_signs[:, 3::4][flipped] = -1
+
+        self.local_signs = local_signs
+
     def _construct_interior_and_boundary_dofs(self):
-        interior_dofs = []
-        boundary_dofs = []
+        """
+        Splits the dofs into interior dofs and boundary dofs, the latter being the dofs of boundary vertices and
+        boundary edges.
+        """
 
-        for dof in self.dof_to_edge_map.keys():
-            if self.dof_to_edge_map[dof] in self.mesh.bnd_edges:
-                boundary_dofs.append(dof)
-            else:
-                interior_dofs.append(dof)
+        mesh = self.mesh
+        triangles = np.asarray(mesh.triangles)
 
-        for dof in self.dof_to_vertex_map.keys():
-            if self.dof_to_vertex_map[dof] in self.mesh.bnd_vertices:
-                boundary_dofs.append(dof)
-            else:
-                interior_dofs.append(dof)
+        # local indices 4i, 4i + 1, 4i + 2 belong to vertex i and local index 4i + 3 to the edge from vertex i
+        on_boundary = np.repeat(mesh.is_boundary_vertex[triangles], 4, axis=1)
+        on_boundary[:, 3::4] = mesh.is_boundary_edge[mesh.triangle_edges]
+
+        is_boundary_dof = np.zeros(self.dimension, dtype=bool)
+        is_boundary_dof[self.local_to_global_array[on_boundary]] = True
+
+        self.interior_dofs = np.flatnonzero(~is_boundary_dof)
+        self.boundary_dofs = np.flatnonzero(is_boundary_dof)
+
+    def sparsity_pattern(self):
+        """
+        Returns the sparsity pattern of global matrices over this space, computing it on first use.
+        :return: SparsityPattern
+        """
+
+        if self._sparsity_pattern is None:
+            with phase('sparsity_pattern'):
+                self._sparsity_pattern = SparsityPattern(self.local_to_global_array, self.dimension)
+        return self._sparsity_pattern
+
+    def dirichlet_reduction(self):
+        """
+        Returns the operator restricting global systems over this space to the interior dofs, computing it on
+        first use.
+        :return: DirichletReduction
+        """
+
+        if self._dirichlet_reduction is None:
+            with phase('boundary_reduction'):
+                self._dirichlet_reduction = DirichletReduction(self.dimension, self.interior_dofs,
+                                                               self.boundary_dofs)
+        return self._dirichlet_reduction
+
+    def congruence_classes(self):
+        """
+        Returns the classes of triangles of the mesh that are translates of each other, computing them on first
+        use, see tabulation.congruence_classes.
+        :return: (n_classes, 3, 2) representative triangles and the (n_triangles, ) class of each triangle
+        """
+
+        if self._congruence_classes is None:
+            self._congruence_classes = congruence_classes(self.mesh.vertices[self.mesh.triangles])
+        return self._congruence_classes
+
+    def clear_caches(self):
+        """
+        Discards the quantities computed on first use and the cached element arrays of constant coefficient terms,
+        so that they are recomputed, for instance when timing assembly.
+        """
 
-        self.interior_dofs = sorted(interior_dofs)
-        self.boundary_dofs = sorted(boundary_dofs)
+        self._sparsity_pattern = None
+        self._dirichlet_reduction = None
+        self._congruence_classes = None
+        self._element_cache.clear()
 
     def function(self, coefficients):
         """
-        Returns a callable CompositeSpline function.
-        :param coefficients:
-        :return:
+        Returns a callable function with the given coefficients in the global basis.
+        :param np.ndarray coefficients: coefficients
+        :return: CompositeSplineFunction
         """
-        return sum([c*b for c, b in zip(coefficients, self.basis)])
+        return CompositeSplineFunction(self, coefficients)
+
+    def dof_functionals(self):
+        """
+        Describes the dofs of the global basis as functionals of the form f -> w_0 f(x) + w_1 f_x(x) + w_2 f_y(x):
+        the value and gradient at each vertex, and at each edge midpoint the derivative along the normal pointing
+        to the left of the edge, as traversed by the lowest numbered triangle containing it.
+        :return: (dimension, 2) points x and (dimension, 3) weights w
+        """
+
+        vertices = self.mesh.vertices
+        triangles = np.asarray(self.mesh.triangles)
+        points = np.zeros((self.dimension, 2))
+        weights = np.zeros((self.dimension, 3))
+
+        # vertex dofs, in the order value, x-derivative, y-derivative
+        for i in range(3):
+            for j in range(3):
+                dofs = self.local_to_global_array[:, 4 * i + j]
+                points[dofs] = vertices[triangles[:, i]]
+                weights[dofs, j] = 1
+
+        # edge dofs, from the first triangle containing each edge, on which the local sign is positive
+        edge_dofs = np.flatnonzero(self.dof_to_edge >= 0)
+        first = self.dof_triangle_offsets[edge_dofs]
+        k, j = self.dof_triangles[first], self.dof_local_indices[first] // 4
+        a, b = vertices[triangles[k, j]], vertices[triangles[k, (j + 1) % 3]]
+        points[edge_dofs] = (a + b) / 2
+        weights[edge_dofs, 1:] = np.stack([a[:, 1] - b[:, 1], b[:, 0] - a[:, 0]], axis=1) / \
+            np.linalg.norm(b - a, axis=1)[:, None]
+
+        return points, weights
+
+    def hermite_dofs(self, f, gradient):
+        """
+        Evaluates the dofs of the global basis for a function with known gradient, see dof_functionals.
+        :param callable f: function mapping (n, 2) points to (n, ) values
+        :param callable gradient: function mapping (n, 2) points to (n, 2) gradients
+        :return: np.ndarray of dimension coefficients
+        """
+
+        points, weights = self.dof_functionals()
+        return weights[:, 0] * f(points) + np.einsum('nd,nd->n', weights[:, 1:], gradient(points))
+
+    def prolongation(self, fine):
+        """
+        Returns the matrix mapping coefficients in this space to the coefficients of the Hermite interpolant in a
+        space over a finer mesh, such as one obtained by Mesh.refine. Uniform refinement gives nested spaces, on
+        which the prolongation is exact. Otherwise the spaces are not nested and only quadratic polynomials are
+        reproduced exactly, but the interpolated coarse solution still makes a good initial guess for iterative
+        solvers on the fine mesh.
+        :param CompositeSplineSpace fine: space over a mesh covering the same domain
+        :return: sps.csr_matrix of shape (fine.dimension, dimension)
+        """
+
+        mesh = self.mesh
+        points, weights = fine.dof_functionals()
+
+        # each dof lies in the closure of its first fine triangle, and so in the parent of that triangle
+        if fine.mesh.parent is mesh:
+            triangle_ids = fine.mesh.parent_triangles[fine.dof_triangles[fine.dof_triangle_offsets[:-1]]]
+        else:
+            triangle_ids = mesh.find_triangles(points)
+            if np.any(triangle_ids < 0):
+                raise ValueError('The fine mesh is not covered by the coarse mesh')
+
+        # values and gradients of the local basis functions of the coarse triangles
+        vertices = mesh.vertices[mesh.triangles[triangle_ids]]
+        C = hermite_coefficients(vertices) * self.local_signs[triangle_ids][:, None, :]
+        b = mesh.bucket_index().barycentric_coordinates(triangle_ids, points)
+        phi, dphi, _ = reference_tabulation(b, determine_sub_triangle(b))
+        K = affine_maps(vertices)[0]
+
+        entries = np.einsum('n,ni,nij->nj', weights[:, 0], phi, C) + \
+            np.einsum('nd,ned,nei,nij->nj', weights[:, 1:], K, dphi, C)
+
+        return sps.csr_matrix((entries.ravel(), (np.repeat(np.arange(fine.dimension), 12),
+                                                 self.local_to_global_array[triangle_ids].ravel())),
+                              shape=(fine.dimension, self.dimension))
+
+    def interpolate(self, f, gradient):
+        """
+        Returns the Hermite interpolant of a function with known gradient, see hermite_dofs.
+        :param callable f: function mapping (n, 2) points to (n, ) values
+        :param callable gradient: function mapping (n, 2) points to (n, 2) gradients
+        :return: CompositeSplineFunction
+        """
+
+        return self.function(self.hermite_dofs(f, gradient))
 
 
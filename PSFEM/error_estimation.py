@@ -0,0 +1,168 @@
+import functools
+
+import numpy as np
+from SSplines import sub_triangles
+
+from PSFEM.assembly import CHUNK_SIZE, quadrature_tabulation, reference_quadrature
+from PSFEM.quadrature import seven_point_ps12
+from PSFEM.tabulation import affine_maps, hermite_coefficients, reference_tabulation
+
+
+def _chunks(n):
+    for start in range(0, n, CHUNK_SIZE):
+        yield np.arange(start, min(start + CHUNK_SIZE, n))
+
+
+@functools.lru_cache(maxsize=None)
+def _split_edges():
+    """
+    The edges shared by two sub-triangles of the PS12-split, in barycentric coordinates.
+    :return: the two sub-triangles (m, 2) and the barycentric end points (m, 2, 3) of each edge
+    """
+
+    triangles = np.asarray(sub_triangles(np.eye(3)), dtype=float)
+    keys = {}
+    for k, triangle in enumerate(triangles):
+        for i in range(3):
+            ends = (triangle[i], triangle[(i + 1) % 3])
+            key = tuple(sorted(tuple(np.round(end, 12)) for end in ends))
+            keys.setdefault(key, []).append((k, ends))
+
+    shared = [pair for pair in keys.values() if len(pair) == 2]
+    return np.array([[k for k, _ in pair] for pair in shared]), np.array([pair[0][1] for pair in shared])
+
+
+def _evaluate(f, points):
+    # evaluates a callable of (n_points, 2) arrays on an (n, q, 2) array of points
+    values = np.asarray(f(points.reshape(-1, 2)), dtype=float)
+    return values.reshape(points.shape[:2] + values.shape[1:])
+
+
+def element_errors(u, f=None, gradient=None, laplacian=None, integration_method=seven_point_ps12):
+    """
+    Computes the squared error of a function against an exact solution on each triangle,
+        int_T (u - f)^2 + |grad u - gradient|^2 + (lapl u - laplacian)^2,
+    leaving out the terms whose exact counterpart is not given. The function is evaluated through the polynomial
+    pieces of the reference S-splines at the quadrature points of batches of triangles at once.
+    :param CompositeSplineFunction u: approximate solution
+    :param callable f: exact solution, mapping (n, 2) points to (n, ) values
+    :param callable gradient: its gradient, mapping (n, 2) points to (n, 2) gradients
+    :param callable laplacian: its laplacian, mapping (n, 2) points to (n, ) values
+    :param integration_method: quadrature rule, see PSFEM.assembly.reference_quadrature
+    :return: (n_triangles, ) squared errors
+    """
+
+    mesh = u.space.mesh
+    _, _, w = reference_quadrature(integration_method)
+    tabulation = quadrature_tabulation(integration_method)
+
+    errors = np.zeros(len(mesh.triangles))
+    for triangles in _chunks(len(mesh.triangles)):
+        vertices = mesh.vertices[mesh.triangles[triangles]]
+        K, areas = affine_maps(vertices)
+        S = np.einsum('tij,tj->ti', hermite_coefficients(vertices), u.local_coefficients(triangles))
+        points = np.matmul(tabulation.b, vertices)
+
+        squared = 0
+        if f is not None:
+            squared = squared + (np.einsum('qi,ti->tq', tabulation.phi, S) - _evaluate(f, points)) ** 2
+        if gradient is not None:
+            du = np.einsum('ted,qei,ti->tqd', K, tabulation.dphi, S)
+            squared = squared + np.sum((du - _evaluate(gradient, points)) ** 2, axis=-1)
+        if laplacian is not None:
+            ddu = np.einsum('ted,tfd,qefi,ti->tq', K, K, tabulation.ddphi, S)
+            squared = squared + (ddu - _evaluate(laplacian, points)) ** 2
+
+        errors[triangles] = np.einsum('t,q,tq->t', areas, w, np.broadcast_to(squared, (len(triangles), len(w))))
+
+    return errors
+
+
+def error_norm(u, f=None, gradient=None, laplacian=None, integration_method=seven_point_ps12):
+    """
+    Computes the error of a function against an exact solution in the norm given by the exact data: the L2-norm
+    for f, the H1-seminorm for gradient, the H1-norm for both, and the L2-norm of the laplacian error, which
+    is equivalent to the H2-seminorm for functions vanishing with their gradients on the boundary, for laplacian.
+    :param CompositeSplineFunction u: approximate solution
+    :param callable f: exact solution, mapping (n, 2) points to (n, ) values
+    :param callable gradient: its gradient, mapping (n, 2) points to (n, 2) gradients
+    :param callable laplacian: its laplacian, mapping (n, 2) points to (n, ) values
+    :param integration_method: quadrature rule
+    :return: float
+    """
+
+    return np.sqrt(np.sum(element_errors(u, f, gradient, laplacian, integration_method)))
+
+
+def biharmonic_indicators(u, f, integration_method=seven_point_ps12):
+    """
+    Computes the residual based error indicators of an approximate solution u of the clamped plate problem
+    lapl^2 u = f, for each triangle T
+        eta_T^2 = h_T^4 ||f - lapl^2 u||_T^2 + sum_e h_e ||[lapl u]||_e^2,
+    with [.] the jump across e, the sum running over the edges e of the PS12-split of T, and with weight 1/2 over
+    the interior edges of the mesh on the boundary of T. The bilaplacian of u vanishes on its quadratic pieces,
+    and so does the jump of the normal derivative of lapl u, which is left out. The laplacian is constant on each
+    piece, so the edge integrals are exact.
+    :param CompositeSplineFunction u: approximate solution
+    :param callable f: load, mapping (n, 2) points to (n, ) values
+    :param integration_method: quadrature rule for the load
+    :return: (n_triangles, ) squared indicators eta_T^2
+    """
+
+    mesh = u.space.mesh
+    _, _, w = reference_quadrature(integration_method)
+    tabulation = quadrature_tabulation(integration_method)
+    lengths = np.linalg.norm(mesh.vertices[mesh.edge_vertices[:, 1]] - mesh.vertices[mesh.edge_vertices[:, 0]],
+                             axis=1)
+
+    # the laplacian on each of the twelve pieces, from its value at the centroid of the piece
+    pieces, ends = _split_edges()
+    centroids = np.mean(np.asarray(sub_triangles(np.eye(3)), dtype=float), axis=1)
+    _, _, ddphi = reference_tabulation(centroids, np.arange(12))
+
+    indicators = np.zeros(len(mesh.triangles))
+    for triangles in _chunks(len(mesh.triangles)):
+        vertices = mesh.vertices[mesh.triangles[triangles]]
+        K, areas = affine_maps(vertices)
+        S = np.einsum('tij,tj->ti', hermite_coefficients(vertices), u.local_coefficients(triangles))
+
+        # element residuals, with h_T the longest edge of T
+        h = np.max(lengths[mesh.triangle_edges[triangles]], axis=1)
+        integral = np.einsum('t,q,tq->t', areas, w, _evaluate(f, np.matmul(tabulation.b, vertices)) ** 2)
+
+        # jumps of the laplacian across the edges inside T
+        laplacians = np.einsum('ted,tfd,kefi,ti->tk', K, K, ddphi, S)
+        split_lengths = np.linalg.norm(np.einsum('mj,tjd->tmd', ends[:, 1] - ends[:, 0], vertices), axis=-1)
+        jumps = laplacians[:, pieces[:, 0]] - laplacians[:, pieces[:, 1]]
+
+        indicators[triangles] = h ** 4 * integral + np.sum(split_lengths ** 2 * jumps ** 2, axis=1)
+
+    # jumps of the laplacian across interior edges of the mesh, at the midpoints of the two halves of each edge
+    edges = np.flatnonzero(~mesh.is_boundary_edge)
+    first = mesh.edge_triangles[mesh.edge_triangle_offsets[edges]]
+    second = mesh.edge_triangles[mesh.edge_triangle_offsets[edges] + 1]
+    a, b = mesh.vertices[mesh.edge_vertices[edges, 0]], mesh.vertices[mesh.edge_vertices[edges, 1]]
+    points = np.concatenate([0.75 * a + 0.25 * b, 0.25 * a + 0.75 * b])
+
+    jumps = (u.laplacian(points, np.tile(first, 2)) - u.laplacian(points, np.tile(second, 2))).reshape(2, -1)
+    edge_terms = lengths[edges] ** 2 * np.mean(jumps ** 2, axis=0)
+
+    indicators += np.bincount(first, weights=edge_terms / 2, minlength=len(indicators))
+    indicators += np.bincount(second, weights=edge_terms / 2, minlength=len(indicators))
+
+    return indicators
+
+
+def doerfler_marking(indicators, theta=0.5):
+    """
+    Selects a minimal set of triangles with the largest indicators whose sum makes up at least the fraction theta
+    of the total, to be passed to Mesh.refine.
+    :param np.ndarray indicators: (n_triangles, ) squared error indicators
+    :param float theta: fraction in (0, 1]
+    :return: np.ndarray of triangle indices
+    """
+
+    order = np.argsort(indicators)[::-1]
+    cumulative = np.cumsum(indicators[order])
+    count = np.searchsorted(cumulative, theta * cumulative[-1]) + 1
+    return np.sort(order[:min(count, len(order))])
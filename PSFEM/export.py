@@ -0,0 +1,235 @@
+import os
+from xml.sax.saxutils import quoteattr
+
+import numpy as np
+from SSplines import sub_triangles
+from SSplines.helper_functions import determine_sub_triangle
+
+from PSFEM.assembly import CHUNK_SIZE
+from PSFEM.tabulation import affine_maps, hermite_coefficients, reference_tabulation
+
+# VTK cell type of linear triangles
+VTK_TRIANGLE = 5
+
+
+def reference_sampling(subdivision='ps12'):
+    """
+    Computes the points and cells each triangle is sampled on for export, in barycentric coordinates.
+    :param subdivision: 'ps12' for the twelve sub-triangles of the PS12-split, on each of which the function is a
+    quadratic polynomial, or an integer n for the uniform lattice of n^2 sub-triangles
+    :return: points (p, 3), cells (c, 3) of point indices, and the barycentric centroids (c, 3) of the cells
+    """
+
+    if subdivision == 'ps12':
+        triangles = np.round(np.asarray(sub_triangles(np.eye(3)), dtype=float), 12).reshape(-1, 3)
+        points, cells = np.unique(triangles, axis=0, return_inverse=True)
+        cells = cells.reshape(-1, 3)
+    else:
+        n = int(subdivision)
+        i, j = np.triu_indices(n + 1)
+        j = j - i
+        index = -np.ones((n + 1, n + 1), dtype=np.int64)
+        index[i, j] = np.arange(len(i))
+        points = np.column_stack([n - i - j, i, j]) / n
+
+        # upward cells (i, j), (i + 1, j), (i, j + 1) and downward cells (i + 1, j), (i + 1, j + 1), (i, j + 1)
+        up = (i + j < n)
+        down = (i + j < n - 1)
+        cells = np.concatenate([
+            np.column_stack([index[i[up], j[up]], index[i[up] + 1, j[up]], index[i[up], j[up] + 1]]),
+            np.column_stack([index[i[down] + 1, j[down]], index[i[down] + 1, j[down] + 1],
+                             index[i[down], j[down] + 1]]),
+        ])
+
+    return points, cells, np.mean(points[cells], axis=1)
+
+
+class _Sampler(object):
+    """
+    Evaluates a CompositeSplineFunction on the reference sampling of chunks of triangles: values at the points,
+    and laplacians at the centroids of the cells. Cells of a lattice may straddle the PS12-split, over which the
+    laplacian jumps, and where a centroid lies on the split the laplacian of either side is taken.
+    """
+
+    def __init__(self, u, subdivision, chunk_size):
+        self.u = u
+        self.mesh = u.space.mesh
+        self.points, self.cells, centroids = reference_sampling(subdivision)
+        self.phi, _, _ = reference_tabulation(self.points, determine_sub_triangle(self.points))
+        _, _, self.ddphi = reference_tabulation(centroids, determine_sub_triangle(centroids))
+        self.chunk_size = chunk_size
+
+        self.n_triangles = len(self.mesh.triangles)
+        self.n_points = self.n_triangles * len(self.points)
+        self.n_cells = self.n_triangles * len(self.cells)
+
+    def chunks(self):
+        """
+        :return: generator of the triangles, points (n, p, 2), cells (n, c, 3) of global point indices, values
+        (n, p) and laplacians (n, c) of each chunk
+        """
+
+        for start in range(0, self.n_triangles, self.chunk_size):
+            triangles = np.arange(start, min(start + self.chunk_size, self.n_triangles))
+            vertices = self.mesh.vertices[self.mesh.triangles[triangles]]
+            K, _ = affine_maps(vertices)
+            S = np.einsum('tij,tj->ti', hermite_coefficients(vertices), self.u.local_coefficients(triangles))
+
+            points = np.matmul(self.points, vertices)
+            cells = self.cells[None] + len(self.points) * triangles[:, None, None]
+            values = np.einsum('qi,ti->tq', self.phi, S)
+            laplacians = np.einsum('ted,tfd,qefi,ti->tq', K, K, self.ddphi, S)
+
+            yield triangles, points, cells, values, laplacians
+
+
+def _little_endian(array, dtype):
+    return np.ascontiguousarray(array, dtype=np.dtype(dtype).newbyteorder('<')).tobytes()
+
+
+def _arrays(sampler, name):
+    """
+    The arrays written for a sampled function, as tuples of the section of the file they belong to, their name,
+    VTK type, number of components, bytes per triangle and a function computing their bytes for a chunk.
+    """
+
+    p, c = len(sampler.points), len(sampler.cells)
+
+    def points(chunk):
+        x = chunk[1]
+        return _little_endian(np.concatenate([x, np.zeros(x.shape[:2] + (1, ))], axis=2), 'f8')
+
+    def offsets(chunk):
+        return _little_endian(3 * (c * chunk[0][:, None] + np.arange(1, c + 1)), 'i8')
+
+    return [
+        ('Points', 'Points', 'Float64', 3, 24 * p, points),
+        ('Cells', 'connectivity', 'Int64', 1, 24 * c, lambda chunk: _little_endian(chunk[2], 'i8')),
+        ('Cells', 'offsets', 'Int64', 1, 8 * c, offsets),
+        ('Cells', 'types', 'UInt8', 1, c, lambda chunk: _little_endian(np.full((len(chunk[0]), c), VTK_TRIANGLE),
+                                                                       'u1')),
+        ('PointData', name, 'Float64', 1, 8 * p, lambda chunk: _little_endian(chunk[3], 'f8')),
+        ('CellData', 'laplacian', 'Float64', 1, 8 * c, lambda chunk: _little_endian(chunk[4], 'f8')),
+        ('CellData', 'triangle', 'Int64', 1, 8 * c, lambda chunk: _little_endian(np.repeat(chunk[0], c), 'i8')),
+    ]
+
+
+def write_vtu(path, u, subdivision='ps12', name='u', chunk_size=CHUNK_SIZE):
+    """
+    Writes a function to a VTK unstructured grid file, with each triangle split into the cells of its reference
+    sampling, see reference_sampling. The values of the function are written as point data, and the laplacian,
+    which is discontinuous across the PS12-split, and the index of the parent triangle as cell data. Points on the
+    edges of the mesh are repeated for each triangle.
+    The data is appended in raw binary form, and as the size of every array is known in advance, each chunk of
+    triangles is sampled once and written straight to its place in each array, so the sampled mesh is never held
+    in memory.
+    :param str path: file name, conventionally ending in .vtu
+    :param CompositeSplineFunction u: function to export
+    :param subdivision: 'ps12' or the number of lattice subdivisions of each edge
+    :param str name: name of the function in the file
+    :param int chunk_size: number of triangles sampled at once
+    """
+
+    sampler = _Sampler(u, subdivision, chunk_size)
+    arrays = _arrays(sampler, name)
+
+    # offsets of the arrays in the appended data, each preceded by its size as UInt64
+    sizes = [per_triangle * sampler.n_triangles for _, _, _, _, per_triangle, _ in arrays]
+    offsets = np.concatenate([[0], np.cumsum(np.add(sizes, 8))])
+
+    sections = {}
+    for (section, array_name, vtk_type, components, _, _), offset in zip(arrays, offsets):
+        sections.setdefault(section, []).append(
+            '<DataArray type="{}" Name={} NumberOfComponents="{}" format="appended" offset="{}"/>'.format(
+                vtk_type, quoteattr(array_name), components, offset))
+
+    header = '\n'.join([
+        '<?xml version="1.0"?>',
+        '<VTKFile type="UnstructuredGrid" version="1.0" byte_order="LittleEndian" header_type="UInt64">',
+        '<UnstructuredGrid>',
+        '<Piece NumberOfPoints="{}" NumberOfCells="{}">'.format(sampler.n_points, sampler.n_cells),
+        '<Points>', *sections['Points'], '</Points>',
+        '<Cells>', *sections['Cells'], '</Cells>',
+        '<PointData Scalars={}>'.format(quoteattr(name)), *sections['PointData'], '</PointData>',
+        '<CellData>', *sections['CellData'], '</CellData>',
+        '</Piece>',
+        '</UnstructuredGrid>',
+        '<AppendedData encoding="raw">',
+        '_',
+    ])
+
+    with open(path, 'wb') as f:
+        f.write(header.encode())
+        start = f.tell()
+        for size, offset in zip(sizes, offsets):
+            f.seek(start + offset)
+            f.write(_little_endian(size, 'u8'))
+
+        for chunk in sampler.chunks():
+            first = chunk[0][0]
+            for (_, _, _, _, per_triangle, compute), offset in zip(arrays, offsets):
+                f.seek(start + offset + 8 + first * per_triangle)
+                f.write(compute(chunk))
+
+        f.seek(start + offsets[-1])
+        f.write(b'\n</AppendedData>\n</VTKFile>\n')
+
+
+def write_xdmf(path, u, subdivision='ps12', name='u', chunk_size=CHUNK_SIZE):
+    """
+    Writes a function to an XDMF file, sampled as by write_vtu, with the heavy data in raw binary files next to
+    it, which are appended to chunk by chunk.
+    :param str path: file name, conventionally ending in .xdmf. The binary files share its stem.
+    :param CompositeSplineFunction u: function to export
+    :param subdivision: 'ps12' or the number of lattice subdivisions of each edge
+    :param str name: name of the function in the file
+    :param int chunk_size: number of triangles sampled at once
+    """
+
+    sampler = _Sampler(u, subdivision, chunk_size)
+    n_points, n_cells = sampler.n_points, sampler.n_cells
+    stem = os.path.splitext(path)[0]
+
+    # name, dimensions, number type, precision and bytes of a chunk of each binary file
+    data = [
+        ('points', '{} 2'.format(n_points), 'Float', 8, lambda chunk: _little_endian(chunk[1], 'f8')),
+        ('cells', '{} 3'.format(n_cells), 'Int', 8, lambda chunk: _little_endian(chunk[2], 'i8')),
+        (name, str(n_points), 'Float', 8, lambda chunk: _little_endian(chunk[3], 'f8')),
+        ('laplacian', str(n_cells), 'Float', 8, lambda chunk: _little_endian(chunk[4], 'f8')),
+        ('triangle', str(n_cells), 'Int', 8,
+         lambda chunk: _little_endian(np.repeat(chunk[0], len(sampler.cells)), 'i8')),
+    ]
+    files = ['{}.{}.bin'.format(stem, data_name) for data_name, _, _, _, _ in data]
+
+    handles = [open(file, 'wb') for file in files]
+    try:
+        for chunk in sampler.chunks():
+            for handle, (_, _, _, _, compute) in zip(handles, data):
+                handle.write(compute(chunk))
+    finally:
+        for handle in handles:
+            handle.close()
+
+    items = [
+        '<DataItem Dimensions="{}" NumberType="{}" Precision="{}" Format="Binary" Endian="Little">{}</DataItem>'
+        .format(dimensions, number_type, precision, os.path.basename(file))
+        for (_, dimensions, number_type, precision, _), file in zip(data, files)
+    ]
+
+    with open(path, 'w') as f:
+        f.write('\n'.join([
+            '<?xml version="1.0"?>',
+            '<Xdmf Version="3.0">',
+            '<Domain>',
+            '<Grid Name="mesh" GridType="Uniform">',
+            '<Topology TopologyType="Triangle" NumberOfElements="{}">'.format(n_cells), items[1], '</Topology>',
+            '<Geometry GeometryType="XY">', items[0], '</Geometry>',
+            '<Attribute Name={} AttributeType="Scalar" Center="Node">'.format(quoteattr(name)), items[2],
+            '</Attribute>',
+            '<Attribute Name="laplacian" AttributeType="Scalar" Center="Cell">', items[3], '</Attribute>',
+            '<Attribute Name="triangle" AttributeType="Scalar" Center="Cell">', items[4], '</Attribute>',
+            '</Grid>',
+            '</Domain>',
+            '</Xdmf>',
+            '',
+        ]))
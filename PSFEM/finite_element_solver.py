@@ -1,47 +1,140 @@
 import numpy as np
 import scipy.sparse as sps
-import scipy.sparse.linalg as spla
-import tqdm
 
+from PSFEM.assembly import MatrixFreeOperator, assemble_element_systems, assemble_matrix, assemble_vector
+from PSFEM.instrumentation import phase
+from PSFEM.linear_solvers import ConjugateGradientSolver, DirectSolver
 from PSFEM.quadrature import midpoint_rule_ps12
 
 
-def solve(a, L, V, verbose=False, nprocs=1, integration_method=midpoint_rule_ps12):
+class LinearProblem(object):
+    """
+    The discrete problem a(u, v) = L(v) for a fixed bilinear form a, with Dirichlet boundary conditions
+    prescribing the boundary dofs of V, zero unless given. The matrix restricted to the interior dofs is set up
+    with the linear solver once, on the first solve, so that a direct solver factorizes it only once for all
+    right hand sides and boundary values.
+    """
+
+    def __init__(self, a, V, integration_method=midpoint_rule_ps12, vectorized=False, nprocs=1, verbose=False,
+                 solver=None, matrix_free=False):
+        """
+        :param a: bilinear form, its assembled global matrix over all dofs of V, or a MatrixFreeOperator over all
+        dofs of V
+        :param V: Composite C^1 function space
+        :param solver: linear solver, see PSFEM.linear_solvers, a DirectSolver by default, or a
+        ConjugateGradientSolver with Jacobi preconditioning if the matrix is not assembled
+        :param integration_method: quadrature rule, used for assembling a and linear forms
+        :param vectorized: whether to assemble on arrays of tabulated basis functions, see solve
+        :param nprocs: number of processes to distribute the element computations over
+        :param verbose: whether to display a progress bar
+        :param matrix_free: whether to apply the matrix of the bilinear form a without assembling it, see
+        MatrixFreeOperator
+        """
+
+        self.V = V
+        self.assembly_options = dict(integration_method=integration_method, vectorized=vectorized, nprocs=nprocs,
+                                     verbose=verbose)
+        self.interior_dofs = V.interior_dofs
+        self.reduction = V.dirichlet_reduction()
+
+        if matrix_free and not isinstance(a, MatrixFreeOperator):
+            a = MatrixFreeOperator(a, V, integration_method)
+
+        if isinstance(a, MatrixFreeOperator):
+            self.A = a
+            self.A_interior = a.restrict(V.interior_dofs, V.interior_dofs)
+            self.A_interior_boundary = a.restrict(V.interior_dofs, V.boundary_dofs)
+            self.solver = solver if solver is not None else ConjugateGradientSolver()
+        else:
+            self.A = sps.csr_matrix(a) if sps.issparse(a) else assemble_matrix(a, V, **self.assembly_options)
+            self.A_interior, self.A_interior_boundary = self.reduction.reduce_matrix(self.A)
+            self.solver = solver if solver is not None else DirectSolver()
+        self._is_setup = False
+
+    def setup(self):
+        """
+        Sets up the linear solver with the interior matrix, if not done already.
+        :return: the linear solver
+        """
+
+        if not self._is_setup:
+            with phase('factorization'):
+                self.solver.setup(self.A_interior)
+            self._is_setup = True
+        return self.solver
+
+    @property
+    def factorization(self):
+        """
+        The sparse LU factorization of the interior matrix, for a direct solver.
+        :return: spla.SuperLU
+        """
+
+        return self.setup().factorization
+
+    def solve_coefficients(self, b, boundary_values=None, initial_guess=None):
+        """
+        Computes the coefficients of the solutions for one or several load vectors at once.
+        :param np.ndarray b: (dimension, ) load vector, or (dimension, k) array of k load vectors
+        :param np.ndarray boundary_values: values of the dofs V.boundary_dofs, (n_boundary, ) or (n_boundary, k).
+        Homogeneous if None.
+        :param np.ndarray initial_guess: coefficients of the same shape as b to start iterative solvers from,
+        for instance a coarse solution c prolongated as V_coarse.prolongation(V) @ c
+        :return: np.ndarray of the same shape as b
+        """
+
+        b = np.asarray(b, dtype=float)
+        b_interior = self.reduction.reduce_vector(b, self.A_interior_boundary, boundary_values)
+        x0 = None if initial_guess is None else self.reduction.interior.T @ np.asarray(initial_guess, dtype=float)
+        solver = self.setup()
+        with phase('back_substitution'):
+            c_interior = solver.solve(b_interior, x0)
+        return self.reduction.expand(c_interior, boundary_values)
+
+    def solve(self, L, boundary_values=None, initial_guess=None):
+        """
+        Solves the problem for a linear form or for one or several load vectors.
+        :param L: linear form, (dimension, ) load vector or (dimension, k) array of k load vectors
+        :param np.ndarray boundary_values: values of the dofs V.boundary_dofs, see solve_coefficients
+        :param np.ndarray initial_guess: initial guess for iterative solvers, see solve_coefficients
+        :return: CompositeSplineFunction, or a list of k CompositeSplineFunctions
+        """
+
+        if callable(L):
+            L = assemble_vector(L, self.V, **self.assembly_options)
+
+        c = self.solve_coefficients(L, boundary_values, initial_guess)
+        if c.ndim == 1:
+            return self.V.function(c)
+        return [self.V.function(coefficients) for coefficients in c.T]
+
+
+def solve(a, L, V, verbose=False, nprocs=1, integration_method=midpoint_rule_ps12, vectorized=False, solver=None,
+          boundary_values=None):
     """
     Solves the discrete finite element problem
     Find u in V such that
         a(u, v) = L(v)
     for all v in V.
 
-    :param a: bilinear form
-    :param L: linear form
+    :param a: bilinear form, either a PSFEM.forms.Form or a callable a(u, v) returning an integrand
+    :param L: linear form, either a PSFEM.forms.Form or a callable L(v) returning an integrand
     :param V: Composite C^1 function space.
-    :return: CompositeSpline u satisfying a(u, v) = L(v) for all v in V.
+    :param vectorized: whether to evaluate the forms on arrays of tabulated basis functions for batches of
+    triangles at once, see PSFEM.assembly.element_systems, rather than once per pair of basis functions.
+    :param nprocs: number of processes to distribute the element computations over.
+    :param solver: linear solver, see PSFEM.linear_solvers. Defaults to the direct DirectSolver, while
+    ConjugateGradientSolver avoids the memory cost of factorizing the matrix on fine meshes.
+    :param np.ndarray boundary_values: values of the dofs V.boundary_dofs, for instance
+    V.hermite_dofs(g, grad_g)[V.boundary_dofs]. Homogeneous if None.
+    :return: CompositeSplineFunction u satisfying a(u, v) = L(v) for all v in V.
     """
 
-    A = sps.lil_matrix((V.dimension, V.dimension))
-    b = np.zeros(V.dimension)
-    c = np.zeros(V.dimension)
-
-    def compute_single_triangle(triangle):
-        triangle_coords = V.mesh.vertices[V.mesh.triangles[triangle]]
-        l2g = V.local_to_global_map[triangle]
-        local_basis = [V.basis[basis_number].local_representation[triangle] for basis_number in l2g]
-
-        for j in tqdm.trange(12, leave=False, disable=not verbose, desc='   Local assembly'):
-            for i in range(j + 1):
-                I = integration_method(a(local_basis[i], local_basis[j]), triangle_coords)
-                A[l2g[i], l2g[j]] += I
-                if i != j:
-                    A[l2g[j], l2g[i]] += I
-
-            b[l2g[j]] += integration_method(L(local_basis[j]), triangle_coords)
-
-    for triangle in tqdm.trange(len(V.mesh.triangles), disable=not verbose, desc='Global assembly'):
-        compute_single_triangle(triangle)
+    A_local, b_local = assemble_element_systems(a, L, V, integration_method, vectorized=vectorized, nprocs=nprocs,
+                                                verbose=verbose)
 
-    interior_dofs = V.interior_dofs
-    A = sps.csr_matrix(A)
-    c[interior_dofs] = spla.spsolve(A[np.ix_(interior_dofs, interior_dofs)], b[interior_dofs])
+    pattern = V.sparsity_pattern()
+    A = pattern.assemble_matrix(A_local)
+    b = pattern.assemble_vector(b_local)
 
-    return V.function(c)
+    return LinearProblem(A, V, solver=solver).solve(b, boundary_values)
@@ -0,0 +1,278 @@
+import functools
+import numbers
+
+import numpy as np
+
+# argument numbers of trial and test functions
+TRIAL, TEST = 0, 1
+
+# the methods of SSplines.SplineFunction and TabulatedBasis evaluating each operator
+_METHODS = {'value': '__call__', 'grad': 'grad', 'lapl': 'lapl'}
+
+# the arguments each rank of form depends on
+_RANK_ARGUMENTS = {2: (TRIAL, TEST), 1: (TEST, )}
+
+
+class Term(object):
+    """
+    A product of coefficients and differential operators applied to trial and test functions.
+    """
+
+    def __init__(self, factors=(), arguments=(), rank=0):
+        """
+        :param tuple factors: numbers and callables of points, with the coordinates along the last axis
+        :param tuple arguments: sorted pairs (argument number, operator), operator being 'value', 'grad' or 'lapl'
+        :param int rank: 1 if the term is vector valued, which is the case for gradients not yet contracted by inner
+        """
+
+        self.factors = factors
+        self.arguments = arguments
+        self.rank = rank
+
+    def is_constant(self):
+        return all(isinstance(factor, numbers.Number) for factor in self.factors)
+
+    def scale(self):
+        return np.prod([factor for factor in self.factors if isinstance(factor, numbers.Number)])
+
+    def operators(self):
+        return tuple(operator for _, operator in self.arguments)
+
+    def multiply(self, other, contract=False):
+        numbers_self = {number for number, _ in self.arguments}
+        if any(number in numbers_self for number, _ in other.arguments):
+            raise ValueError('A term can not be non-linear in an argument')
+
+        if contract:
+            if self.rank != other.rank:
+                raise ValueError('inner requires operands of equal rank')
+            rank = 0
+        else:
+            if self.rank + other.rank > 1:
+                raise ValueError('Vector valued operands must be multiplied with inner')
+            rank = self.rank + other.rank
+
+        return Term(self.factors + other.factors, tuple(sorted(self.arguments + other.arguments)), rank)
+
+    def coefficient(self, points):
+        """
+        Evaluates the product of the factors at the given points.
+        :param np.ndarray points: (..., 2) array of points
+        :return: array broadcastable against points[..., 0]
+        """
+
+        c = self.scale()
+        for factor in self.factors:
+            if not isinstance(factor, numbers.Number):
+                c = c * np.asarray(factor(points), dtype=float)
+        return c
+
+    def __str__(self):
+        names = {TRIAL: 'u', TEST: 'v'}
+        factors = [str(factor) if isinstance(factor, numbers.Number) else getattr(factor, '__name__', 'f')
+                   for factor in self.factors]
+        arguments = [names[number] if operator == 'value' else '{}({})'.format(operator, names[number])
+                     for number, operator in self.arguments]
+        return '*'.join(factors + arguments) or '0'
+
+
+class Form(object):
+    """
+    A sum of terms in the trial function u and the test function v, such as inner(grad(u), grad(v)) + u*v or
+    f*v. Unlike forms given as Python closures, a Form can be inspected, so the assembly contracts tabulated
+    basis functions directly, and caches the element matrices of terms with constant coefficients on the space.
+
+    Forms are callable like the closures accepted by solve, a(u, v) and L(v) returning integrands of points.
+    """
+
+    def __init__(self, terms):
+        """
+        :param list terms: list of Term
+        """
+
+        self.terms = list(terms)
+
+    @property
+    def arguments(self):
+        """
+        The argument numbers of the form: (TRIAL, TEST) for a bilinear form and (TEST, ) for a linear form.
+        :return: tuple
+        """
+
+        arguments = {tuple(number for number, _ in term.arguments) for term in self.terms}
+        if not arguments:
+            return ()
+        if len(arguments) != 1:
+            raise ValueError('All terms of a form must depend on the same arguments')
+        return arguments.pop()
+
+    def __add__(self, other):
+        if isinstance(other, numbers.Number) and other == 0:
+            return self
+        return Form(self.terms + as_form(other).terms)
+
+    def __radd__(self, other):
+        return self.__add__(other)
+
+    def __neg__(self):
+        return -1 * self
+
+    def __sub__(self, other):
+        return self + (-1) * as_form(other)
+
+    def __rsub__(self, other):
+        return as_form(other) + (-1) * self
+
+    def __mul__(self, other):
+        other = as_form(other)
+        return Form([s.multiply(t) for s in self.terms for t in other.terms])
+
+    def __rmul__(self, other):
+        return as_form(other) * self
+
+    def __call__(self, *functions):
+        """
+        Returns the integrand of the form for the given functions, as a callable of points.
+        :param functions: one function per argument, e.g. u and v for a bilinear form
+        :return: callable
+        """
+
+        functions = dict(zip(self.arguments, functions))
+
+        def integrand(p):
+            value = 0
+            for term in self.terms:
+                operands = [getattr(functions[number], _METHODS[op])(p) for number, op in term.arguments]
+                if term.operators().count('grad') == 2:
+                    product = np.sum(operands[0] * operands[1], axis=-1)
+                else:
+                    product = functools.reduce(np.multiply, operands)
+                value = value + term.coefficient(p) * product
+            return value
+
+        return integrand
+
+    def validate(self, rank):
+        """
+        Checks that every term of the form is scalar and depends on the arguments of a form of the given rank:
+        the trial and the test function for a bilinear form, and the test function only for a linear form.
+        :param int rank: 2 for a bilinear form, 1 for a linear form
+        """
+
+        for term in self.terms:
+            if term.rank != 0:
+                raise ValueError('Term {} is vector valued, gradients must be contracted with inner'.format(term))
+            if tuple(number for number, _ in term.arguments) != _RANK_ARGUMENTS[rank]:
+                kind = 'bilinear form requires one trial and one test function' if rank == 2 else \
+                    'linear form requires one test function and no trial function'
+                raise ValueError('Term {} does not fit the form: a {}'.format(term, kind))
+
+    def split(self):
+        """
+        Splits the form into its terms with constant coefficients, keyed by operators, and the remaining form.
+        :return: dict mapping operators to the sum of their scales, and Form
+        """
+
+        constant = {}
+        variable = []
+        for term in self.terms:
+            if term.is_constant():
+                constant[term.operators()] = constant.get(term.operators(), 0) + term.scale()
+            else:
+                variable.append(term)
+
+        return constant, Form(variable)
+
+    def element_arrays(self, basis, points, weights, rank):
+        """
+        Integrates the form against the local basis functions of a batch of triangles, contracting the tabulated
+        basis functions with the quadrature weights.
+        :param TabulatedBasis basis: basis tabulated at the quadrature points, values of shape (n, q, 12)
+        :param np.ndarray points: (n, q, 2) quadrature points
+        :param np.ndarray weights: (n, q) quadrature weights
+        :param int rank: 2 for a bilinear form, 1 for a linear form
+        :return: element matrices (n, 12, 12) or element vectors (n, 12)
+        """
+
+        self.validate(rank)
+        tabulated = {'value': basis.values, 'grad': basis.gradients, 'lapl': basis.laplacians}
+
+        result = np.zeros(weights.shape[:1] + (12,) * rank)
+        for term in self.terms:
+            w = weights * term.coefficient(points)
+            operands = [tabulated[operator] for operator in term.operators()]
+
+            if rank == 2 and term.operators() == ('grad', 'grad'):
+                result += np.einsum('tq,tqid,tqjd->tij', w, *operands)
+            elif rank == 2:
+                result += np.einsum('tq,tqi,tqj->tij', w, *operands)
+            else:
+                result += np.einsum('tq,tqi->ti', w, *operands)
+
+        return result
+
+
+class TrialFunction(Form):
+
+    def __init__(self):
+        super().__init__([Term(arguments=((TRIAL, 'value'),))])
+
+
+class TestFunction(Form):
+
+    def __init__(self):
+        super().__init__([Term(arguments=((TEST, 'value'),))])
+
+
+def as_form(expression):
+    """
+    Converts numbers and callables of points to forms without arguments.
+    :param expression: Form, number or callable
+    :return: Form
+    """
+
+    if isinstance(expression, Form):
+        return expression
+    if isinstance(expression, numbers.Number) or callable(expression):
+        return Form([Term(factors=(expression,))])
+    raise TypeError('Can not convert {} to a form'.format(expression))
+
+
+def _differentiate(expression, operator, rank):
+    terms = []
+    for term in as_form(expression).terms:
+        if len(term.arguments) != 1 or term.arguments[0][1] != 'value' or not term.is_constant():
+            raise ValueError('Differential operators apply to trial and test functions only')
+        terms.append(Term(term.factors, ((term.arguments[0][0], operator),), rank))
+    return Form(terms)
+
+
+def grad(expression):
+    """
+    The gradient of a trial or test function.
+    :param Form expression:
+    :return: Form
+    """
+
+    return _differentiate(expression, 'grad', 1)
+
+
+def lapl(expression):
+    """
+    The Laplacian of a trial or test function.
+    :param Form expression:
+    :return: Form
+    """
+
+    return _differentiate(expression, 'lapl', 0)
+
+
+def inner(a, b):
+    """
+    The inner product of two scalar or two vector valued expressions.
+    :param a: Form, number or callable
+    :param b: Form, number or callable
+    :return: Form
+    """
+
+    return Form([s.multiply(t, contract=True) for s in as_form(a).terms for t in as_form(b).terms])
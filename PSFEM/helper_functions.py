@@ -1,64 +1,218 @@
 import numpy as np
+import scipy.sparse as sps
+from scipy.sparse.csgraph import reverse_cuthill_mckee
 
-from PSFEM.mesh import Mesh
+from PSFEM.mesh import Mesh, unique_edges
+
+
+def dof_numbering(triangles, triangle_edges, n_vertices, n_edges, numbering='blocked'):
+    """
+    Computes the local to global map for the C^1 hermite global basis on PS12-split of a triangulation, given the
+    unique edges of the triangulation. Local dofs 4i, 4i + 1, 4i + 2 are the value and gradient dofs of vertex i
+    of a triangle, and local dof 4i + 3 is the normal derivative dof of the edge from vertex i to vertex i + 1.
+
+    With numbering='blocked', vertex v owns the dofs 3v, 3v + 1, 3v + 2, and edge e owns the dof 3 * n_vertices + e.
+    With numbering='legacy', dofs are numbered in the order the vertices and edges are first visited when walking
+    the triangles, as in local_to_global.
+
+    :param np.ndarray triangles: (n_triangles, 3) array of vertex indices
+    :param np.ndarray triangle_edges: (n_triangles, 3) edge indices of the local edges (t0, t1), (t1, t2), (t2, t0)
+    :param int n_vertices: number of vertices
+    :param int n_edges: number of edges
+    :param str numbering: 'blocked' or 'legacy'
+    :return: (n_triangles, 12) local to global map, and the vertex and edge of each dof, -1 where not applicable.
+    """
+
+    triangles = np.asarray(triangles, dtype=np.int64)
+    triangle_edges = np.asarray(triangle_edges, dtype=np.int64)
+
+    # the first dof of each vertex, followed by the dof of each edge
+    if numbering == 'blocked':
+        first_dofs = np.concatenate([3 * np.arange(n_vertices), 3 * n_vertices + np.arange(n_edges)])
+        dimension = 3 * n_vertices + n_edges
+    elif numbering == 'legacy':
+        # entities in the order v0, e0, v1, e1, v2, e2 of each triangle, edges offset by n_vertices
+        entities = np.stack([triangles, n_vertices + triangle_edges], axis=2).ravel()
+        entities, first_visit = np.unique(entities, return_index=True)
+        entities = entities[np.argsort(first_visit)]
+
+        sizes = np.where(entities < n_vertices, 3, 1)
+        first_dofs = np.full(n_vertices + n_edges, -1, dtype=np.int64)
+        first_dofs[entities] = np.cumsum(sizes) - sizes
+        dimension = np.sum(sizes)
+    else:
+        raise ValueError('Unknown dof numbering {}'.format(numbering))
+
+    local_to_global_map = np.empty((len(triangles), 12), dtype=np.int64)
+    local_to_global_map[:, 0::4] = first_dofs[triangles]
+    local_to_global_map[:, 1::4] = first_dofs[triangles] + 1
+    local_to_global_map[:, 2::4] = first_dofs[triangles] + 2
+    local_to_global_map[:, 3::4] = first_dofs[n_vertices + triangle_edges]
+
+    dof_to_vertex = np.full(dimension, -1, dtype=np.int64)
+    dof_to_edge = np.full(dimension, -1, dtype=np.int64)
+    for i in range(3):
+        dof_to_vertex[local_to_global_map[:, 4 * i:4 * i + 3]] = triangles[:, i, None]
+        dof_to_edge[local_to_global_map[:, 4 * i + 3]] = triangle_edges[:, i]
+
+    return local_to_global_map, dof_to_vertex, dof_to_edge
+
+
+def dof_reordering(local_to_global, dimension, method='rcm'):
+    """
+    Computes a permutation of the dofs reducing the bandwidth of global matrices, and with it the fill-in of their
+    factorizations, by the reverse Cuthill-McKee ordering of the graph connecting the dofs sharing a triangle.
+    :param np.ndarray local_to_global: (n_triangles, 12) local to global map
+    :param int dimension: number of dofs
+    :param str method: 'rcm'
+    :return: (dimension, ) array holding the current index of each dof in the new order
+    """
+
+    if method != 'rcm':
+        raise ValueError('Unknown dof reordering {}'.format(method))
+
+    local_to_global = np.asarray(local_to_global, dtype=np.int64)
+    rows = np.repeat(local_to_global, 12, axis=1).ravel()
+    cols = np.tile(local_to_global, (1, 12)).ravel()
+    graph = sps.csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(dimension, dimension))
+
+    return reverse_cuthill_mckee(graph, symmetric_mode=True).astype(np.int64)
 
 
 def local_to_global(vertices, connectivity_matrix):
     """
-    Computes the local to global map for the C^1 hermite global basis on PS12-split of a triangulation.
+    Computes the local to global map for the C^1 hermite global basis on PS12-split of a triangulation,
+    numbering the dofs in the order they are first visited.
     :param np.ndarray vertices: array of points
     :param np.ndarray connectivity_matrix: array of vertex indices
     :return dict:
     """
 
-    local_to_global_map = {}
-    visited_vertices = {}
-    visited_edges = {}
+    n_vertices = len(vertices)
+    edge_keys, triangle_edges = unique_edges(connectivity_matrix, n_vertices)
+    local_to_global_map, dof_to_vertex, dof_to_edge = dof_numbering(connectivity_matrix, triangle_edges, n_vertices,
+                                                                    len(edge_keys), numbering='legacy')
 
     # these two dictionaries map global dof to edge or vertex.
-    edge_dof_map = {}
-    vertex_dof_map = {}
-
-    global_dof_number = 0
-    for k, t in enumerate(connectivity_matrix):
-
-        edges = [tuple([int(t[i]), int(t[(i + 1) % 3])]) for i in range(3)]
-        local_indices = []
-
-        for edge in edges:
-            if edge[0] not in visited_vertices:
-                local_indices += [global_dof_number, global_dof_number + 1, global_dof_number + 2]
-                visited_vertices[edge[0]] = [global_dof_number, global_dof_number + 1, global_dof_number + 2]
-                for vertex_dof in visited_vertices[edge[0]]:
-                    vertex_dof_map[vertex_dof] = edge[0]
-                global_dof_number += 3
-            else:
-                local_indices += visited_vertices[edge[0]]
-
-            oriented_edge = tuple(sorted(edge))
-            if oriented_edge not in visited_edges:
-                local_indices.append(global_dof_number)
-                visited_edges[oriented_edge] = global_dof_number
-                edge_dof_map[global_dof_number] = oriented_edge
-                global_dof_number += 1
-            else:
-                local_indices.append(visited_edges[oriented_edge])
-        local_to_global_map[k] = local_indices
-
-    return local_to_global_map, edge_dof_map, vertex_dof_map
+    edge_dofs = np.flatnonzero(dof_to_edge >= 0)
+    edge_keys = edge_keys[dof_to_edge[edge_dofs]]
+    edge_dof_map = {dof: (a, b) for dof, a, b in zip(edge_dofs.tolist(), (edge_keys // n_vertices).tolist(),
+                                                    (edge_keys % n_vertices).tolist())}
+    vertex_dofs = np.flatnonzero(dof_to_vertex >= 0)
+    vertex_dof_map = dict(zip(vertex_dofs.tolist(), dof_to_vertex[vertex_dofs].tolist()))
+
+    return dict(enumerate(local_to_global_map.tolist())), edge_dof_map, vertex_dof_map
 
 
 def unit_square_uniform(n):
-    vertices = np.array([
-        [x, y]
-        for x in np.linspace(0, 1, n)
-        for y in np.linspace(0, 1, n)
-    ])
-
-    triangles = []
-    for i in range(n - 1):
-        for j in range(n - 1):
-            triangles.append([n * j + i, n * j + i + 1, n * j + i + n])
-            triangles.append([n * j + i + 1, n * j + 1 + n + i, n * j + i + n])
-
-    return Mesh(vertices, np.array(triangles))
\ No newline at end of file
+    """
+    Uniform mesh of the unit square with n vertices along each side.
+    :param int n: number of vertices along each side
+    :return: Mesh
+    """
+
+    return rectangle_uniform(n - 1, n - 1)
+
+
+def _rectangle_topology(nx, ny):
+    """
+    Computes the triangles of a grid of nx by ny cells, each split by its anti-diagonal, together with the
+    edges in lexicographic order. Vertex (i, j) of the grid has index i * (ny + 1) + j, so the edges from
+    vertex a to higher numbered vertices are, in order, the vertical edge to a + 1, the diagonal to a + ny
+    and the horizontal edge to a + ny + 1.
+    :return: triangles (2 * nx * ny, 3), edge vertices (n_edges, 2) and triangle edges (2 * nx * ny, 3)
+    """
+
+    i, j = np.meshgrid(np.arange(nx + 1), np.arange(ny + 1), indexing='ij')
+    exists = np.stack([j < ny, (i < nx) & (j > 0), i < nx], axis=-1).reshape(-1, 3)
+
+    # edge index of each of the three candidate edges of each vertex, or -1
+    edge_index = np.where(exists, np.cumsum(exists.ravel()).reshape(-1, 3) - 1, -1).astype(np.int32)
+    a = np.repeat(np.arange((nx + 1) * (ny + 1), dtype=np.int32), 3).reshape(-1, 3)
+    b = a + np.array([1, ny, ny + 1], dtype=np.int32)
+    edge_vertices = np.stack([a[exists], b[exists]], axis=1)
+
+    # cells ordered with the y index outermost, each split into triangles (A, B, C) and (B, D, C)
+    cj, ci = np.meshgrid(np.arange(ny), np.arange(nx), indexing='ij')
+    A = (ci * (ny + 1) + cj).astype(np.int32).ravel()
+    B, C = A + 1, A + ny + 1
+    D = C + 1
+
+    triangles = np.stack([np.stack([A, B, C], axis=1), np.stack([B, D, C], axis=1)], axis=1).reshape(-1, 3)
+    triangle_edges = np.stack([
+        np.stack([edge_index[A, 0], edge_index[B, 1], edge_index[A, 2]], axis=1),
+        np.stack([edge_index[B, 2], edge_index[C, 0], edge_index[B, 1]], axis=1)
+    ], axis=1).reshape(-1, 3)
+
+    return triangles, edge_vertices, triangle_edges
+
+
+def _grid_vertices(x, y):
+    return np.stack(np.meshgrid(x, y, indexing='ij'), axis=-1).reshape(-1, 2)
+
+
+def rectangle_uniform(nx, ny, xmin=0.0, xmax=1.0, ymin=0.0, ymax=1.0):
+    """
+    Uniform mesh of a rectangle with nx by ny cells, each split into two triangles.
+    :param int nx: number of cells along the x-axis
+    :param int ny: number of cells along the y-axis
+    :return: Mesh
+    """
+
+    triangles, edge_vertices, triangle_edges = _rectangle_topology(nx, ny)
+    vertices = _grid_vertices(np.linspace(xmin, xmax, nx + 1), np.linspace(ymin, ymax, ny + 1))
+
+    return Mesh(vertices, triangles, edges=(edge_vertices, triangle_edges))
+
+
+def graded_unit_square(n, grading=2.0, toward='corner'):
+    """
+    Mesh of the unit square with n vertices along each side, graded toward the corner (0, 0) or toward the
+    boundary x = 0. A point at distance r from the corner, in the maximum norm, or from the boundary, is moved
+    to distance r ** grading, keeping the topology of unit_square_uniform(n).
+    :param int n: number of vertices along each side
+    :param float grading: grading exponent, 1 giving the uniform mesh
+    :param str toward: 'corner' or 'boundary'
+    :return: Mesh
+    """
+
+    triangles, edge_vertices, triangle_edges = _rectangle_topology(n - 1, n - 1)
+    vertices = _grid_vertices(np.linspace(0, 1, n), np.linspace(0, 1, n))
+
+    if toward == 'corner':
+        r = np.max(vertices, axis=1, keepdims=True)
+        vertices = vertices * np.where(r > 0, r, 1) ** (grading - 1)
+    elif toward == 'boundary':
+        vertices[:, 0] **= grading
+    else:
+        raise ValueError('Unknown grading direction {}'.format(toward))
+
+    return Mesh(vertices, triangles, edges=(edge_vertices, triangle_edges))
+
+
+def l_shape_uniform(n):
+    """
+    Uniform mesh of the L-shaped domain [-1, 1]^2 without the quadrant (0, 1]^2, with n cells along each unit
+    length.
+    :param int n: number of cells along each unit length
+    :return: Mesh
+    """
+
+    triangles, edge_vertices, triangle_edges = _rectangle_topology(2 * n, 2 * n)
+    vertices = _grid_vertices(np.linspace(-1, 1, 2 * n + 1), np.linspace(-1, 1, 2 * n + 1))
+
+    # drop the triangles of the cells in the upper right quadrant
+    cj, ci = np.meshgrid(np.arange(2 * n), np.arange(2 * n), indexing='ij')
+    keep = np.repeat(((ci < n) | (cj < n)).ravel(), 2)
+    triangles, triangle_edges = triangles[keep], triangle_edges[keep]
+
+    # renumber the remaining vertices and edges. The renumbering is increasing, so the edges stay sorted.
+    used_vertices = np.zeros(len(vertices), dtype=bool)
+    used_vertices[triangles] = True
+    vertex_numbers = (np.cumsum(used_vertices) - 1).astype(np.int32)
+    used_edges = np.zeros(len(edge_vertices), dtype=bool)
+    used_edges[triangle_edges] = True
+    edge_numbers = (np.cumsum(used_edges) - 1).astype(np.int32)
+
+    return Mesh(vertices[used_vertices], vertex_numbers[triangles],
+                edges=(vertex_numbers[edge_vertices[used_edges]], edge_numbers[triangle_edges]))
@@ -0,0 +1,126 @@
+import contextlib
+import time
+import tracemalloc
+
+# the profiler collecting phase statistics, if any, see Profiler
+_active_profiler = None
+
+_disabled = contextlib.nullcontext()
+
+
+class PhaseStats(object):
+    """
+    Accumulated statistics of one phase: number of calls, total wall time in seconds and, if memory is traced,
+    the largest increase of traced memory in bytes over a call.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.time = 0.0
+        self.peak_memory = None
+
+    def as_dict(self):
+        return dict(calls=self.calls, time=self.time, peak_memory=self.peak_memory)
+
+    def __repr__(self):
+        return 'PhaseStats({}, calls={}, time={:.6f}, peak_memory={})'.format(self.name, self.calls, self.time,
+                                                                            self.peak_memory)
+
+
+class Profiler(object):
+    """
+    Collects wall time, call counts and optionally memory of the phases of mesh setup, assembly and solve
+    while active:
+
+        with Profiler() as profiler:
+            solve(a, L, V)
+        print(profiler.stats['factorization'].time)
+
+    The phases recorded are dof_numbering, basis_construction, sparsity_pattern, element_integration, scatter,
+    boundary_reduction, factorization and back_substitution. When no profiler is active, entering a phase
+    costs a single global lookup.
+    """
+
+    def __init__(self, memory=False, callback=None):
+        """
+        :param bool memory: whether to trace memory with tracemalloc, which slows down allocations. Peaks of
+        nested phases are only approximate, as each phase resets the traced peak.
+        :param callable callback: called as callback(name, seconds) at the end of each phase
+        """
+
+        self.memory = memory
+        self.callback = callback
+        self.stats = {}
+        self._previous = None
+        self._started_tracing = False
+
+    def __enter__(self):
+        global _active_profiler
+        self._previous, _active_profiler = _active_profiler, self
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        return self
+
+    def __exit__(self, *exc_info):
+        global _active_profiler
+        _active_profiler = self._previous
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        """
+        Measures one call of the named phase.
+        :param str name: name of the phase
+        """
+
+        stats = self.stats.setdefault(name, PhaseStats(name))
+        if self.memory:
+            memory_start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            elapsed = time.perf_counter() - start
+            stats.calls += 1
+            stats.time += elapsed
+            if self.memory:
+                increase = tracemalloc.get_traced_memory()[1] - memory_start
+                stats.peak_memory = max(stats.peak_memory or 0, increase)
+            if self.callback is not None:
+                self.callback(name, elapsed)
+
+    def as_dict(self):
+        """
+        :return: dictionary mapping phase names to dictionaries of statistics
+        """
+
+        return {name: stats.as_dict() for name, stats in self.stats.items()}
+
+    def report(self):
+        """
+        :return: the statistics formatted as a table
+        """
+
+        lines = ['{:20s} {:>8s} {:>12s} {:>14s}'.format('phase', 'calls', 'time [s]', 'memory [B]')]
+        for name, stats in self.stats.items():
+            memory = '' if stats.peak_memory is None else str(stats.peak_memory)
+            lines.append('{:20s} {:8d} {:12.6f} {:>14s}'.format(name, stats.calls, stats.time, memory))
+        return '\n'.join(lines)
+
+
+def phase(name):
+    """
+    Returns a context manager measuring the named phase with the active profiler, or doing nothing if no
+    profiler is active.
+    :param str name: name of the phase
+    """
+
+    if _active_profiler is None:
+        return _disabled
+    return _active_profiler.measure(name)
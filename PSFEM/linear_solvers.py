@@ -0,0 +1,186 @@
+import warnings
+
+import numpy as np
+import scipy.sparse as sps
+import scipy.sparse.linalg as spla
+
+
+class DirectSolver(object):
+    """
+    Solves the linear system by a sparse LU factorization, computed once in setup and reused for every right
+    hand side.
+    """
+
+    def __init__(self):
+        self.factorization = None
+
+    def setup(self, A):
+        """
+        :param sps.spmatrix A: system matrix
+        """
+
+        self.factorization = spla.splu(sps.csc_matrix(A))
+
+    def solve(self, b, x0=None):
+        """
+        :param np.ndarray b: (n, ) right hand side, or (n, k) array of k right hand sides
+        :param np.ndarray x0: initial guess, ignored
+        :return: np.ndarray of the same shape as b
+        """
+
+        return self.factorization.solve(b)
+
+
+class ConjugateGradientSolver(object):
+    """
+    Solves symmetric positive definite systems by the preconditioned conjugate gradient method, avoiding the
+    fill-in of a direct factorization. The residual norms of the last solve are kept in residual_history,
+    one list per right hand side.
+
+    Available preconditioners are
+        None: no preconditioning
+        'jacobi': the inverse diagonal, which also balances the differently scaled value and derivative dofs
+        'ichol': a threshold incomplete Cholesky factorization, see incomplete_cholesky
+        'amg': smoothed aggregation algebraic multigrid, requires pyamg
+    """
+
+    def __init__(self, preconditioner='jacobi', tol=1e-10, maxiter=None, drop_tol=1e-4, fill_factor=10):
+        """
+        :param preconditioner: None, 'jacobi', 'ichol' or 'amg'
+        :param float tol: relative tolerance on the residual norm
+        :param int maxiter: maximal number of iterations, the system size by default
+        :param float drop_tol: drop tolerance of the incomplete factorization
+        :param float fill_factor: fill factor of the incomplete factorization
+        """
+
+        if preconditioner not in (None, 'jacobi', 'ichol', 'amg'):
+            raise ValueError('Unknown preconditioner {}'.format(preconditioner))
+
+        self.preconditioner = preconditioner
+        self.tol = tol
+        self.maxiter = maxiter
+        self.drop_tol = drop_tol
+        self.fill_factor = fill_factor
+        self.residual_history = []
+
+    def setup(self, A):
+        """
+        :param A: symmetric positive definite system matrix, as sps.spmatrix or as a LinearOperator with a diagonal
+        method such as PSFEM.assembly.MatrixFreeOperator, for which only the 'jacobi' preconditioner is available
+        """
+
+        if sps.issparse(A):
+            self.A = sps.csr_matrix(A)
+        elif self.preconditioner in ('ichol', 'amg'):
+            raise ValueError('The {} preconditioner requires an assembled matrix'.format(self.preconditioner))
+        else:
+            self.A = A
+
+        if self.preconditioner is None:
+            self.M = lambda r: r
+        elif self.preconditioner == 'jacobi':
+            inverse_diagonal = 1 / self.A.diagonal()
+            self.M = lambda r: inverse_diagonal * r
+        elif self.preconditioner == 'ichol':
+            self.M = incomplete_cholesky(self.A, drop_tol=self.drop_tol, fill_factor=self.fill_factor)
+        else:
+            try:
+                import pyamg
+            except ImportError:
+                raise ImportError('The amg preconditioner requires pyamg')
+            self.M = pyamg.smoothed_aggregation_solver(self.A, symmetry='symmetric').aspreconditioner().matvec
+
+    def solve(self, b, x0=None):
+        """
+        :param np.ndarray b: (n, ) right hand side, or (n, k) array of k right hand sides
+        :param np.ndarray x0: initial guess of the same shape as b, such as a solution on a coarser mesh
+        prolongated to this one. Zero if None.
+        :return: np.ndarray of the same shape as b
+        """
+
+        b = np.asarray(b, dtype=float)
+        columns = b.reshape(len(b), -1).T
+        guesses = np.zeros_like(columns) if x0 is None else np.asarray(x0, dtype=float).reshape(len(b), -1).T
+
+        x = np.zeros_like(columns)
+        self.residual_history = []
+        for i, column in enumerate(columns):
+            x[i], history = self._solve_column(column, guesses[i])
+            self.residual_history.append(history)
+
+        return x.T.reshape(b.shape)
+
+    def _solve_column(self, b, x0):
+        A, M = self.A, self.M
+        maxiter = self.maxiter if self.maxiter is not None else A.shape[0]
+
+        x = x0.copy()
+        r = b - A.dot(x)
+        z = M(r)
+        p = z.copy()
+        rz = np.dot(r, z)
+
+        tolerance = self.tol * np.linalg.norm(b)
+        history = [np.linalg.norm(r)]
+
+        for _ in range(maxiter):
+            if history[-1] <= tolerance:
+                break
+
+            Ap = A.dot(p)
+            alpha = rz / np.dot(p, Ap)
+            x += alpha * p
+            r -= alpha * Ap
+            history.append(np.linalg.norm(r))
+
+            z = M(r)
+            rz, rz_previous = np.dot(r, z), rz
+            p = z + (rz / rz_previous) * p
+        else:
+            if history[-1] > tolerance:
+                warnings.warn('Conjugate gradients did not converge in {} iterations, residual norm {:.3e}'
+                              .format(maxiter, history[-1]), RuntimeWarning)
+
+        return x, history
+
+
+def incomplete_cholesky(A, drop_tol=1e-4, fill_factor=10, shifts=(0, 1e-3, 1e-2, 1e-1)):
+    """
+    Computes a threshold incomplete Cholesky factorization P^T D A D P ~ L diag(d) L^T of the symmetrically
+    diagonally scaled matrix, from the incomplete LU factorization of SuperLU run with a symmetric ordering and
+    without pivoting or equilibration, in which case U = diag(d) L^T up to dropping. If a non-positive pivot
+    occurs, the factorization is repeated for the diagonally shifted matrix D A D + shift * I.
+    :param sps.spmatrix A: symmetric positive definite matrix
+    :param float drop_tol: drop tolerance of the incomplete factorization
+    :param float fill_factor: fill factor of the incomplete factorization
+    :param tuple shifts: diagonal shifts to attempt in turn
+    :return: callable applying the inverse of the factorization to a vector
+    """
+
+    scaling = 1 / np.sqrt(A.diagonal())
+    A_scaled = sps.csc_matrix(sps.diags(scaling) @ A @ sps.diags(scaling))
+    identity = sps.identity(A.shape[0], format='csc')
+
+    for shift in shifts:
+        factorization = spla.spilu(A_scaled + shift * identity, drop_tol=drop_tol, fill_factor=fill_factor,
+                                   permc_spec='MMD_AT_PLUS_A', diag_pivot_thresh=0,
+                                   options=dict(Equil=False, SymmetricMode=True))
+        pivots = factorization.U.diagonal()
+        if np.all(pivots > 0):
+            break
+    else:
+        raise ValueError('Incomplete Cholesky factorization failed, the matrix is not positive definite')
+
+    # the factorization is of A_scaled[permutation][:, permutation]. SuperLU with the natural ordering solves
+    # the triangular systems without creating fill.
+    permutation = np.argsort(factorization.perm_c)
+    L = factorization.L
+    lower = spla.splu(sps.csc_matrix(L), permc_spec='NATURAL', diag_pivot_thresh=0, options=dict(Equil=False))
+    upper = spla.splu(sps.csc_matrix(L.T), permc_spec='NATURAL', diag_pivot_thresh=0, options=dict(Equil=False))
+
+    def apply(r):
+        z = np.empty_like(r)
+        z[permutation] = upper.solve(lower.solve((scaling * r)[permutation]) / pivots)
+        return scaling * z
+
+    return apply
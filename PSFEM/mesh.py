@@ -1,7 +1,8 @@
-import itertools
+from collections.abc import Mapping
 
 import numpy as np
-from SSplines.helper_functions import barycentric_coordinates
+
+from PSFEM.tabulation import affine_maps
 
 
 class Mesh(object):
@@ -10,18 +11,41 @@ class Mesh(object):
     represents the corresponding mesh.
     """
 
-    def __init__(self, vertices, connectivity_matrix):
+    # the arrays computed by _generate_data, see PSFEM.storage
+    TOPOLOGY = ('edge_vertices', 'triangle_edges', 'vertex_triangle_offsets', 'vertex_triangles',
+                'edge_triangle_offsets', 'edge_triangles', 'is_boundary_edge', 'is_boundary_vertex',
+                'triangle_neighbours')
+
+    def __init__(self, vertices, connectivity_matrix, edges=None, topology=None):
         """
         Initialize a mesh with connectivity matrix and vertices.
         :param np.ndarray vertices: vertex coordinates
         :param np.ndarray connectivity_matrix: vertex indices
+        :param tuple edges: optional precomputed edges, as a pair of the (n_edges, 2) sorted vertices of the unique
+        edges in lexicographic order and the (n_triangles, 3) edge indices of the local edges (t0, t1), (t1, t2),
+        (t2, t0), as computed by unique_edges. Mesh generators with known topology pass these to skip the sort.
+        :param dict topology: optional precomputed topology, mapping each name in Mesh.TOPOLOGY to its array, as
+        loaded by PSFEM.storage.load_mesh
         """
 
         self.vertices = vertices
         self.triangles = connectivity_matrix
 
-        self._generate_data()
+        if topology is not None:
+            self._restore_data(topology)
+        else:
+            self._generate_data(edges)
         self._compute_h()
+        self._bucket_index = None
+
+        # set by refine: the mesh this one was refined from, and the triangle of it containing each triangle
+        self.parent = None
+        self.parent_triangles = None
+        # whether the first vertex of each triangle is its newest vertex, see refine
+        self.newest_vertex_first = False
+        # set by reorder: the original index of each vertex and triangle
+        self.vertex_permutation = None
+        self.triangle_permutation = None
 
     def interior_vertices(self):
         return self.int_vertices
@@ -60,11 +84,8 @@ class Mesh(object):
         :return: list of the triangles
         """
 
-        triangle_idx = []
-        for k in range(len(self.triangles)):
-            if vertex_index in self.triangles[k]:
-                triangle_idx.append(k)
-        return triangle_idx
+        start, stop = self.vertex_triangle_offsets[vertex_index:vertex_index + 2]
+        return self.vertex_triangles[start:stop].tolist()
 
     def adjacent_triangles(self, edge_index):
         """
@@ -73,72 +94,523 @@ class Mesh(object):
         :return: list of triangles sharing edge.
         """
 
-        edge = self.edge_vertices[edge_index]
-        triangle_idx = []
-        for k in range(len(self.triangles)):
-            if edge[0] in self.triangles[k] and edge[1] in self.triangles[k]:
-                triangle_idx.append(k)
-        return triangle_idx
+        start, stop = self.edge_triangle_offsets[edge_index:edge_index + 2]
+        return self.edge_triangles[start:stop].tolist()
 
     def _compute_h(self):
         """
         Computes the max, min and average triangle side-length in the mesh.
         """
 
-        edge_lengths = np.zeros(len(self.edges))
+        edge_coords = self.vertices[self.edge_vertices]
+        edge_lengths = np.linalg.norm(edge_coords[:, 1] - edge_coords[:, 0], axis=1)
 
-        for e in self.edges:
-            i, j = self.edge_vertices[e]
-            v1, v2 = self.vertices[[i, j], :]
-            edge_lengths[e] = np.sqrt((v2[0] - v1[0]) ** 2 + (v2[1] - v1[1]) ** 2)
-
-        self.h_max = max(edge_lengths)
-        self.h_min = min(edge_lengths)
+        self.h_max = np.max(edge_lengths)
+        self.h_min = np.min(edge_lengths)
         self.h_avg = np.average(edge_lengths)
 
-    def _generate_data(self):
+    def _generate_data(self, edges=None):
+
+        triangles = np.asarray(self.triangles)
+        n_vertices = len(self.vertices)
 
-        # unique edges in the mesh
-        self.edge_vertices = np.array(list(set(tuple(sorted(edge))
-                                               for triangle in self.triangles
-                                               for edge in itertools.combinations(triangle, 2))))
+        if edges is None:
+            edge_keys, self.triangle_edges = unique_edges(triangles, n_vertices)
+            self.edge_vertices = np.stack([edge_keys // n_vertices, edge_keys % n_vertices], axis=1)
+        else:
+            self.edge_vertices, self.triangle_edges = edges
+            edge_keys = self.edge_vertices[:, 0].astype(np.int64) * n_vertices + self.edge_vertices[:, 1]
 
         # edge to edge_index map - edges with reverse orientation map to same index
-        self.edge_indices = {tuple(edge): i
-                             for i, edge_ in enumerate(self.edge_vertices)
-                             for edge in (edge_, reversed(edge_))}
+        self.edge_indices = EdgeIndexMap(edge_keys, n_vertices)
+
+        # CSR-style vertex -> triangle and edge -> triangle incidence tables
+        self.vertex_triangle_offsets, self.vertex_triangles = _incidence(triangles, n_vertices)
+        self.edge_triangle_offsets, self.edge_triangles = _incidence(self.triangle_edges, len(self.edge_vertices))
 
-        # list of boundary edges
-        self.bnd_edges = sorted([self.edge_indices[tuple(edge)] for edge in self.edge_vertices
-                          if len(self.adjacent_triangles(self.edge_indices[tuple(edge)])) == 1])
+        # boundary edges are those with a single adjacent triangle
+        self.is_boundary_edge = np.diff(self.edge_triangle_offsets) == 1
+        self.is_boundary_vertex = np.zeros(n_vertices, dtype=bool)
+        self.is_boundary_vertex[self.edge_vertices[self.is_boundary_edge]] = True
+
+        # the triangle across each local edge, or -1 on the boundary
+        first = self.edge_triangles[self.edge_triangle_offsets[:-1]]
+        last = self.edge_triangles[self.edge_triangle_offsets[1:] - 1]
+        k = np.arange(len(triangles))[:, None]
+        self.triangle_neighbours = np.where(self.is_boundary_edge[self.triangle_edges], -1,
+                                            first[self.triangle_edges] + last[self.triangle_edges] - k)
+
+        self._generate_lists()
+
+    def _restore_data(self, topology):
+        """
+        Sets the arrays otherwise computed by _generate_data from precomputed ones.
+        :param dict topology: arrays keyed by the names in Mesh.TOPOLOGY
+        """
 
-        # list of boundary vertices
-        self.bnd_vertices = sorted(list(set([vertex
-                             for edge in self.bnd_edges
-                             for vertex in self.edge_vertices[edge]])))
+        for name in self.TOPOLOGY:
+            setattr(self, name, topology[name])
 
-        self.int_edges = [self.edge_indices[tuple(edge)] for edge in self.edge_vertices
-                          if self.edge_indices[tuple(edge)] not in self.bnd_edges]
+        n_vertices = len(self.vertices)
+        edge_keys = self.edge_vertices[:, 0].astype(np.int64) * n_vertices + self.edge_vertices[:, 1]
+        self.edge_indices = EdgeIndexMap(edge_keys, n_vertices)
 
-        self.int_vertices = [vertex_id for vertex_id in range(len(self.vertices)) if vertex_id not in self.bnd_vertices]
+        self._generate_lists()
+
+    def _generate_lists(self):
+        # lists of boundary and interior vertices and edges
+        self.bnd_edges = np.flatnonzero(self.is_boundary_edge).tolist()
+        self.bnd_vertices = np.flatnonzero(self.is_boundary_vertex).tolist()
+        self.int_edges = np.flatnonzero(~self.is_boundary_edge).tolist()
+        self.int_vertices = np.flatnonzero(~self.is_boundary_vertex).tolist()
 
         self.edges = self.bnd_edges + self.int_edges
 
-    def find_triangle(self, x):
+    def reorder(self, curve='hilbert'):
+        """
+        Renumbers the vertices and the triangles in the order of their positions, respectively of the centroids,
+        along a space filling curve, so that nearby vertices and triangles, and the dofs numbered from them, are
+        close in memory. The orientation and vertex order of each triangle are preserved.
+        The reordered mesh records the original index of each vertex as vertex_permutation and of each triangle as
+        triangle_permutation, so that values v_new at the reordered vertices are v_new = v[vertex_permutation].
+        :param str curve: 'hilbert' or 'morton', see space_filling_curve_keys
+        :return: the reordered Mesh
+        """
+
+        vertices = np.asarray(self.vertices)
+        triangles = np.asarray(self.triangles)
+
+        vertex_permutation = np.argsort(space_filling_curve_keys(vertices, curve), kind='stable')
+        triangle_permutation = np.argsort(space_filling_curve_keys(np.mean(vertices[triangles], axis=1), curve),
+                                          kind='stable')
+        new_index = np.empty_like(vertex_permutation)
+        new_index[vertex_permutation] = np.arange(len(vertex_permutation))
+
+        mesh = Mesh(vertices[vertex_permutation], new_index[triangles[triangle_permutation]].astype(triangles.dtype))
+        mesh.vertex_permutation = vertex_permutation
+        mesh.triangle_permutation = triangle_permutation
+        mesh.newest_vertex_first = self.newest_vertex_first
+        if self.parent is not None:
+            mesh.parent = self.parent
+            mesh.parent_triangles = self.parent_triangles[triangle_permutation]
+        return mesh
+
+    def refine(self, marked=None):
+        """
+        Refines the mesh, either uniformly by splitting every triangle into four through its edge midpoints, or
+        by newest vertex bisection of the marked triangles, followed by the bisection of neighbouring triangles
+        needed to keep the mesh conforming. In bisection, the first vertex of each triangle is its newest vertex
+        and the opposite edge is the one bisected. For meshes not produced by bisection, the vertices are first
+        rotated so that the longest edge of each triangle is bisected.
+        The refined mesh records the mesh it was refined from as parent, and the triangle containing each of its
+        triangles as parent_triangles, see CompositeSplineSpace.prolongation.
+        Both refinements carry the edge table over from the parent, so the edges of the refined mesh are not
+        searched for again: unrefined edges are kept, and only the halves of refined edges and the edges created
+        inside refined triangles are added. The incidence tables, boundary flags and mesh sizes h_max, h_min and
+        h_avg are however recomputed by the constructor from the edge table, in vectorized passes over the whole
+        refined mesh rather than updated for the refined triangles only.
+        :param marked: indices or boolean mask of the triangles to bisect, or None to refine uniformly
+        :return: the refined Mesh
+        """
+
+        if marked is None:
+            vertices, triangles, parents, edges = self._refine_uniformly()
+        else:
+            vertices, triangles, parents, edges = self._bisect(marked)
+
+        mesh = Mesh(vertices, triangles, edges)
+        mesh.parent = self
+        mesh.parent_triangles = parents
+        mesh.newest_vertex_first = marked is not None
+        return mesh
+
+    def _refine_uniformly(self):
+        """
+        Splits each triangle (t0, t1, t2) with edge midpoints m01, m12, m20 into (t0, m01, m20), (m01, t1, m12),
+        (m20, m12, t2) and (m01, m12, m20), numbered 4k, ..., 4k + 3 for triangle k. The midpoint of edge e is
+        vertex n_vertices + e. Every new edge is either half of an old edge or joins two midpoints of one
+        triangle, so the edge table of the refined mesh is known without searching for duplicates.
+        :return: vertices, triangles, parent triangles, and edges as accepted by the constructor
+        """
+
+        n_vertices, n_edges, n_triangles = len(self.vertices), len(self.edge_vertices), len(self.triangles)
+        triangles = np.asarray(self.triangles, dtype=np.int64)
+        edge_vertices = np.asarray(self.edge_vertices, dtype=np.int64)
+        te = self.triangle_edges
+
+        vertices = np.concatenate([self.vertices, np.mean(self.vertices[edge_vertices], axis=1)])
+        midpoints = n_vertices + te
+        t0, t1, t2 = triangles.T
+        m01, m12, m20 = midpoints.T
+
+        children = np.stack([
+            np.stack([t0, m01, m20], axis=1),
+            np.stack([m01, t1, m12], axis=1),
+            np.stack([m20, m12, t2], axis=1),
+            np.stack([m01, m12, m20], axis=1),
+        ], axis=1).reshape(-1, 3)
+
+        # new edges: the halves (a, m) and (b, m) of each old edge (a, b), then the three midpoint segments
+        # (m01, m12), (m12, m20), (m20, m01) of each triangle
+        midpoint_edges = np.stack([m01, m12, m12, m20, m20, m01], axis=1).reshape(-1, 2)
+        new_edges = np.concatenate([
+            np.stack([edge_vertices[:, 0], n_vertices + np.arange(n_edges)], axis=1),
+            np.stack([edge_vertices[:, 1], n_vertices + np.arange(n_edges)], axis=1),
+            np.sort(midpoint_edges, axis=1),
+        ])
+        keys = new_edges[:, 0] * len(vertices) + new_edges[:, 1]
+        order = np.argsort(keys)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+
+        def half(e, v):
+            # index of the half of old edge e containing vertex v
+            return rank[np.where(edge_vertices[e, 0] == v, e, n_edges + e)]
+
+        s = rank[2 * n_edges + 3 * np.arange(n_triangles)[:, None] + np.arange(3)]
+        e01, e12, e20 = te.T
+        triangle_edges = np.stack([
+            np.stack([half(e01, t0), s[:, 2], half(e20, t0)], axis=1),
+            np.stack([half(e01, t1), half(e12, t1), s[:, 0]], axis=1),
+            np.stack([s[:, 1], half(e12, t2), half(e20, t2)], axis=1),
+            s,
+        ], axis=1).reshape(-1, 3)
+
+        parents = np.repeat(np.arange(n_triangles), 4)
+        return vertices, children, parents, (new_edges[order], triangle_edges)
+
+    def _bisect(self, marked):
+        """
+        Newest vertex bisection of the marked triangles and the closure keeping the mesh conforming. Edges are
+        tracked through the bisections: a marked edge is replaced by its two halves, and bisecting a triangle adds
+        the edge from the midpoint to the opposite vertex, shared by the two children.
+        :return: vertices, triangles, parent triangles, and edges as accepted by the constructor
+        """
+
+        triangles = np.asarray(self.triangles, dtype=np.int64)
+        triangle_edges = np.asarray(self.triangle_edges, dtype=np.int64)
+        n_vertices, n_edges = len(self.vertices), len(self.edge_vertices)
+
+        if not self.newest_vertex_first:
+            # rotate each triangle so that its longest edge is (t1, t2), preserving the orientation
+            lengths = np.linalg.norm(self.vertices[self.edge_vertices[:, 1]] - self.vertices[self.edge_vertices[:, 0]],
+                                     axis=1)[triangle_edges]
+            shift = (np.argmax(lengths, axis=1) + 2) % 3
+            roll = (np.arange(3) + shift[:, None]) % 3
+            triangles = np.take_along_axis(triangles, roll, axis=1)
+            triangle_edges = np.take_along_axis(triangle_edges, roll, axis=1)
+
+        # closure: every triangle with a marked edge has its refinement edge (t1, t2) marked
+        is_marked = np.zeros(n_edges, dtype=bool)
+        is_marked[triangle_edges[marked, 1]] = True
+        while True:
+            missing = np.any(is_marked[triangle_edges], axis=1) & ~is_marked[triangle_edges[:, 1]]
+            if not np.any(missing):
+                break
+            is_marked[triangle_edges[missing, 1]] = True
+
+        # the midpoint of the i-th marked edge (a, b) becomes vertex n_vertices + i, and its halves (a, m) and
+        # (b, m) edges n_edges + 2i and n_edges + 2i + 1
+        marked_edges = np.flatnonzero(is_marked)
+        midpoint = np.full(n_edges, -1, dtype=np.int64)
+        midpoint[marked_edges] = n_vertices + np.arange(len(marked_edges))
+        half = np.full(n_edges, -1, dtype=np.int64)
+        half[marked_edges] = n_edges + 2 * np.arange(len(marked_edges))
+        vertices = np.concatenate([self.vertices, np.mean(self.vertices[self.edge_vertices[marked_edges]], axis=1)])
+
+        ends = np.asarray(self.edge_vertices, dtype=np.int64)[marked_edges]
+        m = midpoint[marked_edges]
+        edge_vertices = [np.asarray(self.edge_vertices, dtype=np.int64),
+                         np.stack([ends, np.stack([m, m], axis=1)], axis=2).reshape(-1, 2)]
+        n_tracked = n_edges + 2 * len(marked_edges)
+
+        # edges of the local edges (t0, t1), (t1, t2), (t2, t0) of each triangle. Each triangle is bisected at
+        # most twice, as edges created by bisection are never marked.
+        parents = np.arange(len(triangles))
+        local_edges = triangle_edges
+        while True:
+            split = (local_edges[:, 1] < n_edges) & is_marked[np.minimum(local_edges[:, 1], n_edges - 1)]
+            if not np.any(split):
+                break
+
+            t0, t1, t2 = triangles[split].T
+            e01, e12, e20 = local_edges[split].T
+            m = midpoint[e12]
+            first_is_t1 = self.edge_vertices[e12, 0] == t1
+            h1 = np.where(first_is_t1, half[e12], half[e12] + 1)
+            h2 = np.where(first_is_t1, half[e12] + 1, half[e12])
+
+            # the bisecting edge (m, t0), shared by both children
+            bisectors = n_tracked + np.arange(len(m))
+            edge_vertices.append(np.sort(np.stack([m, t0], axis=1), axis=1))
+            n_tracked += len(m)
+
+            # children (m, t0, t1) and (m, t2, t0) take the place of their parent, in order
+            counts = 1 + split
+            position = np.cumsum(counts)[split] - 2
+            triangles = np.repeat(triangles, counts, axis=0)
+            local_edges = np.repeat(local_edges, counts, axis=0)
+            parents = np.repeat(parents, counts)
+            triangles[position] = np.stack([m, t0, t1], axis=1)
+            triangles[position + 1] = np.stack([m, t2, t0], axis=1)
+            local_edges[position] = np.stack([bisectors, e01, h1], axis=1)
+            local_edges[position + 1] = np.stack([h2, e20, bisectors], axis=1)
+
+        # drop the marked edges, which were replaced by their halves, and sort the rest lexicographically
+        edge_vertices = np.concatenate(edge_vertices)
+        kept = np.flatnonzero(np.concatenate([~is_marked, np.ones(n_tracked - n_edges, dtype=bool)]))
+        keys = edge_vertices[kept, 0] * len(vertices) + edge_vertices[kept, 1]
+        order = np.argsort(keys)
+        rank = np.full(n_tracked, -1, dtype=np.int64)
+        rank[kept[order]] = np.arange(len(kept))
+
+        return vertices, triangles, parents, (edge_vertices[kept[order]], rank[local_edges])
+
+    def bucket_index(self):
+        """
+        Returns the spatial index used for point location, building it on first use.
+        :return: BucketIndex
+        """
+
+        if self._bucket_index is None:
+            self._bucket_index = BucketIndex(self.vertices, self.triangles)
+        return self._bucket_index
+
+    def find_triangles(self, points):
+        """
+        Given a set of points, determine for each point x an index i such that x lies in triangle i.
+        A point on an edge shared by several triangles is assigned the one of lowest index.
+        :param np.ndarray points: (n, 2) points of interest
+        :return: (n, ) array of triangle indices, -1 for points outside the mesh
+        """
+
+        return self.bucket_index().locate(np.atleast_2d(points))
+
+    def find_triangle(self, x, previous=None, max_steps=None):
         """
         Given a point x in the domain of the triangulation, determine for which index i
-        the point x lies in triangle i.
+        the point x lies in triangle i. If the index of a nearby triangle is supplied, for instance the
+        triangle containing the previously located point, walks through the mesh from there instead of
+        searching it.
         :param np.ndarray x: point of interest
-        :return: index i such that x lies in T_i
+        :param int previous: triangle to start walking from
+        :param int max_steps: maximum number of steps to walk before searching the mesh, by default the
+        number of triangles.
+        :return: index i such that x lies in T_i, or -1 if x lies outside the mesh
         """
 
-        for k, T in enumerate(self.triangles):
-            vertices = self.vertices[T]
-            b = barycentric_coordinates(triangle=vertices, x=x)
+        x = np.reshape(x, (1, 2))
 
-            if np.all(b >= 0):
-                return k
-            else:
-                continue
+        if previous is not None and previous >= 0:
+            index = self.bucket_index()
+            k = previous
+            for _ in range(len(self.triangles) if max_steps is None else max_steps):
+                b = index.barycentric_coordinates(np.array([k]), x)[0]
+                if np.all(b >= -index.tol):
+                    return int(k)
+
+                # step across the edge opposite the vertex with most negative barycentric coordinate
+                k = self.triangle_neighbours[k, (np.argmin(b) + 1) % 3]
+                if k < 0:
+                    break
+
+        return int(self.find_triangles(x)[0])
+
+
+class BucketIndex(object):
+    """
+    Uniform bucket grid over the bounding box of a mesh, where each cell lists the triangles whose bounding
+    box overlaps it. Locating a point only tests the triangles listed in its cell.
+    """
+
+    def __init__(self, vertices, triangles, triangles_per_cell=1, tol=1.0E-12):
+        """
+        :param np.ndarray vertices: vertex coordinates
+        :param np.ndarray triangles: vertex indices
+        :param triangles_per_cell: average number of triangles per cell to aim for
+        :param tol: tolerance on barycentric coordinates for a point to lie in a triangle
+        """
+
+        coords = np.asarray(vertices, dtype=float)[np.asarray(triangles)]
+        self.tol = tol
+        self.origin = coords[:, 0]
+        self.K, _ = affine_maps(coords)
+
+        self.lower = np.min(coords, axis=(0, 1))
+        extent = np.max(coords, axis=(0, 1)) - self.lower
+        extent[extent == 0] = 1
+
+        n_cells = max(len(coords) / triangles_per_cell, 1)
+        cell_size = np.sqrt(extent[0] * extent[1] / n_cells)
+        self.shape = np.maximum(np.ceil(extent / cell_size), 1).astype(np.int64)
+        self.cell_size = extent / self.shape
+
+        # expand each triangle into the cells overlapped by its bounding box
+        lo = self._cell_coordinates(np.min(coords, axis=1))
+        hi = self._cell_coordinates(np.max(coords, axis=1))
+        width = hi[:, 0] - lo[:, 0] + 1
+        counts = width * (hi[:, 1] - lo[:, 1] + 1)
+
+        triangle_of = np.repeat(np.arange(len(coords)), counts)
+        r = np.arange(len(triangle_of)) - np.repeat(np.cumsum(counts) - counts, counts)
+        ix = lo[triangle_of, 0] + r % width[triangle_of]
+        iy = lo[triangle_of, 1] + r // width[triangle_of]
+        cells = ix * self.shape[1] + iy
+
+        order = np.argsort(cells, kind='stable')
+        self.cell_triangles = triangle_of[order]
+        self.cell_offsets = np.concatenate([[0], np.cumsum(np.bincount(cells, minlength=np.prod(self.shape)))])
+
+    def _cell_coordinates(self, points):
+        c = np.floor((points - self.lower) / self.cell_size).astype(np.int64)
+        return np.clip(c, 0, self.shape - 1)
+
+    def barycentric_coordinates(self, triangles, points):
+        """
+        Computes the barycentric coordinates of each point with respect to the corresponding triangle.
+        :param np.ndarray triangles: (n, ) triangle indices
+        :param np.ndarray points: (n, 2) points
+        :return: (n, 3) barycentric coordinates
+        """
+
+        b = np.einsum('ned,nd->ne', self.K[triangles], points - self.origin[triangles])
+        return np.column_stack([1 - b[:, 0] - b[:, 1], b])
+
+    def locate(self, points):
+        """
+        Finds the triangle of lowest index containing each point.
+        :param np.ndarray points: (n, 2) points
+        :return: (n, ) triangle indices, -1 for points in no triangle
+        """
+
+        points = np.asarray(points, dtype=float)
+        result = np.full(len(points), -1, dtype=np.int64)
+
+        # points outside the grid are clipped to the nearest cell, and rejected by the barycentric test
+        c = self._cell_coordinates(points)
+        queries = np.arange(len(points))
+        cells = c[:, 0] * self.shape[1] + c[:, 1]
+        counts = self.cell_offsets[cells + 1] - self.cell_offsets[cells]
+
+        # pair every point with each candidate triangle of its cell
+        query_of = np.repeat(queries, counts)
+        r = np.arange(len(query_of)) - np.repeat(np.cumsum(counts) - counts, counts)
+        candidates = self.cell_triangles[np.repeat(self.cell_offsets[cells], counts) + r]
+
+        b = self.barycentric_coordinates(candidates, points[query_of])
+        hit = np.all(b >= -self.tol, axis=1)
+
+        # candidates are sorted by triangle index, so the first hit of each point has the lowest index
+        hit_query, first = np.unique(query_of[hit], return_index=True)
+        result[hit_query] = candidates[hit][first]
+
+        return result
+
+
+class EdgeIndexMap(Mapping):
+    """
+    Read-only map from a pair of vertex indices to the index of the edge joining them, in either orientation.
+    Looks the edge up by bisection in the sorted edge keys rather than storing a dictionary entry per edge.
+    """
+
+    def __init__(self, edge_keys, n_vertices):
+        """
+        :param np.ndarray edge_keys: sorted keys v0 * n_vertices + v1, with v0 < v1, of each edge
+        :param int n_vertices: number of vertices in the mesh
+        """
+
+        self.edge_keys = edge_keys
+        self.n_vertices = n_vertices
+
+    def __getitem__(self, edge):
+        v0, v1 = sorted(edge)
+        key = v0 * self.n_vertices + v1
+        i = np.searchsorted(self.edge_keys, key)
+        if i == len(self.edge_keys) or self.edge_keys[i] != key:
+            raise KeyError(edge)
+        return int(i)
+
+    def __iter__(self):
+        for v0, v1 in zip((self.edge_keys // self.n_vertices).tolist(), (self.edge_keys % self.n_vertices).tolist()):
+            yield v0, v1
+            yield v1, v0
+
+    def __len__(self):
+        return 2 * len(self.edge_keys)
+
+
+def space_filling_curve_keys(points, curve='hilbert', bits=16):
+    """
+    Computes the position of each point along a space filling curve through the bounding box of the points,
+    discretized into a grid of 2^bits by 2^bits cells.
+    :param np.ndarray points: (n, 2) points
+    :param str curve: 'hilbert' for the Hilbert curve, or 'morton' for the Z-order curve, which is cheaper to compute
+    but jumps between distant cells
+    :param int bits: number of bits of each grid coordinate
+    :return: (n, ) array of int64 keys
+    """
+
+    points = np.asarray(points, dtype=float)
+    lower = np.min(points, axis=0)
+    extent = np.max(points, axis=0) - lower
+    extent[extent == 0] = 1
+
+    n = 1 << bits
+    x, y = np.minimum((points - lower) / extent * n, n - 1).astype(np.int64).T
+
+    keys = np.zeros(len(points), dtype=np.int64)
+    if curve == 'morton':
+        for i in range(bits):
+            keys |= ((x >> i) & 1) << (2 * i + 1) | ((y >> i) & 1) << (2 * i)
+    elif curve == 'hilbert':
+        s = n >> 1
+        while s > 0:
+            rx = (x & s) > 0
+            ry = (y & s) > 0
+            keys += s * s * ((3 * rx) ^ ry)
+
+            # rotate the quadrant, so that the curve within it has the standard orientation
+            flip = ~ry & rx
+            x = np.where(flip, n - 1 - x, x)
+            y = np.where(flip, n - 1 - y, y)
+            x, y = np.where(ry, x, y), np.where(ry, y, x)
+            s >>= 1
+    else:
+        raise ValueError('Unknown curve {}'.format(curve))
+
+    return keys
+
+
+def unique_edges(triangles, n_vertices):
+    """
+    Computes the unique edges of a triangulation, in lexicographic order. Edge (a, b) with a < b is encoded
+    by the key a * n_vertices + b.
+    :param np.ndarray triangles: (n_triangles, 3) array of vertex indices
+    :param int n_vertices: number of vertices
+    :return: sorted edge keys, and the (n_triangles, 3) edge indices of the local edges (t0, t1), (t1, t2), (t2, t0)
+    """
+
+    triangles = np.asarray(triangles)
+
+    # the local edges of each triangle, with sorted vertices
+    local_edges = np.sort(np.stack([triangles, np.roll(triangles, -1, axis=1)], axis=2), axis=2)
+    edge_keys = local_edges[..., 0].astype(np.int64) * n_vertices + local_edges[..., 1]
+
+    edge_keys, triangle_edges = np.unique(edge_keys, return_inverse=True)
+    return edge_keys, triangle_edges.reshape(triangles.shape)
+
+
+def _incidence(keys, n):
+    """
+    Computes a CSR-style map from each of n entities to the triangles referencing them.
+    The triangles incident to entity i are triangles[offsets[i]:offsets[i + 1]], in increasing order.
+    :param np.ndarray keys: (n_triangles, 3) entity indices referenced by each triangle
+    :param int n: number of entities
+    :return: offsets (n + 1, ) and triangles
+    """
+
+    keys = np.ravel(keys)
+    order = np.argsort(keys, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(keys, minlength=n))])
 
-        return k
+    return offsets, order // 3
@@ -36,6 +36,115 @@ def midpoint_rule_ps12(integrand, vertices):
     return integral
 
 
+def midpoint_rule_ps12_data():
+    """
+    Returns the points and weights of the PS12 mid-point rule on the reference triangle, for use in vectorized
+    assembly. The weights are relative to the area of the triangle.
+    :return: barycentric coordinates (36, 3), sub-triangle of each point (36, ) and weights (36, )
+    """
+
+    return midpoint_ps12.barycentric, midpoint_ps12.sub_triangles, midpoint_ps12.weights
+
+
+class TriangleQuadrature(object):
+    """
+    A quadrature rule on triangles, given by barycentric points and weights relative to the triangle area.
+    Integrands are evaluated once on the array of all quadrature points, and must accept (n_points, 2) arrays.
+    For rules on the PS12-split, sub_triangles holds the sub-triangle containing each point, in the order of
+    SSplines.sub_triangles.
+    """
+
+    def __init__(self, barycentric, weights, sub_triangles=None):
+        """
+        :param np.ndarray barycentric: (n_points, 3) barycentric coordinates of the points
+        :param np.ndarray weights: (n_points, ) weights, summing to one
+        :param np.ndarray sub_triangles: (n_points, ) PS12 sub-triangle of each point, or None
+        """
+
+        self.barycentric = np.asarray(barycentric, dtype=float)
+        self.weights = np.asarray(weights, dtype=float)
+        self.sub_triangles = sub_triangles
+
+    def ps12(self):
+        """
+        Returns the composite rule applying this rule to each of the twelve sub-triangles of the PS12-split.
+        :return: TriangleQuadrature
+        """
+
+        # sub-triangles in barycentric coordinates; the determinant gives the relative area.
+        triangles = np.asarray(sub_triangles(np.eye(3)), dtype=float)
+        areas = np.abs(np.linalg.det(triangles))
+
+        barycentric = np.einsum('qi,kij->kqj', self.barycentric, triangles).reshape(-1, 3)
+        weights = np.outer(areas, self.weights).ravel()
+        k = np.repeat(np.arange(12), len(self.weights))
+
+        return TriangleQuadrature(barycentric, weights, k)
+
+    def points(self, vertices):
+        """
+        Computes the quadrature points on a triangle or a batch of triangles.
+        :param np.ndarray vertices: (3, 2) vertices of a triangle, or (n, 3, 2) vertices of n triangles
+        :return: (n_points, 2) or (n, n_points, 2) array of points
+        """
+
+        return np.matmul(self.barycentric, np.asarray(vertices, dtype=float))
+
+    def scaled_weights(self, vertices):
+        """
+        Computes the quadrature weights on a triangle or a batch of triangles.
+        :param np.ndarray vertices: (3, 2) vertices of a triangle, or (n, 3, 2) vertices of n triangles
+        :return: (n_points, ) or (n, n_points) array of weights
+        """
+
+        vertices = np.asarray(vertices, dtype=float)
+        e1 = vertices[..., 1, :] - vertices[..., 0, :]
+        e2 = vertices[..., 2, :] - vertices[..., 0, :]
+        areas = np.abs(e1[..., 0] * e2[..., 1] - e1[..., 1] * e2[..., 0]) / 2
+
+        return np.multiply.outer(areas, self.weights)
+
+    def integrate(self, integrand, vertices):
+        """
+        Computes a numerical approximation to the integral over a triangle or a batch of triangles, evaluating
+        the integrand a single time on all quadrature points.
+        :param callable integrand: function mapping an (n_points, 2) array of points to (n_points, ...) values
+        :param np.ndarray vertices: (3, 2) vertices of a triangle, or (n, 3, 2) vertices of n triangles
+        :return: the integral, or an array of n integrals
+        """
+
+        points = self.points(vertices)
+        weights = self.scaled_weights(vertices)
+
+        values = np.asarray(integrand(points.reshape(-1, 2)), dtype=float)
+        values = values.reshape(weights.shape + values.shape[1:])
+        weights = np.expand_dims(weights, tuple(range(weights.ndim, values.ndim)))
+
+        return np.sum(weights * values, axis=points.ndim - 2)
+
+    def __call__(self, integrand, vertices):
+        return self.integrate(integrand, vertices)
+
+
+def _symmetric_points(a):
+    return np.array([[a, a, 1 - 2 * a], [a, 1 - 2 * a, a], [1 - 2 * a, a, a]])
+
+
+# exact for quadratic polynomials
+midpoint = TriangleQuadrature(_symmetric_points(0.5), np.full(3, 1 / 3))
+
+# exact for polynomials of degree five
+seven_point = TriangleQuadrature(
+    np.concatenate([[[1 / 3, 1 / 3, 1 / 3]],
+                    _symmetric_points((6 - np.sqrt(15)) / 21),
+                    _symmetric_points((6 + np.sqrt(15)) / 21)]),
+    np.concatenate([[9 / 40], np.full(3, (155 - np.sqrt(15)) / 1200), np.full(3, (155 + np.sqrt(15)) / 1200)])
+)
+
+midpoint_ps12 = midpoint.ps12()
+seven_point_ps12 = seven_point.ps12()
+
+
 def quadpy_full(integrand, vertices):
     return quadpy.triangle.integrate(integrand, vertices.T, quadpy.triangle.SevenPoint())
 
@@ -0,0 +1,112 @@
+import json
+import os
+
+import numpy as np
+
+from PSFEM.composite_spline import CompositeSplineSpace
+from PSFEM.mesh import Mesh
+
+FORMAT_VERSION = 1
+
+
+def _save_arrays(path, prefix, arrays):
+    for name, array in arrays.items():
+        np.save(os.path.join(path, '{}.{}.npy'.format(prefix, name)), np.ascontiguousarray(array))
+
+
+def _load_arrays(path, prefix, names, mmap_mode):
+    return {name: np.load(os.path.join(path, '{}.{}.npy'.format(prefix, name)), mmap_mode=mmap_mode)
+            for name in names}
+
+
+def _write_metadata(path, metadata):
+    with open(os.path.join(path, 'metadata.json'), 'w') as f:
+        json.dump(dict(metadata, format=FORMAT_VERSION), f, indent=2)
+
+
+def _read_metadata(path, kind):
+    with open(os.path.join(path, 'metadata.json')) as f:
+        metadata = json.load(f)
+
+    if metadata.get('format') != FORMAT_VERSION:
+        raise ValueError('Unsupported format {} in {}'.format(metadata.get('format'), path))
+    if kind not in metadata:
+        raise ValueError('{} does not hold a {}'.format(path, kind))
+    return metadata
+
+
+def _save_mesh_arrays(path, mesh):
+    arrays = dict(vertices=mesh.vertices, triangles=mesh.triangles)
+    arrays.update((name, getattr(mesh, name)) for name in Mesh.TOPOLOGY)
+    reordered = mesh.vertex_permutation is not None
+    if reordered:
+        arrays.update(vertex_permutation=mesh.vertex_permutation, triangle_permutation=mesh.triangle_permutation)
+    _save_arrays(path, 'mesh', arrays)
+
+    return dict(newest_vertex_first=mesh.newest_vertex_first, reordered=reordered)
+
+
+def save_mesh(path, mesh):
+    """
+    Saves a mesh with its topology, as a directory holding one .npy file per array and a metadata.json file.
+    The arrays can then be loaded memory-mapped, so that loading skips both reading the files up front and
+    recomputing the topology, and processes loading the same files share the pages of the arrays.
+    :param str path: directory to save to, created if it does not exist
+    :param Mesh mesh: mesh
+    """
+
+    os.makedirs(path, exist_ok=True)
+    _write_metadata(path, dict(mesh=_save_mesh_arrays(path, mesh)))
+
+
+def load_mesh(path, mmap_mode='r'):
+    """
+    Loads a mesh saved by save_mesh or save_space, without recomputing its topology.
+    :param str path: directory the mesh was saved to
+    :param mmap_mode: memory-map mode passed to np.load, or None to read the arrays into memory
+    :return: Mesh
+    """
+
+    metadata = _read_metadata(path, 'mesh')['mesh']
+    arrays = _load_arrays(path, 'mesh', ('vertices', 'triangles') + Mesh.TOPOLOGY, mmap_mode)
+
+    mesh = Mesh(arrays.pop('vertices'), arrays.pop('triangles'), topology=arrays)
+    mesh.newest_vertex_first = metadata['newest_vertex_first']
+    if metadata.get('reordered'):
+        permutations = _load_arrays(path, 'mesh', ('vertex_permutation', 'triangle_permutation'), mmap_mode)
+        mesh.vertex_permutation = permutations['vertex_permutation']
+        mesh.triangle_permutation = permutations['triangle_permutation']
+    return mesh
+
+
+def save_space(path, V):
+    """
+    Saves a space with its dof maps, together with its mesh.
+    :param str path: directory to save to, created if it does not exist
+    :param CompositeSplineSpace V: space
+    """
+
+    os.makedirs(path, exist_ok=True)
+    mesh_metadata = _save_mesh_arrays(path, V.mesh)
+    arrays = {name: getattr(V, name) for name in CompositeSplineSpace.DOFS}
+    if V.dof_permutation is not None:
+        arrays['dof_permutation'] = V.dof_permutation
+    _save_arrays(path, 'space', arrays)
+    _write_metadata(path, dict(mesh=mesh_metadata, space=dict(numbering=V.numbering, reordering=V.reordering)))
+
+
+def load_space(path, lazy=True, mmap_mode='r'):
+    """
+    Loads a space saved by save_space, without recomputing its dof maps.
+    :param str path: directory the space was saved to
+    :param bool lazy: whether to construct the basis lazily, see CompositeSplineSpace
+    :param mmap_mode: memory-map mode passed to np.load, or None to read the arrays into memory
+    :return: CompositeSplineSpace
+    """
+
+    metadata = _read_metadata(path, 'space')['space']
+    names = CompositeSplineSpace.DOFS + (('dof_permutation', ) if metadata.get('reordering') else ())
+    dofs = _load_arrays(path, 'space', names, mmap_mode)
+
+    return CompositeSplineSpace(load_mesh(path, mmap_mode), lazy=lazy, numbering=metadata['numbering'], dofs=dofs,
+                                reordering=metadata.get('reordering'))
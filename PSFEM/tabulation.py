@@ -0,0 +1,362 @@
+import functools
+from collections import OrderedDict
+
+import numpy as np
+from SSplines import sub_triangles
+from SSplines.helper_functions import coefficients_quadratic, evaluate_non_zero_basis_splines
+
+
+def _monomials(b):
+    """
+    Evaluates the quadratic monomials 1, xi, eta, xi^2, xi*eta, eta^2 in the reference coordinates
+    xi = b[:, 1], eta = b[:, 2], together with their first and second derivatives.
+    :param np.ndarray b: (n, 3) barycentric coordinates of points
+    :return: values (n, 6), gradients (n, 2, 6) and hessians (2, 2, 6)
+    """
+
+    xi, eta = b[:, 1], b[:, 2]
+    zero, one = np.zeros_like(xi), np.ones_like(xi)
+
+    values = np.stack([one, xi, eta, xi ** 2, xi * eta, eta ** 2], axis=1)
+    gradients = np.stack([
+        np.stack([zero, one, zero, 2 * xi, eta, zero], axis=1),
+        np.stack([zero, zero, one, zero, xi, 2 * eta], axis=1)
+    ], axis=1)
+    hessians = np.array([
+        [[0, 0, 0, 2, 0, 0], [0, 0, 0, 0, 1, 0]],
+        [[0, 0, 0, 0, 1, 0], [0, 0, 0, 0, 0, 2]]
+    ], dtype=float)
+
+    return values, gradients, hessians
+
+
+@functools.lru_cache(maxsize=None)
+def reference_polynomials():
+    """
+    Computes the quadratic polynomial pieces of the twelve quadratic S-splines on each sub-triangle of the
+    PS12-split of the reference triangle, by interpolation at six points interior to each sub-triangle.
+    :return: (12, 6, 12) array P, such that S-spline i restricted to sub-triangle k is
+    sum_m P[k, m, i] * monomial_m, see _monomials.
+    """
+
+    corners = np.eye(3)
+    domain_points = np.concatenate([corners, (corners + np.roll(corners, -1, axis=0)) / 2])
+    lattice = (domain_points + 1 / 3) / 2
+
+    P = np.zeros((12, 6, 12))
+    for k, sub_triangle in enumerate(np.asarray(sub_triangles(np.eye(3)), dtype=float)):
+        b = np.dot(lattice, sub_triangle)
+        z = evaluate_non_zero_basis_splines(d=2, b=b, k=np.full(6, k))
+
+        values = np.zeros((6, 12))
+        values[:, coefficients_quadratic(k)] = z
+        P[k] = np.linalg.solve(_monomials(b)[0], values)
+
+    return P
+
+
+def reference_tabulation(b, k):
+    """
+    Tabulates the twelve quadratic S-splines on the PS12-split of the reference triangle, together with
+    their first and second derivatives with respect to the reference coordinates.
+    Each point is evaluated in the given sub-triangle, so that the piecewise constant second derivatives
+    are well defined also on the interior edges of the split.
+    :param np.ndarray b: (n, 3) barycentric coordinates of points
+    :param np.ndarray k: (n, ) sub-triangle of each point
+    :return: values (n, 12), gradients (n, 2, 12) and hessians (n, 2, 2, 12).
+    """
+
+    b = np.atleast_2d(b).astype(float)
+    P = reference_polynomials()[np.atleast_1d(k)]
+    m, dm, ddm = _monomials(b)
+
+    values = np.einsum('nm,nmi->ni', m, P)
+    gradients = np.einsum('nem,nmi->nei', dm, P)
+    hessians = np.einsum('efm,nmi->nefi', ddm, P)
+
+    return values, gradients, hessians
+
+
+def _projection_length(u, v):
+    return np.einsum('ni,ni->n', u, v) / np.einsum('ni,ni->n', u, u)
+
+
+def hermite_coefficients(triangles):
+    """
+    Computes the S-spline coefficients of the twelve Hermite nodal basis functions for a batch of triangles.
+    Batched counterpart of SSplines.SplineSpace.hermite_basis.
+    :param np.ndarray triangles: (n, 3, 2) vertices of triangles
+    :return: (n, 12, 12) coefficients, where C[t, :, j] are the coefficients of basis function j on triangle t.
+    """
+
+    triangles = np.asarray(triangles, dtype=float)
+    p1, p2, p3 = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+
+    p4 = 0.5 * (p1 + p2)
+    p5 = 0.5 * (p2 + p3)
+    p6 = 0.5 * (p3 + p1)
+
+    l126 = _projection_length(p1 - p2, p2 - p6)
+    l134 = _projection_length(p1 - p3, p3 - p4)
+    l215 = _projection_length(p2 - p1, p1 - p5)
+    l234 = _projection_length(p2 - p3, p3 - p4)
+    l326 = _projection_length(p3 - p2, p2 - p6)
+    l315 = _projection_length(p3 - p1, p1 - p5)
+
+    x21, y21 = (p2 - p1).T
+    x12, y12 = (p1 - p2).T
+    x13, y13 = (p1 - p3).T
+    x31, y31 = (p3 - p1).T
+    x32, y32 = (p3 - p2).T
+    x23, y23 = (p2 - p3).T
+
+    d = 0.5 * (x21 * y31 - x31 * y21)
+
+    p12 = 3 * np.linalg.norm(p1 - p2, axis=1)
+    p23 = 3 * np.linalg.norm(p2 - p3, axis=1)
+    p31 = 3 * np.linalg.norm(p3 - p1, axis=1)
+
+    C = np.zeros((len(triangles), 12, 12))
+
+    C[:, [0, 1, 11], 0] = 1
+    C[:, 2, 0] = -2 / 3 * l126
+    C[:, 10, 0] = -2 / 3 * l134
+    C[:, 1, 1] = 1 / 4 * x21
+    C[:, 2, 1] = 1 / 6 * x12 * l126
+    C[:, 10, 1] = 1 / 6 * x13 * l134
+    C[:, 11, 1] = 1 / 4 * x31
+    C[:, 1, 2] = 1 / 4 * y21
+    C[:, 2, 2] = 1 / 6 * y12 * l126
+    C[:, 10, 2] = 1 / 6 * y13 * l134
+    C[:, 11, 2] = 1 / 4 * y31
+    C[:, 2, 3] = d / p12
+
+    C[:, [3, 4, 5], 4] = 1
+    C[:, 2, 4] = -2 / 3 * l215
+    C[:, 6, 4] = -2 / 3 * l234
+    C[:, 2, 5] = 1 / 6 * x21 * l215
+    C[:, 3, 5] = 1 / 4 * x12
+    C[:, 5, 5] = 1 / 4 * x32
+    C[:, 6, 5] = 1 / 6 * x23 * l234
+    C[:, 2, 6] = 1 / 6 * y21 * l215
+    C[:, 3, 6] = 1 / 4 * y12
+    C[:, 5, 6] = 1 / 4 * y32
+    C[:, 6, 6] = 1 / 6 * y23 * l234
+    C[:, 6, 7] = d / p23
+
+    C[:, [7, 8, 9], 8] = 1
+    C[:, 6, 8] = -2 / 3 * l326
+    C[:, 10, 8] = -2 / 3 * l315
+    C[:, 6, 9] = 1 / 6 * x32 * l326
+    C[:, 7, 9] = 1 / 4 * x23
+    C[:, 9, 9] = 1 / 4 * x13
+    C[:, 10, 9] = 1 / 6 * x31 * l315
+    C[:, 6, 10] = 1 / 6 * y32 * l326
+    C[:, 7, 10] = 1 / 4 * y23
+    C[:, 9, 10] = 1 / 4 * y13
+    C[:, 10, 10] = 1 / 6 * y31 * l315
+    C[:, 10, 11] = d / p31
+
+    return C
+
+
+def affine_maps(triangles):
+    """
+    Computes the inverse Jacobians and areas of the affine maps from the reference triangle onto each triangle.
+    :param np.ndarray triangles: (n, 3, 2) vertices of triangles
+    :return: (n, 2, 2) inverse Jacobians K with K[t, e, d] = d xi_e / d x_d, and (n, ) areas.
+    """
+
+    triangles = np.asarray(triangles, dtype=float)
+    J = np.stack([triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0]], axis=2)
+    det = J[:, 0, 0] * J[:, 1, 1] - J[:, 0, 1] * J[:, 1, 0]
+
+    return np.linalg.inv(J), np.abs(det) / 2
+
+
+class TabulatedBasis(object):
+    """
+    The twelve local basis functions of a batch of triangles, tabulated at a fixed set of points on each triangle.
+    Mirrors the evaluation interface of SSplines.SplineFunction, so forms written for the pointwise solver
+    can be applied to whole arrays at once. The point arguments are ignored, as the basis is already
+    tabulated at the points of interest.
+    """
+
+    def __init__(self, values, gradients, laplacians):
+        """
+        :param np.ndarray values: (..., 12) basis values
+        :param np.ndarray gradients: (..., 12, 2) basis gradients
+        :param np.ndarray laplacians: (..., 12) basis laplacians
+        """
+
+        self.values = values
+        self.gradients = gradients
+        self.laplacians = laplacians
+
+    def __call__(self, x=None):
+        return self.values
+
+    def dx(self, x=None):
+        return self.gradients[..., 0]
+
+    def dy(self, x=None):
+        return self.gradients[..., 1]
+
+    def grad(self, x=None):
+        return self.gradients
+
+    def lapl(self, x=None):
+        return self.laplacians
+
+    def expand(self, axis):
+        """
+        Inserts a new axis before or after the basis axis, for broadcasting trial against test functions.
+        :param int axis: -1 to insert the axis after the basis axis, -2 to insert it before.
+        :return: TabulatedBasis
+        """
+
+        return TabulatedBasis(np.expand_dims(self.values, axis),
+                              np.expand_dims(self.gradients, axis - 1),
+                              np.expand_dims(self.laplacians, axis))
+
+
+def _map_tabulation(phi, dphi, ddphi, triangles):
+    """
+    Maps a tabulation of the reference S-splines onto the Hermite basis of each of a batch of triangles.
+    :return: values (n, q, 12), gradients (n, q, 12, 2) and laplacians (n, q, 12)
+    """
+
+    C = hermite_coefficients(triangles)
+    K, _ = affine_maps(triangles)
+
+    q = len(phi)
+    values = np.matmul(phi, C)
+    gradients = np.einsum('ted,tqej->tqjd', K, np.matmul(dphi.reshape(2 * q, 12), C).reshape(-1, q, 2, 12))
+    laplacians = np.matmul(np.einsum('ted,tfd,qefi->tqi', K, K, ddphi), C)
+
+    return values, gradients, laplacians
+
+
+def tabulate_basis(triangles, signs, b, k):
+    """
+    Tabulates the twelve Hermite basis functions of a batch of triangles at the given barycentric points.
+    :param np.ndarray triangles: (n, 3, 2) vertices of triangles
+    :param np.ndarray signs: (n, 12) orientation of each local basis function in the global basis
+    :param np.ndarray b: (q, 3) barycentric coordinates of points
+    :param np.ndarray k: (q, ) sub-triangle of each point
+    :return: TabulatedBasis with arrays of shape (n, q, 12, ...), and the (n, q, 2) physical points.
+    """
+
+    return ReferenceTabulation(b, k, maxsize=0).tabulate(triangles, signs)
+
+
+def congruence_classes(triangles, decimals=12):
+    """
+    Groups triangles into classes of translates of each other, by the shape keys of ReferenceTabulation, so that
+    quantities depending on the shape only, like element matrices of constant coefficient forms, are computed once
+    per class. Structured meshes have a handful of classes.
+    :param np.ndarray triangles: (n, 3, 2) vertices of triangles
+    :param int decimals: number of decimals the scaled edge vectors are rounded to when comparing shapes
+    :return: (n_classes, 3, 2) representatives with first vertex at the origin, and the (n, ) class of each triangle
+    """
+
+    keys = ReferenceTabulation.shape_keys(np.asarray(triangles, dtype=float), decimals)
+    shapes, inverse = np.unique(keys, axis=0, return_inverse=True)
+    return ReferenceTabulation._canonical_triangles(shapes), np.ravel(inverse)
+
+
+class ReferenceTabulation(object):
+    """
+    The S-splines on the reference triangle tabulated once at a fixed set of points, from which the Hermite
+    basis on physical triangles is obtained through the affine map and the Hermite coefficients of each triangle.
+    The mapped tabulations are kept in an LRU cache keyed by triangle shape, that is the edge vectors up to
+    rounding, so triangles that are translates of each other, like those of structured meshes, are mapped once.
+    Chunks of triangles with few repeated shapes, as in unstructured meshes, are mapped directly, bypassing the cache.
+    """
+
+    # the largest fraction of distinct shapes in a chunk for which the cache is used
+    MAX_SHAPE_RATIO = 0.5
+
+    def __init__(self, b, k, maxsize=4096, decimals=12):
+        """
+        :param np.ndarray b: (q, 3) barycentric coordinates of points
+        :param np.ndarray k: (q, ) sub-triangle of each point
+        :param int maxsize: maximum number of triangle shapes to cache
+        :param int decimals: number of decimals the edge vectors are rounded to when comparing shapes
+        """
+
+        self.b = np.atleast_2d(b).astype(float)
+        self.k = np.atleast_1d(k)
+        self.phi, self.dphi, self.ddphi = reference_tabulation(self.b, self.k)
+        self.maxsize = maxsize
+        self.decimals = decimals
+        self._cache = OrderedDict()
+
+    @staticmethod
+    def shape_keys(triangles, decimals=12):
+        """
+        Computes translation invariant keys identifying the shape of each triangle: the edge vectors from the first
+        vertex, scaled by a power of two to unit size and rounded, followed by the exponent of the scaling.
+        :param np.ndarray triangles: (n, 3, 2) vertices of triangles
+        :param int decimals: number of decimals the scaled edge vectors are rounded to
+        :return: (n, 5) array of keys
+        """
+
+        edges = (triangles[:, 1:] - triangles[:, :1]).reshape(-1, 4)
+        exponents = np.floor(np.log2(np.max(np.abs(edges), axis=1)))
+        # adding zero turns negative zeros into positive ones, so equal shapes have equal bytes
+        scaled = np.round(edges / 2 ** exponents[:, None], decimals) + 0.0
+
+        return np.column_stack([scaled, exponents])
+
+    @staticmethod
+    def _canonical_triangles(keys):
+        """
+        The triangles with first vertex at the origin and the shapes given by the keys. Cached tabulations are
+        computed from these, so that they depend on the key only.
+        """
+
+        edges = keys[:, :4].reshape(-1, 2, 2) * 2 ** keys[:, 4, None, None]
+        return np.concatenate([np.zeros((len(keys), 1, 2)), edges], axis=1)
+
+    def tabulate(self, triangles, signs):
+        """
+        Tabulates the twelve Hermite basis functions of a batch of triangles.
+        :param np.ndarray triangles: (n, 3, 2) vertices of triangles
+        :param np.ndarray signs: (n, 12) orientation of each local basis function in the global basis
+        :return: TabulatedBasis with arrays of shape (n, q, 12, ...), and the (n, q, 2) physical points.
+        """
+
+        triangles = np.asarray(triangles, dtype=float)
+        points = np.einsum('qv,tvd->tqd', self.b, triangles)
+
+        shapes = None
+        if self.maxsize > 0:
+            shapes, inverse = np.unique(self.shape_keys(triangles, self.decimals), axis=0,
+                                       return_inverse=True)
+
+        if shapes is not None and len(shapes) <= self.MAX_SHAPE_RATIO * len(triangles):
+            keys = [shape.tobytes() for shape in shapes]
+            entries = [self._cache.get(key) for key in keys]
+
+            missing = [i for i, entry in enumerate(entries) if entry is None]
+            if missing:
+                computed = _map_tabulation(self.phi, self.dphi, self.ddphi, self._canonical_triangles(shapes[missing]))
+                for j, i in enumerate(missing):
+                    entries[i] = tuple(array[j] for array in computed)
+
+            for key, entry in zip(keys, entries):
+                self._cache[key] = entry
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+            values, gradients, laplacians = (np.stack(arrays)[np.ravel(inverse)] for arrays in zip(*entries))
+        else:
+            values, gradients, laplacians = _map_tabulation(self.phi, self.dphi, self.ddphi, triangles)
+
+        values = values * signs[:, None, :]
+        gradients = gradients * signs[:, None, :, None]
+        laplacians = laplacians * signs[:, None, :]
+
+        return TabulatedBasis(values, gradients, laplacians), points
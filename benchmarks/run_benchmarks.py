@@ -0,0 +1,182 @@
+"""
+Benchmarks for mesh construction, space setup, assembly, linear solve, the complete solve and evaluation on
+uniform meshes of the unit square. Assembly is timed for a form with constant coefficients, whose element matrices
+are integrated once per class of congruent triangles, and for one with a variable coefficient, which is integrated
+on every triangle; the caches of the space are cleared before each run.
+
+Every phase is timed separately for each mesh size, recording the best wall time over a number of repeats, and the
+results are written as a JSON report. The repeats run without memory tracing, which slows down every allocation.
+With --memory, each phase is run once more under tracemalloc, and the peak memory allocated by Python during that
+extra run is recorded; otherwise the peak memory is null.
+
+    python benchmarks/run_benchmarks.py --sizes 5 10 20 40 --memory --output report.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+import scipy
+
+from PSFEM import forms
+from PSFEM.assembly import assemble_element_systems
+from PSFEM.composite_spline import CompositeSplineSpace
+from PSFEM.finite_element_solver import LinearProblem, solve
+from PSFEM.forms import inner, lapl
+from PSFEM.helper_functions import unit_square_uniform
+from PSFEM.mesh import Mesh
+
+
+def measure(function, repeats=1, memory=False):
+    """
+    Calls the function repeatedly, measuring wall time, and if asked the peak of memory traced during one further
+    call, so that the overhead of tracing does not enter the times.
+    :param callable function: function without arguments
+    :param int repeats: number of timed calls
+    :param bool memory: whether to make a traced call measuring the memory peak
+    :return: result of the last timed call, best time in seconds and memory peak in bytes, or None
+    """
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            function()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return result, min(times), peak
+
+
+def benchmark_size(n, repeats=1, lazy=False, n_points=1000, memory=False):
+    """
+    Benchmarks all phases on unit_square_uniform(n).
+    :param int n: number of vertices along each side of the square
+    :param int repeats: number of timed repeats of each phase
+    :param bool lazy: whether to construct the space lazily
+    :param int n_points: number of points for evaluation and point location
+    :param bool memory: whether to measure the memory peak of each phase in an extra traced run
+    :return: list of dictionaries, one per phase
+    """
+
+    square = unit_square_uniform(n)
+    vertices, triangles = square.vertices, square.triangles
+    u, v = forms.TrialFunction(), forms.TestFunction()
+    a = inner(lapl(u), lapl(v))
+    a_variable = a + (lambda p: 1 + p[..., 0] * p[..., 1]) * u * v
+    L = (lambda p: np.sin(np.pi * p[..., 0]) * np.sin(np.pi * p[..., 1])) * v
+    points = np.random.default_rng(0).random((n_points, 2))
+
+    results = []
+
+    def record(phase, function, **extra):
+        result, seconds, peak = measure(function, repeats, memory)
+        results.append(dict(phase=phase, time=seconds, peak_memory=peak, **extra))
+        return result
+
+    mesh = record('mesh', lambda: Mesh(vertices, triangles))
+    V = record('space', lambda: CompositeSplineSpace(mesh, lazy=lazy), lazy=lazy)
+
+    def assembly(form):
+        # clear the caches of the space, so the element integration is timed rather than the cache lookup
+        V.clear_caches()
+        A_local, b_local = assemble_element_systems(form, L, V)
+        pattern = V.sparsity_pattern()
+        return pattern.assemble_matrix(A_local), pattern.assemble_vector(b_local)
+
+    A, b = record('assembly', lambda: assembly(a))
+    record('assembly_variable', lambda: assembly(a_variable))
+
+    def linear_solve():
+        return LinearProblem(A, V).solve_coefficients(b)
+
+    c = record('linear_solve', linear_solve)
+
+    def complete_solve():
+        V.clear_caches()
+        return solve(a_variable, L, V, vectorized=True)
+
+    record('solve', complete_solve)
+
+    f = record('function', lambda: V.function(c))
+    record('evaluate', lambda: f.evaluate(points), n_points=n_points)
+    record('find_triangles', lambda: mesh.find_triangles(points), n_points=n_points)
+
+    def find_triangle():
+        previous = None
+        for x in points:
+            previous = mesh.find_triangle(x, previous=previous)
+
+    record('find_triangle', find_triangle, n_points=n_points)
+
+    for result in results:
+        result.update(n=n, n_triangles=len(mesh.triangles), dimension=V.dimension)
+
+    return results
+
+
+def _revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, repeats=1, lazy=False, n_points=1000, memory=False):
+    """
+    Benchmarks all phases for each mesh size.
+    :return: report as a dictionary
+    """
+
+    results = []
+    for n in sizes:
+        results += benchmark_size(n, repeats=repeats, lazy=lazy, n_points=n_points, memory=memory)
+
+    return dict(
+        metadata=dict(
+            timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'),
+            revision=_revision(),
+            python=platform.python_version(),
+            numpy=np.__version__,
+            scipy=scipy.__version__,
+            machine=platform.machine(),
+            repeats=repeats,
+            memory=memory,
+        ),
+        results=results,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5, 10, 20, 40])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--points', type=int, default=1000)
+    parser.add_argument('--lazy', action='store_true', help='construct the spaces lazily')
+    parser.add_argument('--memory', action='store_true', help='measure memory peaks in an extra traced run')
+    parser.add_argument('--output', default='benchmark_report.json')
+    args = parser.parse_args()
+
+    report = run(args.sizes, repeats=args.repeats, lazy=args.lazy, n_points=args.points, memory=args.memory)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for result in report['results']:
+        memory = '' if result['peak_memory'] is None else ' {:14d} B'.format(result['peak_memory'])
+        print('n = {n:4d}  {phase:17s} {time:10.4f} s'.format(**result) + memory)
+
+
+if __name__ == '__main__':
+    main()
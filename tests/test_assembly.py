@@ -0,0 +1,151 @@
+import numpy as np
+import pytest
+from SSplines import sub_triangles
+
+from PSFEM import assembly, forms
+from PSFEM.assembly import MatrixFreeOperator, assemble_element_systems, assemble_matrix, element_systems
+from PSFEM.composite_spline import CompositeSplineSpace
+from PSFEM.forms import inner, lapl
+from PSFEM.helper_functions import unit_square_uniform
+from PSFEM.mesh import Mesh
+from PSFEM.quadrature import midpoint_rule_ps12
+
+
+def two_triangle_space():
+    vertices = np.array([
+        [0, 0],
+        [1, 0],
+        [0, 1],
+        [1, 1]
+    ])
+
+    triangles = np.array([
+        [0, 1, 2],
+        [1, 3, 2]
+    ])
+
+    return CompositeSplineSpace(Mesh(vertices, triangles))
+
+
+def test_element_systems_match_pointwise_assembly():
+    V = two_triangle_space()
+
+    def a(u, v):
+        return lambda p: np.sum(u.grad(p) * v.grad(p), axis=-1) + u(p) * v(p)
+
+    def L(v):
+        return lambda p: (p[..., 0] ** 2 + p[..., 1]) * v(p)
+
+    computed_A, computed_b = element_systems(a, L, V, np.arange(2))
+
+    for triangle in range(2):
+        vertices = V.mesh.vertices[V.mesh.triangles[triangle]]
+        local_basis = [V.basis[dof].local_representation[triangle] for dof in V.local_to_global_map[triangle]]
+
+        expected_A = np.array([[midpoint_rule_ps12(a(u, v), vertices) for v in local_basis]
+                               for u in local_basis], dtype=float).reshape(12, 12)
+        expected_b = np.array([midpoint_rule_ps12(L(v), vertices) for v in local_basis], dtype=float).reshape(12)
+
+        np.testing.assert_array_almost_equal(computed_A[triangle], expected_A)
+        np.testing.assert_array_almost_equal(computed_b[triangle], expected_b)
+
+
+def test_element_systems_laplacian_exact():
+    V = two_triangle_space()
+
+    def a(u, v):
+        return lambda p: u.lapl(p) * v.lapl(p)
+
+    def L(v):
+        return lambda p: v(p)
+
+    computed_A, _ = element_systems(a, L, V, np.arange(2))
+
+    # the laplacian of a quadratic spline is constant on each sub-triangle
+    for triangle in range(2):
+        local_basis = [V.basis[dof].local_representation[triangle] for dof in V.local_to_global_map[triangle]]
+        expected_A = np.zeros((12, 12))
+        for sub_triangle in sub_triangles(V.mesh.vertices[V.mesh.triangles[triangle]]):
+            sub_triangle = np.array(sub_triangle, dtype=float)
+            centroid = np.mean(sub_triangle, axis=0, keepdims=True)
+            area = abs(np.cross(sub_triangle[1] - sub_triangle[0], sub_triangle[2] - sub_triangle[0])) / 2
+            laplacians = np.array([b.lapl(centroid) for b in local_basis]).reshape(12)
+            expected_A += area * np.outer(laplacians, laplacians)
+
+        np.testing.assert_array_almost_equal(computed_A[triangle], expected_A)
+
+
+def test_sparsity_pattern_assembly():
+    V = two_triangle_space()
+    pattern = V.sparsity_pattern()
+
+    rng = np.random.default_rng(0)
+    element_matrices = rng.random((2, 12, 12))
+    element_vectors = rng.random((2, 12))
+
+    expected_A = np.zeros((V.dimension, V.dimension))
+    expected_b = np.zeros(V.dimension)
+    for triangle in range(2):
+        l2g = V.local_to_global_map[triangle]
+        expected_A[np.ix_(l2g, l2g)] += element_matrices[triangle]
+        expected_b[l2g] += element_vectors[triangle]
+
+    np.testing.assert_array_almost_equal(pattern.assemble_matrix(element_matrices).toarray(), expected_A)
+    np.testing.assert_array_almost_equal(pattern.assemble_vector(element_vectors), expected_b)
+    assert V.sparsity_pattern() is pattern
+
+
+def test_parallel_assembly_reproducible(monkeypatch):
+    monkeypatch.setattr(assembly, 'CHUNK_SIZE', 4)
+    V = CompositeSplineSpace(unit_square_uniform(4))
+
+    def a(u, v):
+        return lambda p: u.lapl(p) * v.lapl(p)
+
+    def L(v):
+        return lambda p: (p[..., 0] ** 2 + p[..., 1]) * v(p)
+
+    serial_A, serial_b = assemble_element_systems(a, L, V, vectorized=True, nprocs=1)
+    parallel_A, parallel_b = assemble_element_systems(a, L, V, vectorized=True, nprocs=3)
+
+    np.testing.assert_array_equal(serial_A, parallel_A)
+    np.testing.assert_array_equal(serial_b, parallel_b)
+
+
+@pytest.mark.parametrize('cache', [True, False])
+def test_matrix_free_operator_matches_assembled_matrix(cache):
+    V = CompositeSplineSpace(unit_square_uniform(4), lazy=True)
+    u, v = forms.TrialFunction(), forms.TestFunction()
+    a = inner(lapl(u), lapl(v)) + (lambda p: 1 + p[..., 0]) * u * v
+
+    A = assemble_matrix(a, V, vectorized=True)
+    operator = MatrixFreeOperator(a, V, cache=cache)
+
+    x = np.random.default_rng(0).random((V.dimension, 2))
+    np.testing.assert_allclose(operator @ x[:, 0], A @ x[:, 0], atol=1e-10 * abs(A).max())
+    np.testing.assert_allclose(operator @ x, A @ x, atol=1e-10 * abs(A).max())
+    np.testing.assert_allclose(operator.diagonal(), A.diagonal())
+
+    interior, boundary = V.interior_dofs, V.boundary_dofs
+    A_IB = operator.restrict(interior, boundary)
+    assert A_IB.shape == (len(interior), len(boundary))
+    np.testing.assert_allclose(A_IB @ x[boundary, 0], A[interior][:, boundary] @ x[boundary, 0],
+                               atol=1e-10 * abs(A).max())
+    np.testing.assert_allclose(operator.restrict(interior, interior).diagonal(), A.diagonal()[interior])
+
+
+def test_constant_element_arrays_computed_per_congruence_class():
+    mesh = unit_square_uniform(5)
+    V = CompositeSplineSpace(mesh, lazy=True)
+
+    representatives, classes = V.congruence_classes()
+    assert len(representatives) == 2
+    assert classes.shape == (len(mesh.triangles), )
+
+    u, v = forms.TrialFunction(), forms.TestFunction()
+    triangles = np.arange(len(mesh.triangles))
+    expected, _ = element_systems(inner(lapl(u), lapl(v)), forms.Form([]), V, triangles)
+
+    assert assembly.constant_class_arrays(V, ('lapl', 'lapl')).shape == (2, 12, 12)
+    np.testing.assert_allclose(assembly.constant_element_arrays(V, ('lapl', 'lapl')), expected,
+                               atol=1e-10 * np.abs(expected).max())
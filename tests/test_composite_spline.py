@@ -0,0 +1,135 @@
+import numpy as np
+
+from PSFEM.composite_spline import CompositeSplineSpace
+from PSFEM.helper_functions import unit_square_uniform
+from PSFEM.mesh import Mesh
+
+
+def test_function_matches_sum_of_basis_functions():
+    V = CompositeSplineSpace(unit_square_uniform(3))
+    coefficients = np.random.default_rng(0).random(V.dimension)
+
+    f = V.function(coefficients)
+    g = sum([c * b for c, b in zip(coefficients, V.basis)])
+
+    for k, triangle in enumerate(V.mesh.triangles):
+        b = np.array([[0.2, 0.3, 0.5], [0.6, 0.1, 0.3], [0.25, 0.25, 0.5]])
+        points = np.dot(b, V.mesh.vertices[triangle])
+
+        np.testing.assert_array_almost_equal(f(points, k), g(points, k))
+        np.testing.assert_array_almost_equal(f.lapl(points, k), g.lapl(points, k))
+
+    np.testing.assert_array_almost_equal((2 * f + f).coefficients, 3 * coefficients)
+
+
+def test_batched_evaluation():
+    V = CompositeSplineSpace(unit_square_uniform(4))
+    f = V.function(np.random.default_rng(1).random(V.dimension))
+
+    points = np.random.default_rng(2).random((50, 2))
+    triangle_ids = V.mesh.find_triangles(points)
+
+    expected_values = [f(p[None], k)[0] for p, k in zip(points, triangle_ids)]
+    expected_gradients = [f.local_function(k).grad(p[None])[0] for p, k in zip(points, triangle_ids)]
+    expected_laplacians = [f.lapl(p[None], k)[0] for p, k in zip(points, triangle_ids)]
+
+    np.testing.assert_array_almost_equal(f.evaluate(points), expected_values)
+    np.testing.assert_array_almost_equal(f.evaluate(points, triangle_ids), expected_values)
+    np.testing.assert_array_almost_equal(f.gradient(points), expected_gradients)
+    np.testing.assert_array_almost_equal(f.laplacian(points), expected_laplacians)
+
+    assert np.all(np.isnan(f.evaluate(np.array([[2.0, 2.0]]))))
+
+
+def test_lazy_space_matches_eager_space():
+    mesh = unit_square_uniform(2)
+    eager = CompositeSplineSpace(mesh)
+    lazy = CompositeSplineSpace(mesh, lazy=True)
+
+    np.testing.assert_array_equal(lazy.local_signs, eager.local_signs)
+    np.testing.assert_array_equal(lazy.interior_dofs, eager.interior_dofs)
+    np.testing.assert_array_equal(lazy.boundary_dofs, eager.boundary_dofs)
+    assert len(lazy.basis) == eager.dimension
+
+    for dof in [0, 5, eager.dimension - 1]:
+        assert lazy.basis[dof].triangles_with_support == eager.basis[dof].triangles_with_support
+        for triangle in lazy.basis[dof].triangles_with_support:
+            x = np.mean(mesh.vertices[mesh.triangles[triangle]], axis=0, keepdims=True)
+            np.testing.assert_array_almost_equal(np.array(lazy.basis[dof](x, triangle), dtype=float),
+                                                 np.array(eager.basis[dof](x, triangle), dtype=float))
+
+
+def test_lazy_space_matches_eager_space_on_mesh():
+    mesh = unit_square_uniform(4)
+    eager = CompositeSplineSpace(mesh)
+    lazy = CompositeSplineSpace(mesh, lazy=True)
+
+    assert lazy.local_to_global_map == eager.local_to_global_map
+    assert lazy.global_to_local_map == eager.global_to_local_map
+    assert lazy.basis_to_triangle_map == eager.basis_to_triangle_map
+    assert lazy.dof_to_edge_map == eager.dof_to_edge_map
+    assert lazy.dof_to_vertex_map == eager.dof_to_vertex_map
+
+    b = np.array([[0.2, 0.3, 0.5], [0.6, 0.1, 0.3], [0.25, 0.25, 0.5]])
+    for dof in range(eager.dimension):
+        assert lazy.basis[dof].triangles_with_support == eager.basis[dof].triangles_with_support
+        for triangle in lazy.basis[dof].triangles_with_support:
+            points = np.dot(b, mesh.vertices[mesh.triangles[triangle]])
+            np.testing.assert_array_almost_equal(np.array(lazy.basis[dof](points, triangle), dtype=float),
+                                                 np.array(eager.basis[dof](points, triangle), dtype=float))
+            np.testing.assert_array_almost_equal(np.array(lazy.basis[dof].lapl(points, triangle), dtype=float),
+                                                 np.array(eager.basis[dof].lapl(points, triangle), dtype=float))
+
+
+def test_prolongation():
+    coarse = unit_square_uniform(4)
+    V = CompositeSplineSpace(coarse, lazy=True)
+    c = np.random.default_rng(0).random(V.dimension)
+    points = np.random.default_rng(1).random((50, 2))
+
+    def q(p):
+        return 1 + p[:, 0] - 2 * p[:, 1] + p[:, 0] ** 2 + 3 * p[:, 0] * p[:, 1]
+
+    def grad_q(p):
+        return np.stack([1 + 2 * p[:, 0] + 3 * p[:, 1], -2 + 3 * p[:, 0]], axis=1)
+
+    # uniform refinement gives nested spaces
+    W = CompositeSplineSpace(coarse.refine(), lazy=True)
+    np.testing.assert_allclose(W.function(V.prolongation(W) @ c).evaluate(points), V.function(c).evaluate(points),
+                               atol=1e-12)
+
+    # otherwise functions agree at the vertices, and quadratic polynomials are reproduced
+    for fine in [coarse.refine([0, 5, 9]), Mesh(coarse.refine().vertices, coarse.refine().triangles)]:
+        W = CompositeSplineSpace(fine, lazy=True)
+        P = V.prolongation(W)
+        np.testing.assert_allclose(P @ V.hermite_dofs(q, grad_q), W.hermite_dofs(q, grad_q), atol=1e-10)
+        np.testing.assert_allclose(W.function(P @ c).evaluate(fine.vertices), V.function(c).evaluate(fine.vertices),
+                                   atol=1e-12)
+
+
+def test_reordered_dofs():
+    mesh = unit_square_uniform(5)
+    V = CompositeSplineSpace(mesh, lazy=True)
+    W = CompositeSplineSpace(mesh, lazy=True, reordering='rcm')
+
+    np.testing.assert_array_equal(np.sort(W.dof_permutation), np.arange(V.dimension))
+    np.testing.assert_array_equal(W.local_to_global_array, np.argsort(W.dof_permutation)[V.local_to_global_array])
+    np.testing.assert_array_equal(W.local_signs, V.local_signs)
+
+    def bandwidth(space):
+        dofs = space.local_to_global_array
+        return np.max(np.ptp(dofs, axis=1))
+
+    assert bandwidth(W) < bandwidth(V)
+
+    # coefficients in the reordered basis map back to the same function
+    def f(p):
+        return np.sin(p[:, 0]) * p[:, 1]
+
+    def grad_f(p):
+        return np.stack([np.cos(p[:, 0]) * p[:, 1], np.sin(p[:, 0])], axis=1)
+
+    c = W.hermite_dofs(f, grad_f)
+    np.testing.assert_allclose(W.original_coefficients(c), V.hermite_dofs(f, grad_f))
+    points = np.random.default_rng(0).random((10, 2))
+    np.testing.assert_allclose(W.function(c).evaluate(points), V.interpolate(f, grad_f).evaluate(points))
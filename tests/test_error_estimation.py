@@ -0,0 +1,54 @@
+import numpy as np
+
+from PSFEM.composite_spline import CompositeSplineSpace
+from PSFEM.error_estimation import biharmonic_indicators, doerfler_marking, element_errors, error_norm
+from PSFEM.helper_functions import unit_square_uniform
+
+
+def f(p):
+    return np.sin(np.pi * p[:, 0]) * np.sin(np.pi * p[:, 1])
+
+
+def grad_f(p):
+    return np.pi * np.stack([np.cos(np.pi * p[:, 0]) * np.sin(np.pi * p[:, 1]),
+                             np.sin(np.pi * p[:, 0]) * np.cos(np.pi * p[:, 1])], axis=1)
+
+
+def lapl_f(p):
+    return -2 * np.pi ** 2 * f(p)
+
+
+def test_error_norms_of_interpolants_converge():
+    errors = []
+    for n in [5, 9]:
+        u = CompositeSplineSpace(unit_square_uniform(n), lazy=True).interpolate(f, grad_f)
+        errors.append([error_norm(u, f), error_norm(u, gradient=grad_f), error_norm(u, laplacian=lapl_f)])
+
+    rates = np.log2(np.array(errors[0]) / np.array(errors[1]))
+    np.testing.assert_allclose(rates, [3, 2, 1], atol=0.5)
+
+
+def test_quadratics_have_no_error():
+    def q(p):
+        return 1 + p[:, 0] ** 2 - p[:, 0] * p[:, 1]
+
+    def grad_q(p):
+        return np.stack([2 * p[:, 0] - p[:, 1], -p[:, 0]], axis=1)
+
+    u = CompositeSplineSpace(unit_square_uniform(4), lazy=True).interpolate(q, grad_q)
+
+    errors = element_errors(u, q, grad_q, lambda p: np.full(len(p), 2.0))
+    assert errors.shape == (len(u.space.mesh.triangles), )
+    np.testing.assert_allclose(errors, 0, atol=1e-20)
+    np.testing.assert_allclose(biharmonic_indicators(u, lambda p: np.zeros(len(p))), 0, atol=1e-20)
+
+    # a load not matched by the bilaplacian of u is detected
+    assert np.all(biharmonic_indicators(u, lambda p: np.ones(len(p))) > 0)
+
+
+def test_doerfler_marking():
+    indicators = np.array([1.0, 4.0, 0.5, 3.0, 1.5])
+
+    np.testing.assert_array_equal(doerfler_marking(indicators, 0.5), [1, 3])
+    np.testing.assert_array_equal(doerfler_marking(indicators, 0.3), [1])
+    np.testing.assert_array_equal(doerfler_marking(indicators, 1.0), [0, 1, 2, 3, 4])
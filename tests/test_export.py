@@ -0,0 +1,89 @@
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+import pytest
+
+from PSFEM.composite_spline import CompositeSplineSpace
+from PSFEM.export import reference_sampling, write_vtu, write_xdmf
+from PSFEM.helper_functions import unit_square_uniform
+
+DTYPES = {'Float64': '<f8', 'Int64': '<i8', 'UInt8': 'u1'}
+
+
+def _function():
+    V = CompositeSplineSpace(unit_square_uniform(4), lazy=True)
+    return V.function(np.random.default_rng(0).random(V.dimension))
+
+
+def _read_vtu(path):
+    # the arrays of a VTK file with raw appended data, keyed by name
+    with open(path, 'rb') as f:
+        content = f.read()
+    start = content.index(b'<AppendedData encoding="raw">')
+    data = content[content.index(b'_', start) + 1:]
+    root = ElementTree.fromstring(content[:start] + b'</VTKFile>')
+
+    arrays = {}
+    for element in root.iter('DataArray'):
+        offset = int(element.get('offset'))
+        size = int(np.frombuffer(data[offset:offset + 8], '<u8')[0])
+        values = np.frombuffer(data[offset + 8:offset + 8 + size], DTYPES[element.get('type')])
+        arrays[element.get('Name')] = values.reshape(-1, int(element.get('NumberOfComponents')))
+    return root, arrays
+
+
+@pytest.mark.parametrize('subdivision', ['ps12', 3])
+def test_reference_sampling(subdivision):
+    points, cells, centroids = reference_sampling(subdivision)
+
+    np.testing.assert_allclose(np.sum(points, axis=1), 1)
+    assert len(cells) == (12 if subdivision == 'ps12' else 9)
+
+    # the cells cover the reference triangle, each with positive orientation
+    e1, e2 = points[cells[:, 1], 1:] - points[cells[:, 0], 1:], points[cells[:, 2], 1:] - points[cells[:, 0], 1:]
+    areas = (e1[:, 0] * e2[:, 1] - e1[:, 1] * e2[:, 0]) / 2
+    assert np.all(areas > 0)
+    np.testing.assert_allclose(np.sum(areas), 0.5)
+
+
+@pytest.mark.parametrize('subdivision', ['ps12', 2])
+def test_write_vtu(tmp_path, subdivision):
+    u = _function()
+    path = str(tmp_path / 'u.vtu')
+    write_vtu(path, u, subdivision=subdivision, chunk_size=5)
+
+    root, arrays = _read_vtu(path)
+    piece = root.find('UnstructuredGrid/Piece')
+    n_points, n_cells = int(piece.get('NumberOfPoints')), int(piece.get('NumberOfCells'))
+
+    points = arrays['Points'][:, :2]
+    cells = arrays['connectivity'].reshape(-1, 3)
+    triangles = arrays['triangle'].ravel()
+    assert points.shape == (n_points, 2) and cells.shape == (n_cells, 3)
+    np.testing.assert_array_equal(arrays['offsets'].ravel(), 3 * np.arange(1, n_cells + 1))
+    np.testing.assert_array_equal(arrays['types'].ravel(), 5)
+
+    np.testing.assert_allclose(arrays['u'].ravel(), u.evaluate(points), atol=1e-12)
+    if subdivision == 'ps12':
+        centroids = np.mean(points[cells], axis=1)
+        np.testing.assert_allclose(arrays['laplacian'].ravel(), u.laplacian(centroids, triangles), atol=1e-10)
+
+
+def test_write_xdmf(tmp_path):
+    u = _function()
+    path = str(tmp_path / 'u.xdmf')
+    write_xdmf(path, u, chunk_size=7)
+
+    grid = ElementTree.parse(path).getroot().find('Domain/Grid')
+    assert grid.find('Topology').get('NumberOfElements') == str(12 * len(u.space.mesh.triangles))
+    assert grid.find('Geometry/DataItem').text == 'u.points.bin'
+
+    points = np.fromfile(str(tmp_path / 'u.points.bin'), '<f8').reshape(-1, 2)
+    cells = np.fromfile(str(tmp_path / 'u.cells.bin'), '<i8').reshape(-1, 3)
+    values = np.fromfile(str(tmp_path / 'u.u.bin'), '<f8')
+    laplacians = np.fromfile(str(tmp_path / 'u.laplacian.bin'), '<f8')
+    triangles = np.fromfile(str(tmp_path / 'u.triangle.bin'), '<i8')
+
+    assert len(cells) == 12 * len(u.space.mesh.triangles)
+    np.testing.assert_allclose(values, u.evaluate(points), atol=1e-12)
+    np.testing.assert_allclose(laplacians, u.laplacian(np.mean(points[cells], axis=1), triangles), atol=1e-10)
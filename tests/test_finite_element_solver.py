@@ -0,0 +1,76 @@
+import numpy as np
+
+from PSFEM import forms
+from PSFEM.assembly import assemble_matrix, assemble_vector
+from PSFEM.composite_spline import CompositeSplineSpace
+from PSFEM.finite_element_solver import LinearProblem, solve
+from PSFEM.forms import inner, lapl
+from PSFEM.helper_functions import unit_square_uniform
+
+
+def test_linear_problem_batched_solve():
+    V = CompositeSplineSpace(unit_square_uniform(4))
+    u, v = forms.TrialFunction(), forms.TestFunction()
+    a = inner(lapl(u), lapl(v))
+
+    def f(p):
+        return np.cos(p[..., 0]) * p[..., 1]
+
+    problem = LinearProblem(assemble_matrix(a, V), V)
+    b = assemble_vector(f * v, V)
+    B = np.stack([b, 2 * b, np.ones(V.dimension)], axis=1)
+
+    C = problem.solve_coefficients(B)
+    expected = solve(a, f * v, V).coefficients
+
+    np.testing.assert_array_almost_equal(C[:, 0], expected)
+    np.testing.assert_array_almost_equal(C[:, 1], 2 * expected)
+    np.testing.assert_array_almost_equal(problem.solve(f * v).coefficients, expected)
+    np.testing.assert_array_equal(C[V.boundary_dofs], 0)
+    assert problem.factorization is problem.factorization
+
+
+def test_non_homogeneous_dirichlet_reproduces_quadratic():
+    V = CompositeSplineSpace(unit_square_uniform(4))
+    u, v = forms.TrialFunction(), forms.TestFunction()
+
+    def p(x):
+        return 1 + x[:, 0] - 2 * x[:, 1] + x[:, 0] ** 2 + 3 * x[:, 0] * x[:, 1]
+
+    def grad_p(x):
+        return np.stack([1 + 2 * x[:, 0] + 3 * x[:, 1], -2 + 3 * x[:, 0]], axis=1)
+
+    # the Hermite interpolant reproduces quadratics, which are also biharmonic
+    points = np.random.default_rng(0).random((20, 2))
+    np.testing.assert_array_almost_equal(V.interpolate(p, grad_p).evaluate(points), p(points))
+
+    boundary_values = V.hermite_dofs(p, grad_p)[V.boundary_dofs]
+    computed = solve(inner(lapl(u), lapl(v)), 0 * v, V, boundary_values=boundary_values)
+    np.testing.assert_array_almost_equal(computed.evaluate(points), p(points))
+
+    problem = LinearProblem(inner(lapl(u), lapl(v)), V)
+    B = np.zeros((V.dimension, 2))
+    C = problem.solve_coefficients(B, np.stack([boundary_values, 2 * boundary_values], axis=1))
+    np.testing.assert_array_almost_equal(C[:, 1], 2 * computed.coefficients)
+
+
+def test_matrix_free_linear_problem():
+    V = CompositeSplineSpace(unit_square_uniform(4), lazy=True)
+    u, v = forms.TrialFunction(), forms.TestFunction()
+    a, L = inner(lapl(u), lapl(v)), (lambda x: np.cos(x[..., 0])) * v
+
+    def p(x):
+        return 1 + x[:, 0] ** 2 + 3 * x[:, 0] * x[:, 1]
+
+    def grad_p(x):
+        return np.stack([2 * x[:, 0] + 3 * x[:, 1], 3 * x[:, 0]], axis=1)
+
+    boundary_values = V.hermite_dofs(p, grad_p)[V.boundary_dofs]
+    b = assemble_vector(L, V, vectorized=True)
+    expected = LinearProblem(a, V, vectorized=True).solve_coefficients(b, boundary_values)
+
+    problem = LinearProblem(a, V, matrix_free=True)
+    problem.solver.tol = 1e-12
+    computed = problem.solve_coefficients(b, boundary_values)
+
+    np.testing.assert_allclose(computed, expected, atol=1e-8 * np.abs(expected).max())
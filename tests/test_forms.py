@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from PSFEM import forms
+from PSFEM.assembly import assemble_element_systems, assemble_matrix, assemble_vector, element_systems
+from PSFEM.composite_spline import CompositeSplineSpace
+from PSFEM.forms import grad, inner, lapl
+from PSFEM.helper_functions import unit_square_uniform
+
+
+def f(p):
+    return np.sin(p[..., 0]) + p[..., 1]
+
+
+def test_forms_match_closures():
+    V = CompositeSplineSpace(unit_square_uniform(3))
+    u, v = forms.TrialFunction(), forms.TestFunction()
+
+    a = inner(lapl(u), lapl(v)) + f * inner(grad(u), grad(v)) - 2 * u * v
+    L = f * v
+
+    def a_closure(u, v):
+        return lambda p: u.lapl(p) * v.lapl(p) + f(p) * np.sum(u.grad(p) * v.grad(p), axis=-1) - 2 * u(p) * v(p)
+
+    def L_closure(v):
+        return lambda p: f(p) * v(p)
+
+    triangles = np.arange(len(V.mesh.triangles))
+    expected_A, expected_F = element_systems(a_closure, L_closure, V, triangles)
+
+    computed_A, computed_F = element_systems(a, L, V, triangles)
+    np.testing.assert_array_almost_equal(computed_A, expected_A)
+    np.testing.assert_array_almost_equal(computed_F, expected_F)
+
+    # forms are also callable like the closures
+    computed_A, computed_F = element_systems(lambda u, v: a(u, v), lambda v: L(v), V, triangles)
+    np.testing.assert_array_almost_equal(computed_A, expected_A)
+    np.testing.assert_array_almost_equal(computed_F, expected_F)
+
+
+def test_constant_terms_cached_on_space():
+    V = CompositeSplineSpace(unit_square_uniform(3))
+    u, v = forms.TrialFunction(), forms.TestFunction()
+
+    A, F = assemble_element_systems(3 * inner(lapl(u), lapl(v)), v, V)
+    assert len(V._element_cache) == 2
+
+    A_cached, F_cached = assemble_element_systems(inner(lapl(u), lapl(v)), 2 * v, V)
+    assert len(V._element_cache) == 2
+    np.testing.assert_array_almost_equal(A, 3 * A_cached)
+    np.testing.assert_array_almost_equal(2 * F, F_cached)
+
+    V.clear_caches()
+    assert len(V._element_cache) == 0
+    A_cleared, _ = assemble_element_systems(3 * inner(lapl(u), lapl(v)), v, V)
+    np.testing.assert_array_almost_equal(A, A_cleared)
+
+
+@pytest.mark.parametrize('assemble, form, message', [
+    (assemble_matrix, lambda u, v: grad(u) * v, 'grad\\(u\\)\\*v is vector valued'),
+    (assemble_vector, lambda u, v: u * v, 'u\\*v does not fit'),
+    (assemble_matrix, lambda u, v: v, 'Term v does not fit'),
+])
+def test_forms_of_wrong_rank_rejected(assemble, form, message):
+    V = CompositeSplineSpace(unit_square_uniform(3))
+    u, v = forms.TrialFunction(), forms.TestFunction()
+
+    with pytest.raises(ValueError, match=message):
+        assemble(form(u, v), V)
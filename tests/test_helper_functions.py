@@ -1,7 +1,9 @@
 import pytest
 import numpy as np
 
-from PSFEM.helper_functions import local_to_global
+from PSFEM.helper_functions import dof_numbering, graded_unit_square, l_shape_uniform, local_to_global, \
+    rectangle_uniform
+from PSFEM.mesh import Mesh, unique_edges
 
 
 @pytest.mark.degrees_of_freedom
@@ -25,3 +27,43 @@ def test_local_to_global_numbering():
     }
 
     assert computed_dofs == expected_dofs
+
+
+def test_blocked_dof_numbering():
+    triangles = np.array([
+        [0, 1, 2],
+        [1, 3, 2]
+    ])
+    edge_keys, triangle_edges = unique_edges(triangles, 4)
+
+    computed_dofs, dof_to_vertex, dof_to_edge = dof_numbering(triangles, triangle_edges, 4, len(edge_keys))
+
+    # edges in lexicographic order: (0, 1), (0, 2), (1, 2), (1, 3), (2, 3)
+    expected_dofs = np.array([
+        [0, 1, 2, 12, 3, 4, 5, 14, 6, 7, 8, 13],
+        [3, 4, 5, 15, 9, 10, 11, 16, 6, 7, 8, 14]
+    ])
+
+    np.testing.assert_array_equal(computed_dofs, expected_dofs)
+    np.testing.assert_array_equal(dof_to_vertex, [0, 0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3, -1, -1, -1, -1, -1])
+    np.testing.assert_array_equal(dof_to_edge, [-1] * 12 + [0, 1, 2, 3, 4])
+
+
+@pytest.mark.parametrize('mesh', [rectangle_uniform(3, 5, -1, 2, 0, 1), l_shape_uniform(2), graded_unit_square(4),
+                                  graded_unit_square(4, 3, toward='boundary')])
+def test_generated_topology_matches_mesh(mesh):
+    expected = Mesh(mesh.vertices, mesh.triangles)
+
+    assert mesh.triangles.dtype == np.int32
+    np.testing.assert_array_equal(mesh.edge_vertices, expected.edge_vertices)
+    np.testing.assert_array_equal(mesh.triangle_edges, expected.triangle_edges)
+    np.testing.assert_array_equal(mesh.triangle_neighbours, expected.triangle_neighbours)
+    assert mesh.bnd_vertices == expected.bnd_vertices
+
+
+def test_l_shape_uniform():
+    mesh = l_shape_uniform(2)
+
+    assert len(mesh.triangles) == 24
+    assert len(mesh.vertices) == 21
+    assert not np.any((mesh.vertices[mesh.triangles].mean(axis=1) > 0).all(axis=1))
@@ -0,0 +1,30 @@
+import numpy as np
+
+from PSFEM import forms
+from PSFEM.composite_spline import CompositeSplineSpace
+from PSFEM.finite_element_solver import solve
+from PSFEM.forms import inner, lapl
+from PSFEM.helper_functions import unit_square_uniform
+from PSFEM.instrumentation import Profiler, phase
+
+
+def test_profiler_records_phases():
+    finished = []
+
+    with Profiler(memory=True, callback=lambda name, seconds: finished.append(name)) as profiler:
+        V = CompositeSplineSpace(unit_square_uniform(3))
+        u, v = forms.TrialFunction(), forms.TestFunction()
+        solve(inner(lapl(u), lapl(v)), (lambda p: np.ones_like(p[..., 0])) * v, V)
+
+    for name in ['dof_numbering', 'basis_construction', 'element_integration', 'scatter', 'boundary_reduction',
+                 'factorization', 'back_substitution']:
+        assert profiler.stats[name].calls >= 1
+        assert profiler.stats[name].peak_memory is not None
+
+    assert profiler.stats['scatter'].calls == 2
+    assert finished.count('scatter') == 2
+
+    # phases outside of a profiler are not recorded
+    with phase('dof_numbering'):
+        pass
+    assert profiler.stats['dof_numbering'].calls == 1
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from PSFEM import forms
+from PSFEM.assembly import assemble_matrix, assemble_vector
+from PSFEM.composite_spline import CompositeSplineSpace
+from PSFEM.finite_element_solver import LinearProblem
+from PSFEM.forms import inner, lapl
+from PSFEM.helper_functions import unit_square_uniform
+from PSFEM.linear_solvers import ConjugateGradientSolver
+
+
+@pytest.mark.parametrize('preconditioner', ['jacobi', 'ichol'])
+def test_conjugate_gradients_match_direct_solver(preconditioner):
+    V = CompositeSplineSpace(unit_square_uniform(5))
+    u, v = forms.TrialFunction(), forms.TestFunction()
+
+    A = assemble_matrix(inner(lapl(u), lapl(v)), V)
+    b = assemble_vector((lambda p: np.exp(p[..., 0])) * v, V)
+    B = np.stack([b, -b], axis=1)
+
+    expected = LinearProblem(A, V).solve_coefficients(B)
+
+    solver = ConjugateGradientSolver(preconditioner, tol=1e-12)
+    computed = LinearProblem(A, V, solver=solver).solve_coefficients(B)
+
+    np.testing.assert_allclose(computed, expected, atol=1e-8 * np.abs(expected).max())
+    assert len(solver.residual_history) == 2
+    assert solver.residual_history[0][-1] <= 1e-12 * solver.residual_history[0][0]
+
+
+def test_conjugate_gradients_initial_guess():
+    V = CompositeSplineSpace(unit_square_uniform(5), lazy=True)
+    u, v = forms.TrialFunction(), forms.TestFunction()
+    A = assemble_matrix(inner(lapl(u), lapl(v)), V, vectorized=True)
+    b = assemble_vector((lambda p: np.exp(p[..., 0])) * v, V)
+
+    expected = LinearProblem(A, V).solve_coefficients(b)
+
+    # starting from the solution, no iterations are needed
+    solver = ConjugateGradientSolver('jacobi', tol=1e-8)
+    computed = LinearProblem(A, V, solver=solver).solve_coefficients(b, initial_guess=expected)
+
+    assert len(solver.residual_history[0]) == 1
+    np.testing.assert_allclose(computed, expected)
@@ -1,6 +1,7 @@
 import numpy as np
 
-from PSFEM.mesh import Mesh
+from PSFEM.helper_functions import l_shape_uniform, unit_square_uniform
+from PSFEM.mesh import Mesh, space_filling_curve_keys
 
 
 def test_incident_triangles():
@@ -53,12 +54,12 @@ def test_adjacent_triangles():
     M = Mesh(vertices, triangles)
 
     expected_triangles = [2, 3]
-    computed_triangles = M.adjacent_triangles(7)
+    computed_triangles = M.adjacent_triangles(6)
 
     np.testing.assert_array_almost_equal(computed_triangles, expected_triangles)
 
     expected_triangles = [1, 2]
-    computed_triangles = M.adjacent_triangles(6)
+    computed_triangles = M.adjacent_triangles(7)
 
     np.testing.assert_array_almost_equal(computed_triangles, expected_triangles)
 
@@ -91,7 +92,7 @@ def test_boundary_data():
 
     np.testing.assert_array_almost_equal(computed_bnd_vertices, expected_bnd_vertices)
 
-    expected_bnd_edges = [0, 1, 2, 4]
+    expected_bnd_edges = [0, 1, 3, 5]
     computed_bnd_edges = M.bnd_edges
 
     np.testing.assert_array_almost_equal(computed_bnd_edges, expected_bnd_edges)
@@ -120,12 +121,40 @@ def test_interior_data():
 
     np.testing.assert_array_almost_equal(computed_int_vertices, expected_int_vertices)
 
-    expected_int_edges = [3, 5, 6, 7]
+    expected_int_edges = [2, 4, 6, 7]
     computed_int_edges = M.int_edges
 
     np.testing.assert_array_almost_equal(computed_int_edges, expected_int_edges)
 
 
+def test_triangle_edges():
+    vertices = np.array([
+        [0, 0],
+        [1, 0],
+        [0, 1],
+        [1, 1],
+        [0.5, 0.5]
+    ])
+
+    triangles = np.array([
+        [0, 1, 4],
+        [1, 3, 4],
+        [3, 2, 4],
+        [2, 0, 4]
+    ])
+
+    M = Mesh(vertices, triangles)
+
+    expected_edge_vertices = [[0, 1], [0, 2], [0, 4], [1, 3], [1, 4], [2, 3], [2, 4], [3, 4]]
+    np.testing.assert_array_equal(M.edge_vertices, expected_edge_vertices)
+
+    for k, triangle in enumerate(triangles):
+        for i in range(3):
+            edge = (triangle[i], triangle[(i + 1) % 3])
+            assert M.triangle_edges[k, i] == M.get_edge_id(edge)
+            assert k in M.adjacent_triangles(M.triangle_edges[k, i])
+
+
 def test_mesh_lengths():
     vertices = np.array([
         [0, 0],
@@ -148,3 +177,126 @@ def test_mesh_lengths():
     np.testing.assert_almost_equal(M.h_min, expected_h_min)
     np.testing.assert_almost_equal(M.h_max, expected_h_max)
     np.testing.assert_almost_equal(M.h_avg, expected_h_avg)
+
+
+def test_find_triangles():
+    vertices = np.array([
+        [0, 0],
+        [1, 0],
+        [0, 1],
+        [1, 1],
+        [0.5, 0.5]
+    ])
+
+    triangles = np.array([
+        [0, 1, 4],
+        [1, 3, 4],
+        [3, 2, 4],
+        [2, 0, 4]
+    ])
+
+    M = Mesh(vertices, triangles)
+
+    points = np.array([
+        [0.5, 0.1],
+        [0.9, 0.5],
+        [0.5, 0.9],
+        [0.1, 0.5],
+        [0.5, 0.5],
+        [1.5, 0.5],
+        [-0.1, -0.1]
+    ])
+
+    expected_triangles = [0, 1, 2, 3, 0, -1, -1]
+    computed_triangles = M.find_triangles(points)
+
+    np.testing.assert_array_equal(computed_triangles, expected_triangles)
+
+    for point, expected_triangle in zip(points, expected_triangles):
+        assert M.find_triangle(point) == expected_triangle
+
+    # walking from a neighbouring triangle gives the same triangle for interior points
+    for point, expected_triangle in zip(points[:4], expected_triangles[:4]):
+        assert M.find_triangle(point, previous=(expected_triangle + 2) % 4) == expected_triangle
+
+
+def _areas(mesh):
+    e1, e2 = np.moveaxis(mesh.vertices[mesh.triangles[:, 1:]] - mesh.vertices[mesh.triangles[:, :1]], 1, 0)
+    return (e1[:, 0] * e2[:, 1] - e1[:, 1] * e2[:, 0]) / 2
+
+
+def _boundary_length(mesh):
+    edges = mesh.vertices[mesh.edge_vertices[mesh.is_boundary_edge]]
+    return np.sum(np.linalg.norm(edges[:, 1] - edges[:, 0], axis=1))
+
+
+def test_refine_uniformly():
+    coarse = l_shape_uniform(3)
+    fine = coarse.refine()
+
+    # the incrementally computed topology matches the one computed from scratch
+    expected = Mesh(fine.vertices, fine.triangles)
+    np.testing.assert_array_equal(fine.edge_vertices, expected.edge_vertices)
+    np.testing.assert_array_equal(fine.triangle_edges, expected.triangle_edges)
+    np.testing.assert_array_equal(fine.is_boundary_vertex, expected.is_boundary_vertex)
+
+    assert len(fine.triangles) == 4 * len(coarse.triangles)
+    assert fine.parent is coarse
+    np.testing.assert_allclose(fine.h_max, coarse.h_max / 2)
+    np.testing.assert_allclose(np.bincount(fine.parent_triangles, weights=_areas(fine)), _areas(coarse))
+
+
+def test_refine_marked_triangles():
+    coarse = unit_square_uniform(4)
+    mesh = coarse
+    for _ in range(4):
+        mesh = mesh.refine([0, len(mesh.triangles) - 1])
+
+    # the edge table carried through the bisections matches the one computed from scratch
+    expected = Mesh(mesh.vertices, mesh.triangles)
+    np.testing.assert_array_equal(mesh.edge_vertices, expected.edge_vertices)
+    np.testing.assert_array_equal(mesh.triangle_edges, expected.triangle_edges)
+
+    # orientation and area are preserved, and there are no hanging vertices, which would add boundary edges
+    areas = _areas(mesh)
+    assert np.all(np.sign(areas) == np.sign(_areas(coarse)[0]))
+    np.testing.assert_allclose(np.sum(np.abs(areas)), 1)
+    np.testing.assert_allclose(_boundary_length(mesh), 4)
+    assert mesh.newest_vertex_first
+
+    refined = mesh.refine(np.arange(len(mesh.triangles)) < 3)
+    assert refined.parent is mesh
+    np.testing.assert_allclose(np.bincount(refined.parent_triangles, weights=_areas(refined)), _areas(mesh))
+    assert np.all(np.bincount(refined.parent_triangles)[:3] >= 2)
+
+
+def test_space_filling_curve_keys():
+    grid = np.stack(np.meshgrid(np.arange(4), np.arange(4), indexing='ij'), axis=-1).reshape(-1, 2).astype(float)
+
+    for curve in ['hilbert', 'morton']:
+        keys = space_filling_curve_keys(grid, curve, bits=2)
+        np.testing.assert_array_equal(np.sort(keys), np.arange(16))
+
+    # consecutive points along the Hilbert curve are neighbours
+    ordered = grid[np.argsort(space_filling_curve_keys(grid, 'hilbert', bits=2))]
+    np.testing.assert_array_equal(np.sum(np.abs(np.diff(ordered, axis=0)), axis=1), 1)
+
+
+def test_reorder():
+    mesh = unit_square_uniform(6)
+    rng = np.random.default_rng(0)
+    vertex_order, triangle_order = rng.permutation(len(mesh.vertices)), rng.permutation(len(mesh.triangles))
+    shuffled = Mesh(mesh.vertices[vertex_order], np.argsort(vertex_order)[mesh.triangles[triangle_order]])
+
+    reordered = shuffled.reorder()
+
+    np.testing.assert_array_equal(reordered.vertices, shuffled.vertices[reordered.vertex_permutation])
+    np.testing.assert_array_equal(reordered.vertices[reordered.triangles],
+                                  shuffled.vertices[shuffled.triangles[reordered.triangle_permutation]])
+    assert len(reordered.edges) == len(shuffled.edges)
+
+    # nearby triangles share vertices with nearby indices
+    def spread(m):
+        return np.mean(np.ptp(m.triangles, axis=1))
+
+    assert spread(reordered) < spread(shuffled) / 2
@@ -1,7 +1,7 @@
 import pytest
 import numpy as np
 
-from PSFEM.quadrature import midpoint_rule, midpoint_rule_ps12
+from PSFEM.quadrature import midpoint_ps12, midpoint_rule, midpoint_rule_ps12, seven_point, seven_point_ps12
 
 
 @pytest.mark.quadrature
@@ -38,4 +38,39 @@ def test_midpoint_ps12_quadratic_exact():
     expected_integral = 5/24 + 1/2
     computed_integral = midpoint_rule_ps12(integrand, vertices)
 
-    np.testing.assert_approx_equal(computed_integral, expected_integral)
\ No newline at end of file
+    np.testing.assert_approx_equal(computed_integral, expected_integral)
+
+
+@pytest.mark.quadrature
+def test_seven_point_ps12_batch_exact():
+
+    def integrand(p):
+        x, y = p[:, 0], p[:, 1]
+        return x**5 + x**2 * y**3 + 1
+
+    vertices = np.array([
+        [[0, 0], [1, 0], [0, 1]],
+        [[1, 0], [1, 1], [0, 1]]
+    ])
+
+    expected_integral = [1/42 + 1/420 + 1/2, 1/7 + 17/210 + 1/2]
+    computed_integral = seven_point_ps12.integrate(integrand, vertices)
+
+    np.testing.assert_array_almost_equal(computed_integral, expected_integral)
+    np.testing.assert_almost_equal(seven_point(integrand, vertices[0]), expected_integral[0])
+
+
+@pytest.mark.quadrature
+def test_midpoint_ps12_matches_midpoint_rule_ps12():
+
+    def integrand(p):
+        return p[..., 0]**2 + 3 * p[..., 0] * p[..., 1] + 2
+
+    vertices = np.array([
+        [0.1, 0.2],
+        [1.3, 0.4],
+        [0.5, 1.1]
+    ])
+
+    np.testing.assert_almost_equal(midpoint_ps12.integrate(integrand, vertices),
+                                   midpoint_rule_ps12(integrand, vertices))
@@ -0,0 +1,56 @@
+import numpy as np
+
+from PSFEM.composite_spline import CompositeSplineSpace
+from PSFEM.helper_functions import l_shape_uniform
+from PSFEM.mesh import Mesh
+from PSFEM.storage import load_mesh, load_space, save_mesh, save_space
+
+
+def test_save_and_load_mesh(tmp_path):
+    mesh = l_shape_uniform(3).refine([0, 1])
+    save_mesh(str(tmp_path), mesh)
+
+    loaded = load_mesh(str(tmp_path))
+
+    assert isinstance(loaded.vertices, np.memmap)
+    np.testing.assert_array_equal(loaded.vertices, mesh.vertices)
+    np.testing.assert_array_equal(loaded.triangles, mesh.triangles)
+    for name in Mesh.TOPOLOGY:
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(mesh, name))
+    assert loaded.edges == mesh.edges
+    assert loaded.bnd_vertices == mesh.bnd_vertices
+    assert loaded.edge_indices[tuple(mesh.edge_vertices[5])] == 5
+    assert loaded.h_max == mesh.h_max
+    assert loaded.newest_vertex_first
+
+
+def test_save_and_load_space(tmp_path):
+    V = CompositeSplineSpace(l_shape_uniform(3), lazy=True)
+    save_space(str(tmp_path), V)
+
+    for mmap_mode in ['r', None]:
+        loaded = load_space(str(tmp_path), mmap_mode=mmap_mode)
+
+        assert loaded.dimension == V.dimension
+        for name in CompositeSplineSpace.DOFS:
+            np.testing.assert_array_equal(getattr(loaded, name), getattr(V, name))
+
+        c = np.random.default_rng(0).random(V.dimension)
+        points = np.random.default_rng(1).uniform(-1, 0, (20, 2))
+        np.testing.assert_allclose(loaded.function(c).evaluate(points), V.function(c).evaluate(points))
+
+    # eager spaces construct their basis from the loaded dof maps
+    eager = load_space(str(tmp_path), lazy=False)
+    assert eager.local_to_global_map == dict(enumerate(V.local_to_global_array.tolist()))
+
+
+def test_save_and_load_reordered_space(tmp_path):
+    V = CompositeSplineSpace(l_shape_uniform(3).reorder(), lazy=True, reordering='rcm')
+    save_space(str(tmp_path), V)
+
+    loaded = load_space(str(tmp_path))
+
+    assert loaded.reordering == 'rcm'
+    np.testing.assert_array_equal(loaded.dof_permutation, V.dof_permutation)
+    np.testing.assert_array_equal(loaded.mesh.vertex_permutation, V.mesh.vertex_permutation)
+    np.testing.assert_array_equal(loaded.mesh.triangle_permutation, V.mesh.triangle_permutation)
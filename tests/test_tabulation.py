@@ -0,0 +1,71 @@
+import numpy as np
+from SSplines import SplineSpace
+
+from PSFEM.helper_functions import unit_square_uniform
+from PSFEM.quadrature import midpoint_rule_ps12_data
+from PSFEM.tabulation import ReferenceTabulation, congruence_classes, hermite_coefficients, tabulate_basis
+
+
+def test_hermite_coefficients():
+    triangles = np.array([
+        [[0, 0], [1, 0], [0, 1]],
+        [[0.2, 0.1], [1.3, 0.4], [0.5, 1.7]]
+    ])
+
+    computed_coefficients = hermite_coefficients(triangles)
+
+    for triangle, computed in zip(triangles, computed_coefficients):
+        expected = np.array([b.coefficients for b in SplineSpace(triangle, 2).hermite_basis()]).T
+        np.testing.assert_array_almost_equal(computed, expected)
+
+
+def test_reference_tabulation_cache():
+    M = unit_square_uniform(4)
+    vertices = M.vertices[M.triangles]
+    signs = np.ones((len(vertices), 12))
+    b, k, _ = midpoint_rule_ps12_data()
+
+    tabulation = ReferenceTabulation(b, k)
+    computed_basis, computed_points = tabulation.tabulate(vertices, signs)
+    expected_basis, expected_points = tabulate_basis(vertices, signs, b, k)
+
+    # the uniform mesh has two triangle shapes
+    assert len(tabulation._cache) == 2
+
+    np.testing.assert_array_almost_equal(computed_points, expected_points)
+    np.testing.assert_array_almost_equal(computed_basis.values, expected_basis.values)
+    np.testing.assert_array_almost_equal(computed_basis.gradients, expected_basis.gradients)
+    np.testing.assert_array_almost_equal(computed_basis.laplacians, expected_basis.laplacians)
+
+
+def test_reference_tabulation_cache_bypassed_without_repeated_shapes():
+    M = unit_square_uniform(4)
+    vertices = M.vertices + np.random.default_rng(0).uniform(-0.05, 0.05, M.vertices.shape)
+    vertices = vertices[M.triangles]
+    signs = np.ones((len(vertices), 12))
+    b, k, _ = midpoint_rule_ps12_data()
+
+    tabulation = ReferenceTabulation(b, k)
+    computed_basis, _ = tabulation.tabulate(vertices, signs)
+    expected_basis, _ = tabulate_basis(vertices, signs, b, k)
+
+    assert len(tabulation._cache) == 0
+    np.testing.assert_array_almost_equal(computed_basis.values, expected_basis.values)
+    np.testing.assert_array_almost_equal(computed_basis.laplacians, expected_basis.laplacians)
+
+
+def test_congruence_classes():
+    triangles = np.array([
+        [[0, 0], [1, 0], [0, 1]],
+        [[2, 3], [3, 3], [2, 4]],
+        [[0, 0], [2, 0], [0, 2]],
+        [[0, 0], [0, 1], [1, 0]],
+        [[5, 5], [5 + 2, 5], [5, 5 + 2 + 1e-15]],
+    ], dtype=float)
+
+    representatives, classes = congruence_classes(triangles)
+
+    assert len(representatives) == 3
+    assert classes[0] == classes[1] and classes[2] == classes[4]
+    assert len({classes[0], classes[2], classes[3]}) == 3
+    np.testing.assert_allclose(representatives[classes] + triangles[:, :1], triangles)